@@ -1,26 +1,25 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Count, Min, Avg
+from django.db.models import Avg, F, Func, Min, RowRange, Window
 from .models import Circuit
 from .serializers import CircuitSerializer
-from ..races.models import Race, LapTime, RaceResult
+from ..races.models import Race, DriverCircuitMonthStats
+from ..races.stats import summarize_stats
+from ..races.timecodec import format_duration
+from ..response_cache import STATS_CACHE_CONTROL, cached_response
 
 
-def format_duration(duration):
-    """Format timedelta to M:SS.mmm"""
-    if not duration:
-        return None
-    total_seconds = duration.total_seconds()
-    minutes = int(total_seconds // 60)
-    seconds = int(total_seconds % 60)
-    milliseconds = int((total_seconds % 1) * 1000)
-    return f"{minutes}:{seconds:02d}.{milliseconds:03d}"
+class RunningMin(Func):
+    """MIN() usable as a window over an aggregate, e.g. MIN(MIN(x)) OVER (...)."""
+    function = 'MIN'
+    window_compatible = True
 
 
 class ListCircuitsView(APIView):
     """List all circuits."""
 
+    @cached_response
     def get(self, request):
         circuits = Circuit.objects.all().order_by('name')
         serializer = CircuitSerializer(circuits, many=True)
@@ -30,6 +29,7 @@ class ListCircuitsView(APIView):
 class CircuitDetailView(APIView):
     """Get circuit stats."""
 
+    @cached_response(cache_control=STATS_CACHE_CONTROL)
     def get(self, request, circuit_id):
         try:
             circuit = Circuit.objects.get(id=circuit_id)
@@ -42,22 +42,22 @@ class CircuitDetailView(APIView):
         # Total races at this circuit
         total_races = Race.objects.filter(circuit=circuit).count()
 
+        circuit_stats = DriverCircuitMonthStats.objects.filter(circuit=circuit)
+
         # Total laps at this circuit
-        race_ids = Race.objects.filter(circuit=circuit).values_list('id', flat=True)
-        total_laps = LapTime.objects.filter(
-            race_result__race_id__in=race_ids
-        ).count()
+        total_laps = summarize_stats(circuit_stats)['total_laps']
 
-        # Fastest lap ever at this circuit with driver name
-        fastest_lap_obj = LapTime.objects.filter(
-            race_result__race__circuit=circuit
-        ).select_related('race_result__driver').order_by('lap_time').first()
+        # Fastest lap ever at this circuit with driver name, read from the
+        # (circuit, fastest_lap, driver) index
+        fastest_lap_row = circuit_stats.filter(
+            fastest_lap__isnull=False
+        ).order_by('fastest_lap').values('fastest_lap', 'driver__name').first()
 
         fastest_lap_time = None
         fastest_lap_driver = None
-        if fastest_lap_obj:
-            fastest_lap_time = format_duration(fastest_lap_obj.lap_time)
-            fastest_lap_driver = fastest_lap_obj.race_result.driver.name
+        if fastest_lap_row:
+            fastest_lap_time = format_duration(fastest_lap_row['fastest_lap'])
+            fastest_lap_driver = fastest_lap_row['driver__name']
 
         data = {
             "id": circuit.id,
@@ -76,8 +76,9 @@ class CircuitDetailView(APIView):
 
 
 class CircuitEvolutionView(APIView):
-    """Get circuit evolution: fastest lap and average lap over time."""
+    """Get circuit evolution: fastest lap, average lap and lap record over time."""
 
+    @cached_response(cache_control=STATS_CACHE_CONTROL)
     def get(self, request, circuit_id):
         try:
             circuit = Circuit.objects.get(id=circuit_id)
@@ -87,42 +88,63 @@ class CircuitEvolutionView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Get all races at this circuit ordered by date
-        races = Race.objects.filter(circuit=circuit).order_by('date')
+        # One grouped query: per-race fastest lap and average of averages,
+        # plus the running circuit record via a window over the race order
+        races = (
+            Race.objects
+            .filter(circuit=circuit)
+            .values('id', 'date')
+            .annotate(
+                fastest_lap=Min('results__fastest_lap'),
+                average_lap=Avg('results__average_lap'),
+            )
+            .annotate(
+                lap_record=Window(
+                    RunningMin(Min('results__fastest_lap')),
+                    order_by=[F('date').asc(), F('id').asc()],
+                    frame=RowRange(start=None, end=0)
+                )
+            )
+            .order_by('date', 'id')
+        )
 
         fastest_lap_evolution = []
         average_lap_evolution = []
+        lap_record_evolution = []
+        previous_record = None
 
         for race in races:
-            # Get fastest lap in this race
-            fastest_lap_in_race = LapTime.objects.filter(
-                race_result__race=race
-            ).order_by('lap_time').first()
+            date = race['date'].isoformat()
 
-            if fastest_lap_in_race:
+            if race['fastest_lap']:
                 fastest_lap_evolution.append({
-                    "date": race.date.isoformat(),
-                    "race_id": race.id,
-                    "lap_time": format_duration(fastest_lap_in_race.lap_time)
+                    "date": date,
+                    "race_id": race['id'],
+                    "lap_time": format_duration(race['fastest_lap'])
                 })
 
-            # Get average lap time across all drivers in this race
-            race_results = RaceResult.objects.filter(race=race)
-            if race_results.exists():
-                # Calculate average of all average_lap values
-                avg_of_averages = race_results.aggregate(Avg('average_lap'))['average_lap__avg']
-                if avg_of_averages:
-                    average_lap_evolution.append({
-                        "date": race.date.isoformat(),
-                        "race_id": race.id,
-                        "lap_time": format_duration(avg_of_averages)
-                    })
+            if race['average_lap']:
+                average_lap_evolution.append({
+                    "date": date,
+                    "race_id": race['id'],
+                    "lap_time": format_duration(race['average_lap'])
+                })
+
+            if race['lap_record']:
+                lap_record_evolution.append({
+                    "date": date,
+                    "race_id": race['id'],
+                    "lap_time": format_duration(race['lap_record']),
+                    "new_record": race['lap_record'] != previous_record
+                })
+                previous_record = race['lap_record']
 
         data = {
             "circuit_id": circuit.id,
             "circuit_name": circuit.name,
             "fastest_lap_evolution": fastest_lap_evolution,
-            "average_lap_evolution": average_lap_evolution
+            "average_lap_evolution": average_lap_evolution,
+            "lap_record_evolution": lap_record_evolution
         }
 
         return Response(data, status=status.HTTP_200_OK)
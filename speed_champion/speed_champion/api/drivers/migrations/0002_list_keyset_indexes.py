@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drivers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='driver',
+            index=models.Index(fields=['name', 'id'], name='driver_name_id_idx'),
+        ),
+    ]
@@ -4,5 +4,11 @@ from django.db import models
 class Driver(models.Model):
     name = models.CharField(max_length=100)
 
+    class Meta:
+        indexes = [
+            # Driver list by name and its (name, id) keyset pages
+            models.Index(fields=['name', 'id'], name='driver_name_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
\ No newline at end of file
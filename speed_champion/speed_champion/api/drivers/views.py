@@ -1,36 +1,37 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Min, Avg, Count
-from datetime import datetime, timedelta
 from .models import Driver
 from .serializers import DriverSerializer
-from ..races.models import RaceResult, LapTime
-
-
-def format_duration(duration):
-    """Format timedelta to M:SS.mmm"""
-    if not duration:
-        return None
-    total_seconds = duration.total_seconds()
-    minutes = int(total_seconds // 60)
-    seconds = int(total_seconds % 60)
-    milliseconds = int((total_seconds % 1) * 1000)
-    return f"{minutes}:{seconds:02d}.{milliseconds:03d}"
+from ..races.models import RaceResult, DriverCircuitMonthStats
+from ..races.stats import summarize_stats, summarize_stats_by_driver
+from ..races.timecodec import format_duration
+from ..pagination import PaginationError, keyset_page
+from ..response_cache import STATS_CACHE_CONTROL, cached_response
 
 
 class ListDriversView(APIView):
-    """List all drivers."""
+    """List drivers by name, one keyset page at a time."""
 
+    @cached_response
     def get(self, request):
-        drivers = Driver.objects.all().order_by('name')
-        serializer = DriverSerializer(drivers, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        try:
+            page = keyset_page(
+                Driver.objects.all(),
+                request.query_params,
+                ordering=('name', 'id'),
+                serialize=lambda rows: DriverSerializer(rows, many=True).data
+            )
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(page, status=status.HTTP_200_OK)
 
 
 class DriverDetailView(APIView):
     """Get driver stats."""
 
+    @cached_response(cache_control=STATS_CACHE_CONTROL)
     def get(self, request, driver_id):
         try:
             driver = Driver.objects.get(id=driver_id)
@@ -40,17 +41,14 @@ class DriverDetailView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Total races
-        total_races = RaceResult.objects.filter(driver=driver).count()
-
-        # Total laps
-        total_laps = LapTime.objects.filter(race_result__driver=driver).count()
+        # Total races and laps from the monthly rollup
+        totals = summarize_stats(DriverCircuitMonthStats.objects.filter(driver=driver))
 
         data = {
             "id": driver.id,
             "name": driver.name,
-            "total_races": total_races,
-            "total_laps": total_laps
+            "total_races": totals['total_races'],
+            "total_laps": totals['total_laps']
         }
 
         return Response(data, status=status.HTTP_200_OK)
@@ -59,6 +57,7 @@ class DriverDetailView(APIView):
 class DriverEvolutionView(APIView):
     """Get driver lap time evolution over time. Optional filter by circuit."""
 
+    @cached_response(cache_control=STATS_CACHE_CONTROL)
     def get(self, request, driver_id):
         try:
             driver = Driver.objects.get(id=driver_id)
@@ -70,22 +69,22 @@ class DriverEvolutionView(APIView):
 
         results = RaceResult.objects.filter(
             driver=driver
-        ).select_related('race').order_by('race__date')
+        ).order_by('race_date')
 
         # Optional circuit filter
         circuit_id = request.query_params.get('circuit')
         if circuit_id:
             try:
                 circuit_id_int = int(circuit_id)
-                results = results.filter(race__circuit_id=circuit_id_int)
+                results = results.filter(circuit_id=circuit_id_int)
             except ValueError:
                 pass
 
         evolution = []
         for result in results:
             evolution.append({
-                "date": result.race.date,
-                "circuit_id": result.race.circuit.id,
+                "date": result.race_date,
+                "circuit_id": result.circuit_id,
                 "fastest_lap": format_duration(result.fastest_lap),
                 "average_lap": format_duration(result.average_lap)
             })
@@ -100,6 +99,7 @@ class DriverEvolutionView(APIView):
 class CompareDriversView(APIView):
     """Compare up to 4 drivers. Optional filter by circuit."""
 
+    @cached_response(cache_control=STATS_CACHE_CONTROL)
     def get(self, request):
         ids_param = request.query_params.get('ids', '')
 
@@ -126,39 +126,35 @@ class CompareDriversView(APIView):
         # Optional circuit filter
         circuit_id = request.query_params.get('circuit')
 
-        drivers_data = []
+        stats = DriverCircuitMonthStats.objects.filter(driver_id__in=driver_ids)
 
-        for driver_id in driver_ids:
+        # Apply circuit filter if provided
+        if circuit_id:
             try:
-                driver = Driver.objects.get(id=driver_id)
-            except Driver.DoesNotExist:
-                continue
+                circuit_id_int = int(circuit_id)
+                stats = stats.filter(circuit_id=circuit_id_int)
+            except ValueError:
+                pass
 
-            results = RaceResult.objects.filter(driver=driver)
+        drivers = Driver.objects.in_bulk(driver_ids)
+        summary = summarize_stats_by_driver(stats)
 
-            # Apply circuit filter if provided
-            if circuit_id:
-                try:
-                    circuit_id_int = int(circuit_id)
-                    results = results.filter(race__circuit_id=circuit_id_int)
-                except ValueError:
-                    pass
+        drivers_data = []
 
-            total_races = results.count()
-            best_lap = results.aggregate(Min('fastest_lap'))['fastest_lap__min']
-            avg_lap = results.aggregate(Avg('average_lap'))['average_lap__avg']
+        for driver_id in driver_ids:
+            driver = drivers.get(driver_id)
+            if driver is None:
+                continue
 
-            # Get total laps for this driver (filtered by circuit if applicable)
-            race_result_ids = results.values_list('id', flat=True)
-            total_laps = LapTime.objects.filter(race_result_id__in=race_result_ids).count()
+            driver_stats = summary.get(driver_id, {})
 
             drivers_data.append({
                 "id": driver.id,
                 "name": driver.name,
-                "total_races": total_races,
-                "total_laps": total_laps,
-                "best_lap": format_duration(best_lap),
-                "average_lap": format_duration(avg_lap)
+                "total_races": driver_stats.get('total_races', 0),
+                "total_laps": driver_stats.get('total_laps', 0),
+                "best_lap": format_duration(driver_stats.get('fastest_lap')),
+                "average_lap": format_duration(driver_stats.get('average_lap'))
             })
 
         return Response({"drivers": drivers_data}, status=status.HTTP_200_OK)
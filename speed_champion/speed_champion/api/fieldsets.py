@@ -0,0 +1,75 @@
+"""
+Sparse fieldsets and optional includes for the read endpoints.
+
+`?fields=id,date,results.driver_name` limits a response to the listed fields;
+a dotted name selects a field of a nested list (listing one implies the list
+itself). `?include=summary` asks for parts that are left out by default
+because they cost extra queries. Views use the parsed options to skip the queries for
+the parts that are not returned, not only to trim the payload.
+"""
+from typing import Dict, Iterable, Optional, Set
+
+
+class FieldsetError(ValueError):
+    pass
+
+
+def _names(params, name) -> Optional[Set[str]]:
+    value = params.get(name)
+    if value is None:
+        return None
+    return {part.strip() for part in value.split(',') if part.strip()}
+
+
+def parse_fields(params, allowed: Iterable[str], nested: Dict[str, Iterable[str]] = None):
+    """
+    Parse `?fields=` against the serializer's `allowed` field names and, per
+    nested list, the names allowed in `nested[list]`.
+
+    Returns (fields, nested_fields): fields is None when every field is
+    wanted, and nested_fields maps each nested list to its selected names or
+    None for all of them. Raises FieldsetError on an unknown name.
+    """
+    nested = nested or {}
+    requested = _names(params, 'fields')
+    if requested is None:
+        return None, {parent: None for parent in nested}
+
+    fields, nested_fields, unknown = set(), {}, []
+    for name in sorted(requested):
+        parent, _, child = name.partition('.')
+        if not child and parent in allowed:
+            fields.add(parent)
+        elif child and parent in nested and child in nested[parent]:
+            fields.add(parent)
+            nested_fields.setdefault(parent, set()).add(child)
+        else:
+            unknown.append(name)
+    if unknown:
+        raise FieldsetError(f"Unknown fields: {', '.join(unknown)}")
+    if not fields:
+        raise FieldsetError("No fields requested")
+
+    return fields, {parent: nested_fields.get(parent) for parent in nested}
+
+
+def parse_include(params, allowed: Iterable[str]) -> Set[str]:
+    """Parse `?include=` into a set of names. Raises FieldsetError on an unknown name."""
+    include = _names(params, 'include') or set()
+    unknown = sorted(include - set(allowed))
+    if unknown:
+        raise FieldsetError(f"Unknown include: {', '.join(unknown)}")
+    return include
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin taking a `fields` argument: the names of the fields to
+    keep, or None for all of them.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
@@ -0,0 +1,122 @@
+"""
+Keyset (cursor) pagination for the list endpoints.
+
+A page is read with `WHERE (key) after (last key seen) ORDER BY key LIMIT n+1`
+on an index over the ordering key, e.g. (date, id) for races, so every page
+costs the same however deep it is, unlike OFFSET which walks all the rows
+before it. Cursors are opaque to clients: base64 of the direction and the key
+of the row at the page boundary. The total count is a separate query and only
+runs when asked for with `count=true`.
+
+Response body: {"results": [...], "next": cursor|null, "previous": cursor|null}
+plus "count" when requested. Pass a cursor back as `?cursor=` to move.
+"""
+import base64
+import binascii
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(direction, key) -> str:
+    payload = json.dumps([direction, list(key)], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, key_length) -> Tuple[str, List]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise PaginationError("Invalid cursor")
+    if direction not in (NEXT, PREVIOUS) or not isinstance(key, list) or len(key) != key_length:
+        raise PaginationError("Invalid cursor")
+    return direction, key
+
+
+def parse_limit(params) -> int:
+    limit = params.get('limit')
+    if limit is None:
+        return settings.PAGINATION_DEFAULT_LIMIT
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise PaginationError("Invalid limit")
+    if limit < 1:
+        raise PaginationError("Invalid limit")
+    return min(limit, settings.PAGINATION_MAX_LIMIT)
+
+
+def keyset_after(ordering: Sequence[str], key: Sequence) -> Q:
+    """Rows strictly after `key` in `ordering`: (a, b) > (x, y) as a > x OR (a = x AND b > y)."""
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, key):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f"{name}__{lookup}": value})
+        equal[name] = value
+
+    # The redundant a >= x bound lets the planner seek the index to the cursor
+    # instead of walking it from the start and filtering
+    first = ordering[0]
+    bound = 'lte' if first.startswith('-') else 'gte'
+    return Q(**{f"{first.lstrip('-')}__{bound}": key[0]}) & condition
+
+
+def _reverse(ordering: Sequence[str]) -> List[str]:
+    return [field[1:] if field.startswith('-') else f"-{field}" for field in ordering]
+
+
+def keyset_page(queryset, params, ordering: Sequence[str], serialize) -> Dict:
+    """
+    Return one page of `queryset` in `ordering` (which must end with a unique
+    field, e.g. ('-date', '-id')) as the response body described above.
+    `serialize` turns the page's objects into their list of dicts.
+    Raises PaginationError on an invalid limit or cursor.
+    """
+    limit = parse_limit(params)
+    cursor = params.get('cursor')
+    direction, key = decode_cursor(cursor, len(ordering)) if cursor else (NEXT, None)
+
+    # A previous page is the next page of the reversed ordering, read backwards
+    page_ordering = list(ordering) if direction == NEXT else _reverse(ordering)
+    page = queryset.order_by(*page_ordering)
+    try:
+        if key is not None:
+            page = page.filter(keyset_after(page_ordering, key))
+        rows = list(page[:limit + 1])
+    except (ValidationError, ValueError, TypeError):
+        raise PaginationError("Invalid cursor")
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == PREVIOUS:
+        rows.reverse()
+
+    def row_key(row):
+        return [getattr(row, field.lstrip('-')) for field in ordering]
+
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+    more_after = has_more if direction == NEXT else bool(cursor)
+    more_before = bool(cursor) if direction == NEXT else has_more
+    if rows and more_after:
+        next_cursor = encode_cursor(NEXT, row_key(rows[-1]))
+    if rows and more_before:
+        previous_cursor = encode_cursor(PREVIOUS, row_key(rows[0]))
+
+    body = {'results': serialize(rows), 'next': next_cursor, 'previous': previous_cursor}
+    if params.get('count', '').lower() in ('1', 'true'):
+        body['count'] = queryset.count()
+    return body
@@ -1,16 +1,59 @@
 from django.contrib import admin
+from django.core.exceptions import ImproperlyConfigured
 from .models import Race, RaceResult, LapTime
+from . import timecodec
+from .lapseries import serialize_result_laps, sync_lap_count
+from .stats import refresh_stats, stats_cells
 
 
 def format_duration(duration):
-    """Format timedelta to M:SS.mmm"""
-    if not duration:
-        return "-"
-    total_seconds = duration.total_seconds()
-    minutes = int(total_seconds // 60)
-    seconds = int(total_seconds % 60)
-    milliseconds = int((total_seconds % 1) * 1000)
-    return f"{minutes}:{seconds:02d}.{milliseconds:03d}"
+    """Format timedelta to M:SS.mmm, '-' when empty."""
+    return timecodec.format_duration(duration) or "-"
+
+
+class RefreshStatsMixin:
+    """
+    Keep the DriverCircuitMonthStats rollup in sync with admin edits and
+    deletes. Works for RaceResult and for any model RaceResult has a single
+    foreign key to.
+    """
+
+    def stats_results(self, queryset):
+        """Return the RaceResult queryset affected by editing the given objects."""
+        if self.model is RaceResult:
+            return queryset
+        relations = [
+            field.name for field in RaceResult._meta.get_fields()
+            if field.many_to_one and field.related_model is self.model
+        ]
+        if len(relations) != 1:
+            raise ImproperlyConfigured(
+                f"{type(self).__name__} needs exactly one RaceResult foreign key to {self.model.__name__}"
+            )
+        return RaceResult.objects.filter(**{f"{relations[0]}__in": queryset})
+
+    def _stats_cells(self, obj):
+        return stats_cells(self.stats_results(self.model.objects.filter(pk=obj.pk)))
+
+    def save_model(self, request, obj, form, change):
+        # Capture the cells the object belonged to before the edit moves it
+        request._stale_stats_cells = self._stats_cells(obj) if change else set()
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        stale = getattr(request, '_stale_stats_cells', set())
+        refresh_stats(stale | self._stats_cells(form.instance))
+
+    def delete_model(self, request, obj):
+        stale = self._stats_cells(obj)
+        super().delete_model(request, obj)
+        refresh_stats(stale)
+
+    def delete_queryset(self, request, queryset):
+        stale = stats_cells(self.stats_results(queryset))
+        super().delete_queryset(request, queryset)
+        refresh_stats(stale)
 
 
 class LapTimeInline(admin.TabularInline):
@@ -25,13 +68,32 @@ class LapTimeInline(admin.TabularInline):
 
 
 @admin.register(RaceResult)
-class RaceResultAdmin(admin.ModelAdmin):
+class RaceResultAdmin(RefreshStatsMixin, admin.ModelAdmin):
     list_display = ['driver', 'race', 'formatted_total', 'formatted_fastest', 'formatted_average']
-    search_fields = ['driver__name', 'race__circuit__name']
-    list_filter = ['race__date', 'race__circuit']
+    search_fields = ['driver__name', 'circuit__name']
+    list_filter = ['race_date', 'circuit']
     autocomplete_fields = ['race', 'driver']
+    readonly_fields = ['lap_count', 'packed_laps']
     inlines = [LapTimeInline]
 
+    def get_inlines(self, request, obj):
+        # Packed results read their laps from lap_series, never from LapTime rows
+        if obj is not None and obj.lap_series is not None:
+            return []
+        return super().get_inlines(request, obj)
+
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        # Runs before the stats refresh in save_related, which reads lap_count
+        if formset.model is LapTime:
+            sync_lap_count(form.instance)
+
+    def packed_laps(self, obj):
+        if obj.lap_series is None:
+            return "-"
+        return ", ".join(f"{lap['lap_number']}: {lap['lap_time']}" for lap in serialize_result_laps(obj))
+    packed_laps.short_description = "Packed Laps"
+
     def formatted_total(self, obj):
         return format_duration(obj.total_time)
     formatted_total.short_description = "Total Time"
@@ -66,7 +128,7 @@ class RaceResultInline(admin.TabularInline):
 
 
 @admin.register(Race)
-class RaceAdmin(admin.ModelAdmin):
+class RaceAdmin(RefreshStatsMixin, admin.ModelAdmin):
     list_display = ['circuit', 'date']
     search_fields = ['circuit__name']
     list_filter = ['date', 'circuit']
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RacesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'speed_champion.api.races'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,164 @@
+"""
+Server-side OCR drafts.
+
+The OCR result of every uploaded sheet is kept as an OCRDraft and returned
+with its `draft_token`. Saving the race then takes the token, the indexes of
+the drivers to keep and a JSON Patch (RFC 6902 add/remove/replace/test) of the
+user's corrections, instead of every driver's laps sent back. Only the drivers
+a patch touched are validated again; the rest is data the server produced
+itself. Drafts expire after OCR_DRAFT_TTL_HOURS.
+"""
+import copy
+import json
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.utils import timezone
+from .models import OCRDraft
+
+logger = logging.getLogger(__name__)
+
+PATCH_OPS = ('add', 'remove', 'replace', 'test')
+
+
+class DraftPatchError(ValueError):
+    pass
+
+
+def _expiry_cutoff():
+    return timezone.now() - timedelta(hours=settings.OCR_DRAFT_TTL_HOURS)
+
+
+def attach_draft(result, sheet_sha256) -> Dict:
+    """
+    Store an OCR result of an uploaded sheet as a draft. Returns the result
+    with its `image_sha256` and `draft_token` added.
+    """
+    draft = OCRDraft.objects.create(result=result, sheet_id=sheet_sha256)
+    prune_drafts()
+    return {**result, 'image_sha256': sheet_sha256, 'draft_token': str(draft.token)}
+
+
+def live_drafts():
+    """Drafts that have not expired."""
+    return OCRDraft.objects.filter(created_at__gte=_expiry_cutoff())
+
+
+def get_draft(token) -> Optional[OCRDraft]:
+    """Return the draft for a token, or None when it does not exist or expired."""
+    return live_drafts().filter(token=token).first()
+
+
+def lock_draft(token) -> Optional[OCRDraft]:
+    """
+    Return the live draft for a token locked for update, or None. Inside a
+    transaction, a concurrent save of the same token waits and then finds the
+    draft gone.
+    """
+    return live_drafts().select_for_update().filter(token=token).first()
+
+
+def prune_drafts():
+    """Delete expired drafts."""
+    expired, _ = OCRDraft.objects.filter(created_at__lt=_expiry_cutoff()).delete()
+    if expired:
+        logger.info(f"Pruned {expired} expired OCR drafts")
+
+
+def _parse_pointer(path) -> List[str]:
+    if not isinstance(path, str) or (path and not path.startswith('/')):
+        raise DraftPatchError(f"Invalid path: {path!r}")
+    return [token.replace('~1', '/').replace('~0', '~') for token in path.split('/')[1:]]
+
+
+def _list_index(container, token, allow_end=False) -> int:
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit():
+        raise DraftPatchError(f"Invalid list index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise DraftPatchError(f"List index out of range: {index}")
+    return index
+
+
+def _resolve(document, tokens) -> Tuple[object, str]:
+    """Return the container holding the last token of a pointer, and that token."""
+    container = document
+    for token in tokens[:-1]:
+        if isinstance(container, list):
+            container = container[_list_index(container, token)]
+        elif isinstance(container, dict) and token in container:
+            container = container[token]
+        else:
+            raise DraftPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return container, tokens[-1]
+
+
+def apply_patch(document, patch) -> Dict:
+    """Apply a JSON Patch to a copy of the document and return the copy."""
+    document = copy.deepcopy(document)
+
+    for operation in patch:
+        op = operation.get('op')
+        if op not in PATCH_OPS:
+            raise DraftPatchError(f"Unsupported patch operation: {op!r}")
+        tokens = _parse_pointer(operation.get('path'))
+        if not tokens:
+            raise DraftPatchError("The document root cannot be patched")
+        if op != 'remove' and 'value' not in operation:
+            raise DraftPatchError(f"Missing value for '{op}' at {operation['path']}")
+
+        container, token = _resolve(document, tokens)
+        value = operation.get('value')
+
+        if isinstance(container, list):
+            index = _list_index(container, token, allow_end=op == 'add')
+            if op == 'add':
+                container.insert(index, value)
+            elif op == 'remove':
+                container.pop(index)
+            elif op == 'replace':
+                container[index] = value
+            elif container[index] != value:
+                raise DraftPatchError(f"Test failed at {operation['path']}")
+        elif isinstance(container, dict):
+            if op != 'add' and token not in container:
+                raise DraftPatchError(f"Path not found: {operation['path']}")
+            if op in ('add', 'replace'):
+                container[token] = value
+            elif op == 'remove':
+                del container[token]
+            elif container[token] != value:
+                raise DraftPatchError(f"Test failed at {operation['path']}")
+        else:
+            raise DraftPatchError(f"Path not found: {operation['path']}")
+
+    return document
+
+
+def select_drivers(result, indexes=None, patch=None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Apply the patch to a draft result and pick the drivers at `indexes` (all
+    when None), in the patched result. Returns (selected, changed): the
+    selected drivers and those of them the patch changed or added.
+    """
+    patched = apply_patch(result, patch) if patch else result
+    drivers = patched.get('drivers')
+    if not isinstance(drivers, list):
+        raise DraftPatchError("The patched draft has no drivers list")
+
+    if indexes is None:
+        indexes = range(len(drivers))
+    out_of_range = [index for index in indexes if index >= len(drivers)]
+    if out_of_range:
+        raise DraftPatchError(f"Driver indexes out of range: {out_of_range}")
+
+    selected = [drivers[index] for index in indexes]
+    if not patch:
+        return selected, []
+
+    original = {json.dumps(driver, sort_keys=True) for driver in result.get('drivers', [])}
+    changed = [driver for driver in selected if json.dumps(driver, sort_keys=True) not in original]
+    return selected, changed
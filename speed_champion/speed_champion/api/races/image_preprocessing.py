@@ -0,0 +1,154 @@
+"""
+Image preprocessing before OCR.
+
+Phone photos of timing sheets arrive as multi-megabyte JPEG, PNG or HEIC files.
+Before they are sent to the OCR model they are decoded (HEIC/HEIF included),
+rotated according to their EXIF orientation, converted to grayscale when the
+photo carries no useful colour, downscaled to a resolution that is still
+legible and re-encoded as a compact JPEG or WebP with the matching MIME type.
+
+Images are given as bytes or as the path of a stored upload (see uploads).
+JPEGs are decoded straight to grayscale, and at reduced scale when they are
+much larger than the target, so no full-resolution colour copy of a 12 MP
+photo is held in memory.
+"""
+import logging
+import os
+from io import BytesIO
+from django.conf import settings
+from PIL import Image, ImageOps, ImageStat, UnidentifiedImageError
+from pillow_heif import register_heif_opener
+
+logger = logging.getLogger(__name__)
+
+register_heif_opener()
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'HEIF': 'image/heif',
+    'GIF': 'image/gif',
+}
+
+# Mean HSV saturation (0-255) below which a photo is treated as black and white
+GRAYSCALE_SATURATION_THRESHOLD = 24
+
+EXIF_ORIENTATION = 0x0112
+
+# ISO base media brands of HEIC/HEIF stills and sequences
+HEIF_BRANDS = {b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1'}
+
+# Formats the OCR model accepts as-is when re-encoding would not shrink them
+PASSTHROUGH_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+
+def open_image(image):
+    """Open an image given as bytes or as a file path."""
+    return Image.open(BytesIO(image) if isinstance(image, bytes) else image)
+
+
+def image_size(image):
+    """Size in bytes of an image given as bytes or as a file path."""
+    return len(image) if isinstance(image, bytes) else os.path.getsize(image)
+
+
+def sniff_mime_type(image):
+    """
+    MIME type of an image (bytes or file path) from its magic bytes, for
+    files Pillow cannot decode; image/jpeg when the signature is unknown.
+    """
+    if isinstance(image, bytes):
+        head = image[:16]
+    else:
+        with open(image, 'rb') as f:
+            head = f.read(16)
+
+    if head.startswith(b'\xff\xd8\xff'):
+        return MIME_TYPES['JPEG']
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return MIME_TYPES['PNG']
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return MIME_TYPES['GIF']
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return MIME_TYPES['WEBP']
+    if head[4:8] == b'ftyp' and head[8:12] in HEIF_BRANDS:
+        return MIME_TYPES['HEIF']
+    return MIME_TYPES['JPEG']
+
+
+def is_nearly_grayscale(img):
+    """True when the image has so little colour that grayscale loses nothing."""
+    if img.mode in ('L', 'LA', '1'):
+        return True
+    sample = img.copy()
+    sample.thumbnail((64, 64))
+    saturation = sample.convert('RGB').convert('HSV').getchannel('S')
+    return ImageStat.Stat(saturation).mean[0] < GRAYSCALE_SATURATION_THRESHOLD
+
+
+def jpeg_colour_mode(image):
+    """'L' or 'RGB' for a JPEG (bytes or file path), sampled from a 1/8 scale decode."""
+    sample = open_image(image)
+    sample.draft('RGB', (64, 64))
+    return 'L' if is_nearly_grayscale(sample) else 'RGB'
+
+
+def preprocess_image(image):
+    """
+    Prepare an uploaded image (bytes or file path) for OCR.
+
+    Returns (image, mime_type), where image is the re-encoded bytes or the
+    input itself when re-encoding gains nothing. Unreadable images are passed
+    through untouched so the OCR provider can still report a meaningful error.
+    """
+    max_dimension = settings.OCR_IMAGE_MAX_DIMENSION
+    grayscale = settings.OCR_IMAGE_GRAYSCALE
+    try:
+        img = open_image(image)
+        source_format = img.format
+        original_size = img.size
+        rotated = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+
+        # JPEG only: decode straight to the target mode, at the smallest 1/2^n
+        # scale still above the target size. Other formats are decoded in full,
+        # so their colour is only checked once they are downscaled.
+        mode = None
+        if source_format == 'JPEG':
+            mode = jpeg_colour_mode(image) if grayscale else 'RGB'
+            img.draft(mode, (max_dimension, max_dimension))
+        elif img.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+            # Palette and bilevel images only resize with nearest neighbour
+            img = img.convert('RGB')
+
+        # Decoding happens here, so truncated files are caught below
+        img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        ImageOps.exif_transpose(img, in_place=True)
+
+        if mode is None:
+            mode = 'L' if grayscale and is_nearly_grayscale(img) else 'RGB'
+        if img.mode != mode:
+            img = img.convert(mode)
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not decode image for preprocessing, sending as-is: {e}")
+        return image, sniff_mime_type(image)
+
+    source_size = image_size(image)
+
+    output_format = settings.OCR_IMAGE_FORMAT
+    buffer = BytesIO()
+    img.save(buffer, format=output_format, quality=settings.OCR_IMAGE_QUALITY, optimize=True)
+    processed = buffer.getvalue()
+
+    logger.info(
+        f"Preprocessed image: {source_format} {original_size[0]}x{original_size[1]} "
+        f"{source_size / 1024:.1f} KB -> {output_format} {img.size[0]}x{img.size[1]} "
+        f"{img.mode} {len(processed) / 1024:.1f} KB"
+    )
+
+    # Nothing gained by re-encoding: keep the original upload
+    unchanged = not rotated and img.size == original_size
+    if unchanged and source_format in PASSTHROUGH_FORMATS and len(processed) >= source_size:
+        return image, MIME_TYPES[source_format]
+
+    return processed, MIME_TYPES[output_format]
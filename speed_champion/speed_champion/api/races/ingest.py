@@ -0,0 +1,128 @@
+"""
+Bulk write path for race results.
+
+Saving a race sheet resolves every driver with one query, inserts results and
+laps with bulk_create (or packs the laps onto the results, see lapseries) and
+refreshes the statistics rollup, all inside a single transaction. The number
+of round-trips no longer grows with the lap count, and a failure never leaves
+a half-saved race behind.
+"""
+import logging
+from datetime import timedelta
+from django.db import transaction
+from .lapseries import MAX_LAP_NUMBER, laps_for_storage
+from .models import Race, RaceResult, LapTime
+from .stats import refresh_stats_for_race
+from .timecodec import format_duration, parse_duration
+from ..drivers.models import Driver
+
+logger = logging.getLogger(__name__)
+
+LAP_BATCH_SIZE = 500
+
+
+def parse_driver_laps(laps_data):
+    """
+    Parse a driver's OCR laps once into (lap_number, duration) pairs.
+
+    Laps without a time, with an unreadable time or with a lap number that is
+    not an integer from 1 to MAX_LAP_NUMBER are skipped, as are repeats of a
+    lap number already read (a lap number is unique per result).
+    """
+    laps = []
+    seen = set()
+    for lap in laps_data:
+        # Handle both 'lap_time' and 'time' keys for backwards compatibility
+        lap_time_str = lap.get('lap_time') or lap.get('time')
+        if not lap_time_str:
+            logger.warning(f"  Skipping lap without time: {lap}")
+            continue
+
+        lap_time = parse_duration(lap_time_str)
+        if not lap_time:
+            continue
+
+        try:
+            # Compared as ints, so "3" and 3 are the same lap
+            lap_number = lap.get('lap_number')
+            lap_number = len(laps) + 1 if lap_number is None else int(lap_number)
+        except (TypeError, ValueError):
+            logger.warning(f"  Skipping lap with invalid lap number: {lap}")
+            continue
+        if not 1 <= lap_number <= MAX_LAP_NUMBER:
+            logger.warning(f"  Skipping lap with out of range lap number: {lap}")
+            continue
+        if lap_number in seen:
+            logger.warning(f"  Skipping repeated lap number: {lap}")
+            continue
+        seen.add(lap_number)
+        laps.append((lap_number, lap_time))
+    return laps
+
+
+def resolve_drivers(names):
+    """Map driver names to Driver rows with one lookup, creating the missing ones in bulk."""
+    drivers = {}
+    for driver in Driver.objects.filter(name__in=set(names)).order_by('id'):
+        drivers.setdefault(driver.name, driver)
+
+    missing = [name for name in dict.fromkeys(names) if name not in drivers]
+    if missing:
+        for driver in Driver.objects.bulk_create([Driver(name=name) for name in missing]):
+            logger.info(f"  Created new driver: {driver.name}")
+            drivers[driver.name] = driver
+
+    return drivers
+
+
+def save_race_results(circuit, date, selected_drivers, sheet=None):
+    """
+    Create a race with its results and laps in one transaction, linked to the
+    UploadedSheet it was read from when given. Returns the Race.
+    """
+    parsed = [
+        (driver_data.get('name'), parse_driver_laps(driver_data.get('laps', [])))
+        for driver_data in selected_drivers
+    ]
+
+    with transaction.atomic():
+        race = Race.objects.create(circuit=circuit, date=date, sheet=sheet)
+        logger.info(f"Race created with ID={race.id}")
+
+        drivers = resolve_drivers([name for name, _ in parsed])
+
+        results = []
+        lap_times = []
+        for name, laps in parsed:
+            durations = [lap_time for _, lap_time in laps]
+            total_time = sum(durations, timedelta(0))
+
+            # Calculate fastest and average lap from actual lap times (NOT from OCR)
+            fastest_lap = min(durations) if durations else None
+            average_lap = total_time / len(durations) if durations else None
+
+            logger.info(
+                f"  {name}: {len(durations)} laps, "
+                f"fastest={format_duration(fastest_lap)}, average={format_duration(average_lap)}"
+            )
+
+            result = RaceResult(
+                race=race,
+                driver=drivers[name],
+                circuit=circuit,
+                race_date=race.date,
+                total_time=total_time if durations else None,
+                fastest_lap=fastest_lap,
+                average_lap=average_lap
+            )
+            # Packed laps go on the result itself, row-stored ones after it exists
+            lap_times.extend(laps_for_storage(result, laps))
+            results.append(result)
+
+        RaceResult.objects.bulk_create(results)
+        LapTime.objects.bulk_create(lap_times, batch_size=LAP_BATCH_SIZE)
+        logger.info(f"Saved {len(results)} results and {sum(r.lap_count for r in results)} lap times")
+
+        refresh_stats_for_race(race)
+
+    return race
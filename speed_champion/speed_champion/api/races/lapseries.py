@@ -0,0 +1,152 @@
+"""
+Packed lap series.
+
+With LAP_STORAGE = 'packed' a result's laps are kept on the RaceResult itself,
+in `lap_series`: one little-endian record per lap of (lap_number: uint16,
+milliseconds: uint32), 6 bytes instead of a LapTime row with its id, foreign
+key and two index entries. A whole series decodes with one numpy.frombuffer.
+
+With LAP_STORAGE = 'rows' (the default) laps are LapTime rows as before. Both
+layouts can coexist in one database: a result with a `lap_series` is packed,
+any other reads its LapTime rows, so readers go through result_laps() and
+never care which one they got. `convert_lap_storage` moves existing results
+between the two.
+"""
+import logging
+from functools import lru_cache
+from typing import List, Tuple
+from django.conf import settings
+from django.db import transaction
+from ..response_cache import bump_data_generation
+from .models import LapTime, RaceResult
+from .timecodec import duration_to_ms, format_ms_batch, ms_to_duration
+
+logger = logging.getLogger(__name__)
+
+# Largest lap number both layouts can hold: LapTime.lap_number is a smallint,
+# which is narrower than the packed uint16
+MAX_LAP_NUMBER = 32767
+
+STORAGE_ROWS = 'rows'
+STORAGE_PACKED = 'packed'
+
+CONVERT_BATCH_SIZE = 500
+
+
+@lru_cache(maxsize=None)
+def lap_dtype():
+    """The record layout of a lap series; numpy is only imported once a series is read or written."""
+    import numpy as np
+    return np.dtype([('lap_number', '<u2'), ('ms', '<u4')])
+
+
+def packed_storage() -> bool:
+    return settings.LAP_STORAGE == STORAGE_PACKED
+
+
+def pack_laps(laps) -> bytes:
+    """Pack (lap_number, milliseconds) pairs into a lap series."""
+    import numpy as np
+    return np.array(list(laps), dtype=lap_dtype()).tobytes()
+
+
+def unpack_laps(data) -> "numpy.ndarray":
+    """Decode a lap series into a structured array of lap_number and ms."""
+    import numpy as np
+    return np.frombuffer(data, dtype=lap_dtype())
+
+
+def result_laps(result: RaceResult) -> Tuple[List[int], List[int]]:
+    """
+    A result's lap numbers and lap times in milliseconds, ordered by lap
+    number, from whichever layout it is stored in. Uses prefetched LapTime
+    rows when there are any (see RaceQuerySet.with_results).
+    """
+    if result.lap_series is not None:
+        laps = unpack_laps(result.lap_series)
+        return laps['lap_number'].tolist(), laps['ms'].tolist()
+
+    rows = sorted(result.laps.all(), key=lambda lap: lap.lap_number)
+    return [lap.lap_number for lap in rows], [duration_to_ms(lap.lap_time) for lap in rows]
+
+
+def serialize_result_laps(result: RaceResult) -> List[dict]:
+    """A result's laps as {'lap_number', 'lap_time'} dicts, on either layout."""
+    lap_numbers, lap_ms = result_laps(result)
+    return [
+        {'lap_number': lap_number, 'lap_time': lap_time}
+        for lap_number, lap_time in zip(lap_numbers, format_ms_batch(lap_ms))
+    ]
+
+
+def laps_for_storage(result: RaceResult, laps) -> List[LapTime]:
+    """
+    Store parsed (lap_number, duration) pairs on an unsaved result in the
+    configured layout. Returns the LapTime rows to create, empty when packed.
+    """
+    result.lap_count = len(laps)
+    if packed_storage():
+        result.lap_series = pack_laps((lap_number, duration_to_ms(lap_time)) for lap_number, lap_time in laps)
+        return []
+    return [LapTime(race_result=result, lap_number=lap_number, lap_time=lap_time) for lap_number, lap_time in laps]
+
+
+def sync_lap_count(result: RaceResult):
+    """Recount a row-stored result's laps after its LapTime rows were edited."""
+    if result.lap_series is None:
+        result.lap_count = result.laps.count()
+        result.save(update_fields=['lap_count'])
+
+
+def convert_lap_storage(to: str, batch_size: int = CONVERT_BATCH_SIZE) -> int:
+    """
+    Move every result stored in the other layout to `to` ('rows' or 'packed').
+    Returns the number of results converted.
+    """
+    if to == STORAGE_PACKED:
+        pending = RaceResult.objects.filter(lap_series__isnull=True)
+    elif to == STORAGE_ROWS:
+        pending = RaceResult.objects.filter(lap_series__isnull=False)
+    else:
+        raise ValueError(f"Unknown lap storage: {to!r}")
+
+    converted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(pending.order_by('id')[:batch_size])
+            if not batch:
+                break
+
+            if to == STORAGE_PACKED:
+                laps = {}
+                for row in (
+                    LapTime.objects.filter(race_result__in=batch)
+                    .order_by('race_result_id', 'lap_number')
+                    .values_list('race_result_id', 'lap_number', 'lap_time')
+                ):
+                    laps.setdefault(row[0], []).append((row[1], duration_to_ms(row[2])))
+                for result in batch:
+                    result.lap_series = pack_laps(laps.get(result.id, []))
+                    result.lap_count = len(laps.get(result.id, []))
+                RaceResult.objects.bulk_update(batch, ['lap_series', 'lap_count'])
+                LapTime.objects.filter(race_result__in=batch).delete()
+            else:
+                rows = []
+                for result in batch:
+                    series = unpack_laps(result.lap_series)
+                    rows.extend(
+                        LapTime(race_result=result, lap_number=lap_number, lap_time=ms_to_duration(ms))
+                        for lap_number, ms in zip(series['lap_number'].tolist(), series['ms'].tolist())
+                    )
+                    result.lap_series = None
+                LapTime.objects.bulk_create(rows, batch_size=batch_size)
+                RaceResult.objects.bulk_update(batch, ['lap_series'])
+
+            # Bulk writes send no signals, so retire the cached responses here
+            transaction.on_commit(bump_data_generation)
+
+        converted += len(batch)
+        logger.info(f"Converted {converted} results to {to} lap storage")
+
+    return converted
+
@@ -0,0 +1,88 @@
+"""
+Leaderboard engine.
+
+Each ranking window (overall, last year, ...) is answered by a single grouped
+aggregate over the DriverCircuitMonthStats rollup: the database groups by
+driver, computes the best average and fastest lap, and ranks both with window
+functions. The query count is therefore constant regardless of how many
+drivers exist, and no request scans RaceResult or LapTime.
+"""
+from django.db.models import F, Min, Window
+from django.db.models.functions import Rank
+from .models import DriverCircuitMonthStats
+from .stats import average_lap_expression, average_lap_from, month_start
+from .timecodec import format_duration
+
+
+def rank_drivers(stats):
+    """
+    Rank drivers over a DriverCircuitMonthStats queryset with one grouped query.
+
+    Returns a dict with 'best_average_lap' and 'fastest_lap' lists, each
+    ordered by the real duration and carrying an explicit rank.
+    """
+    rows = (
+        stats
+        .values('driver_id', 'driver__name')
+        .annotate(
+            avg_lap=average_lap_expression(),
+            best_lap=Min('fastest_lap'),
+        )
+        .annotate(
+            avg_rank=Window(Rank(), order_by=F('avg_lap').asc(nulls_last=True)),
+            best_rank=Window(Rank(), order_by=F('best_lap').asc(nulls_last=True)),
+        )
+        .order_by('driver_id')
+    )
+
+    best_average_lap = []
+    fastest_lap = []
+
+    for row in rows:
+        if row['avg_lap']:
+            best_average_lap.append({
+                "rank": row['avg_rank'],
+                "driver_id": row['driver_id'],
+                "driver_name": row['driver__name'],
+                "average_lap": format_duration(average_lap_from(row['avg_lap'])),
+            })
+
+        if row['best_lap']:
+            fastest_lap.append({
+                "rank": row['best_rank'],
+                "driver_id": row['driver_id'],
+                "driver_name": row['driver__name'],
+                "fastest_lap": format_duration(row['best_lap']),
+            })
+
+    # Ranks are computed on the real durations, never on the formatted strings
+    best_average_lap.sort(key=lambda x: (x['rank'], x['driver_id']))
+    fastest_lap.sort(key=lambda x: (x['rank'], x['driver_id']))
+
+    return {
+        "best_average_lap": best_average_lap,
+        "fastest_lap": fastest_lap,
+    }
+
+
+def build_leaderboard(circuit_id=None, last_year_since=None):
+    """
+    Build the overall and last year leaderboards.
+
+    circuit_id restricts every ranking to one circuit; last_year_since is the
+    first race date asked for in the 'last_year' window. The rollup is
+    monthly, so the window starts at the beginning of that date's month; the
+    date actually used is returned as 'last_year_since'.
+    """
+    stats = DriverCircuitMonthStats.objects.all()
+    if circuit_id is not None:
+        stats = stats.filter(circuit_id=circuit_id)
+
+    leaderboard = {"overall": rank_drivers(stats)}
+
+    if last_year_since is not None:
+        since = month_start(last_year_since)
+        leaderboard["last_year"] = rank_drivers(stats.filter(month__gte=since))
+        leaderboard["last_year_since"] = since.isoformat()
+
+    return leaderboard
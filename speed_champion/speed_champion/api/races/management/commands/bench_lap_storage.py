@@ -0,0 +1,80 @@
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from speed_champion.api.circuits.models import Circuit
+from speed_champion.api.races.ingest import save_race_results
+from speed_champion.api.races.lapseries import STORAGE_PACKED, STORAGE_ROWS
+from speed_champion.api.races.models import LapTime, Race, RaceResult
+from speed_champion.api.races.serializers import RaceDetailSerializer
+from .bench_save_results import _Rollback, build_sheet
+
+
+def storage_bytes(tables):
+    """On-disk size of tables with their indexes, or None where the backend cannot tell."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT SUM(pg_total_relation_size(t)) FROM unnest(%s::text[]) AS t", [tables])
+            return cursor.fetchone()[0]
+        if connection.vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(tables))
+            try:
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                    f"(SELECT name FROM sqlite_master WHERE tbl_name IN ({placeholders}))",
+                    tables
+                )
+            except Exception:
+                # SQLite built without the dbstat virtual table
+                return None
+            return cursor.fetchone()[0] or 0
+    return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark lap storage size and race detail latency, LapTime rows vs packed series. Rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--races', type=int, default=200)
+        parser.add_argument('--drivers', type=int, default=12)
+        parser.add_argument('--laps', type=int, default=30)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        tables = [RaceResult._meta.db_table, LapTime._meta.db_table]
+        sheet = build_sheet(options['drivers'], options['laps'])
+        lap_total = options['races'] * options['drivers'] * options['laps']
+
+        self.stdout.write(f"{'storage':<8} {'laps':>8} {'KB':>9} {'B/lap':>6} {'detail queries':>15} {'detail ms':>10}")
+
+        for storage in (STORAGE_ROWS, STORAGE_PACKED):
+            try:
+                with transaction.atomic(), override_settings(LAP_STORAGE=storage):
+                    before = storage_bytes(tables)
+                    circuit = Circuit.objects.create(name="Bench", city="Bench", type="indoor")
+                    for index in range(options['races']):
+                        race = save_race_results(circuit, date.today() - timedelta(days=index), sheet)
+                    after = storage_bytes(tables)
+
+                    timings = []
+                    for _ in range(options['repeat']):
+                        with CaptureQueriesContext(connection) as ctx:
+                            start = time.perf_counter()
+                            RaceDetailSerializer(Race.objects.with_results().get(id=race.id)).data
+                            timings.append((time.perf_counter() - start) * 1000)
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+            if before is None or after is None:
+                size, per_lap = "n/a", "n/a"
+            else:
+                size, per_lap = f"{(after - before) / 1024:.1f}", f"{(after - before) / lap_total:.1f}"
+            self.stdout.write(
+                f"{storage:<8} {lap_total:>8} {size:>9} {per_lap:>6} "
+                f"{len(ctx.captured_queries):>15} {min(timings):>10.2f}"
+            )
+
+        self.stdout.write("Sizes are of the result and lap tables with their indexes.")
@@ -0,0 +1,98 @@
+import base64
+import json
+import os
+import resource
+import tempfile
+from io import BytesIO
+from pathlib import Path
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.test import override_settings
+from PIL import Image, ImageOps
+from speed_champion.api.races.image_preprocessing import MIME_TYPES, is_nearly_grayscale
+from speed_champion.api.races.ocr_backends import encode_messages
+from speed_champion.api.races.ocr_parser import build_messages
+from speed_champion.api.races.uploads import store_upload
+from .bench_ocr_preprocess import synthetic_sheet
+
+
+def legacy_preprocess(image_bytes):
+    """The previous preprocessing: full-resolution decode, then convert and downscale."""
+    img = ImageOps.exif_transpose(Image.open(BytesIO(image_bytes)))
+    img = img.convert('L' if is_nearly_grayscale(img) else 'RGB')
+    img.thumbnail((settings.OCR_IMAGE_MAX_DIMENSION,) * 2, Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    img.save(buffer, format=settings.OCR_IMAGE_FORMAT, quality=settings.OCR_IMAGE_QUALITY, optimize=True)
+    return buffer.getvalue(), MIME_TYPES[settings.OCR_IMAGE_FORMAT]
+
+
+def legacy_request(upload):
+    """The previous path: read the upload, base64 it and JSON-encode the request."""
+    upload.seek(0)
+    image_bytes, mime_type = legacy_preprocess(upload.read())
+    base64_image = base64.b64encode(image_bytes).decode('utf-8')
+    messages = [{"role": "user", "content": [
+        {"type": "text", "text": "prompt"},
+        {"type": "image_url", "image_url": f"data:{mime_type};base64,{base64_image}"}
+    ]}]
+    return len(json.dumps({"model": "bench", "messages": messages}).encode())
+
+
+def stored_request(upload):
+    """The current path: store the upload, then encode the request as the backend does."""
+    with transaction.atomic():
+        sheet = store_upload(upload)
+        messages = build_messages(Path(sheet.file.path), "prompt")
+        # Stands in for the SDK, which JSON-encodes the request body in one piece
+        body = json.dumps({"model": "bench", "messages": encode_messages(messages)}).encode()
+        transaction.set_rollback(True)
+    return len(body)
+
+
+def peak_rss_kb(build, upload):
+    """Run `build` in a forked child and return its peak RSS in KB and the body size."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        body_size = build(upload) if build else 0
+        with os.fdopen(write_fd, 'w') as pipe:
+            pipe.write(f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss} {body_size}")
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        peak, body_size = map(int, pipe.read().split())
+    os.waitpid(pid, 0)
+    return peak, body_size
+
+
+class Command(BaseCommand):
+    help = "Benchmark peak RSS of turning an upload into an OCR request, before and after content-addressed storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='*', help="Image files (defaults to a synthetic sheet)")
+
+    def handle(self, *args, **options):
+        samples = [(Path(p).name, Path(p).read_bytes()) for p in options['images']] or [synthetic_sheet()]
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+
+        self.stdout.write(f"{'image':<24} {'raw KB':>9} {'body KB':>9} {'peak MB before':>15} {'peak MB after':>14}")
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            for name, raw in samples:
+                upload = SimpleUploadedFile(name, raw)
+                baseline, _ = peak_rss_kb(None, upload)
+                before, body_size = peak_rss_kb(legacy_request, upload)
+                after, _ = peak_rss_kb(stored_request, upload)
+
+                self.stdout.write(
+                    f"{name[:24]:<24} {len(raw) / 1024:>9.1f} {body_size / 1024:>9.1f} "
+                    f"{(before - baseline) / 1024:>15.1f} {(after - baseline) / 1024:>14.1f}"
+                )
+
+        self.stdout.write("Peak RSS of a forked child above an idle child's, per upload.")
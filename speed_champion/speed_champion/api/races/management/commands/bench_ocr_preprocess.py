@@ -0,0 +1,53 @@
+import base64
+import time
+from io import BytesIO
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw
+from speed_champion.api.races.image_preprocessing import preprocess_image
+
+
+def synthetic_sheet(width=4032, height=3024):
+    """A phone-sized JPEG of a lap-time grid, for runs without sample photos."""
+    img = Image.new('RGB', (width, height), (236, 232, 225))
+    draw = ImageDraw.Draw(img)
+    for row in range(32):
+        y = 100 + row * 85
+        draw.line([(60, y), (width - 60, y)], fill=(40, 40, 40), width=3)
+        for col in range(9):
+            x = 80 + col * 430
+            draw.text((x, y + 20), f"0:{36 + (row + col) % 9}.{(row * 37 + col * 11) % 1000:03d}", fill=(20, 20, 20))
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=95)
+    return 'synthetic.jpg', buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = "Benchmark OCR image preprocessing: payload size and time, before and after."
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='*', help="Image files (defaults to a synthetic sheet)")
+        parser.add_argument('--uplink-mbps', type=float, default=10.0,
+                            help="Uplink bandwidth used to estimate upload time to the OCR API")
+
+    def handle(self, *args, **options):
+        samples = [(Path(p).name, Path(p).read_bytes()) for p in options['images']] or [synthetic_sheet()]
+        bytes_per_ms = options['uplink_mbps'] * 1_000_000 / 8 / 1000
+
+        self.stdout.write(
+            f"{'image':<24} {'raw KB':>9} {'sent KB':>9} {'prep ms':>8} "
+            f"{'upload ms before':>17} {'upload ms after':>16}"
+        )
+
+        for name, raw in samples:
+            start = time.perf_counter()
+            processed, mime_type = preprocess_image(raw)
+            prep_ms = (time.perf_counter() - start) * 1000
+
+            before = len(base64.b64encode(raw))
+            after = len(base64.b64encode(processed))
+
+            self.stdout.write(
+                f"{name[:24]:<24} {len(raw) / 1024:>9.1f} {len(processed) / 1024:>9.1f} {prep_ms:>8.1f} "
+                f"{before / bytes_per_ms:>17.1f} {prep_ms + after / bytes_per_ms:>16.1f}  {mime_type}"
+            )
@@ -0,0 +1,58 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from speed_champion.api.circuits.models import Circuit
+from speed_champion.api.races.ingest import save_race_results
+
+
+class _Rollback(Exception):
+    pass
+
+
+def build_sheet(drivers, laps):
+    """Build a synthetic selected_drivers payload."""
+    return [
+        {
+            "name": f"Bench Driver {d}",
+            "laps": [
+                {"lap_number": n, "lap_time": f"0:{35 + (d + n) % 10}.{(d * 37 + n * 11) % 1000:03d}"}
+                for n in range(1, laps + 1)
+            ],
+        }
+        for d in range(drivers)
+    ]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the race results write path. Runs inside a rolled-back transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=12)
+        parser.add_argument('--laps', type=int, nargs='+', default=[10, 30, 100, 300])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'laps':>6} {'rows':>7} {'queries':>8} {'ms':>9}")
+
+        for laps in options['laps']:
+            sheet = build_sheet(options['drivers'], laps)
+            timings = []
+            queries = 0
+
+            for _ in range(options['repeat']):
+                try:
+                    with transaction.atomic():
+                        circuit = Circuit.objects.create(name="Bench", city="Bench", type="indoor")
+                        with CaptureQueriesContext(connection) as ctx:
+                            start = time.perf_counter()
+                            save_race_results(circuit, date.today(), sheet)
+                            timings.append((time.perf_counter() - start) * 1000)
+                        queries = len(ctx.captured_queries)
+                        raise _Rollback
+                except _Rollback:
+                    pass
+
+            rows = options['drivers'] * (laps + 1)
+            self.stdout.write(f"{laps:>6} {rows:>7} {queries:>8} {min(timings):>9.2f}")
@@ -0,0 +1,167 @@
+import random
+import re
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+from speed_champion.api.drivers.models import Driver
+from speed_champion.api.races.lapseries import pack_laps, serialize_result_laps
+from speed_champion.api.races.models import LapTime, RaceResult
+from speed_champion.api.races.serializers import RaceResultSerializer
+from speed_champion.api.races.timecodec import duration_to_ms, format_duration_batch, parse_ms_batch
+
+LAPS_PER_RESULT = 20
+
+
+def legacy_format_duration(duration):
+    """The previous per-module formatter (serializers, views, admin), copied as it shipped."""
+    if not duration:
+        return None
+    total_seconds = duration.total_seconds()
+    minutes = int(total_seconds // 60)
+    seconds = int(total_seconds % 60)
+    milliseconds = int((total_seconds % 1) * 1000)
+    return f"{minutes}:{seconds:02d}.{milliseconds:03d}"
+
+
+def legacy_parse(time_str):
+    """The previous ocr_parser.parse_time_to_duration, copied as it shipped."""
+    try:
+        time_str = time_str.strip().replace(' ', '')
+        match = re.match(r'(\d+):(\d+)\.(\d+)', time_str)
+        if match:
+            minutes = int(match.group(1))
+            seconds = int(match.group(2))
+            milliseconds = int(match.group(3))
+            return timedelta(minutes=minutes, seconds=seconds, milliseconds=milliseconds)
+    except Exception:
+        pass
+    return None
+
+
+class LegacyLapTimeSerializer(serializers.ModelSerializer):
+    """The previous lap serializer: a method field call per lap."""
+    lap_time = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LapTime
+        fields = ['lap_number', 'lap_time']
+
+    def get_lap_time(self, obj):
+        return legacy_format_duration(obj.lap_time)
+
+
+class LegacyRaceResultSerializer(serializers.ModelSerializer):
+    """The previous result serializer, nesting LegacyLapTimeSerializer."""
+    driver_name = serializers.CharField(source='driver.name')
+    laps = LegacyLapTimeSerializer(many=True, read_only=True)
+    total_time = serializers.SerializerMethodField()
+    fastest_lap = serializers.SerializerMethodField()
+    average_lap = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RaceResult
+        fields = ['driver_name', 'total_time', 'fastest_lap', 'average_lap', 'laps']
+
+    def get_total_time(self, obj):
+        return legacy_format_duration(obj.total_time)
+
+    def get_fastest_lap(self, obj):
+        return legacy_format_duration(obj.fastest_lap)
+
+    def get_average_lap(self, obj):
+        return legacy_format_duration(obj.average_lap)
+
+
+def build_results(laps, packed):
+    """
+    Unsaved results of LAPS_PER_RESULT laps each, as the race detail reads
+    them: packed into lap_series, or with their LapTime rows prefetched.
+    """
+    driver = Driver(name="Bench Driver")
+    results = []
+    for start in range(0, len(laps), LAPS_PER_RESULT):
+        chunk = laps[start:start + LAPS_PER_RESULT]
+        durations = [lap.lap_time for lap in chunk]
+        result = RaceResult(
+            id=len(results) + 1,
+            driver=driver,
+            total_time=sum(durations, timedelta(0)),
+            fastest_lap=min(durations),
+            average_lap=sum(durations, timedelta(0)) / len(durations),
+            lap_count=len(chunk),
+        )
+        if packed:
+            result.lap_series = pack_laps((lap.lap_number, duration_to_ms(lap.lap_time)) for lap in chunk)
+        else:
+            result._prefetched_objects_cache = {'laps': chunk}
+        results.append(result)
+    return results
+
+
+def best_of(runs, func):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "Benchmark lap time serialization and parsing, before and after the batch time codec."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--laps', type=int, default=10_000, help="Number of laps")
+        parser.add_argument('--runs', type=int, default=5, help="Runs per measurement (best is reported)")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        laps = [
+            LapTime(lap_number=index + 1, lap_time=timedelta(milliseconds=rng.randint(30_000, 95_000)))
+            for index in range(options['laps'])
+        ]
+        strings = [f"{lap.lap_time // timedelta(minutes=1)}:{lap.lap_time.seconds % 60:02d}."
+                   f"{lap.lap_time.microseconds // 1000:03d}" for lap in laps]
+        durations = [lap.lap_time for lap in laps]
+        runs = options['runs']
+
+        row_results = build_results(laps, packed=False)
+        packed_results = build_results(laps, packed=True)
+        legacy_results = best_of(runs, lambda: LegacyRaceResultSerializer(row_results, many=True).data)
+
+        rows = [
+            ("laps, rows",
+             best_of(runs, lambda: LegacyLapTimeSerializer(laps, many=True).data),
+             best_of(runs, lambda: [serialize_result_laps(result) for result in row_results])),
+            ("laps, packed",
+             best_of(runs, lambda: LegacyLapTimeSerializer(laps, many=True).data),
+             best_of(runs, lambda: [serialize_result_laps(result) for result in packed_results])),
+            ("results, rows",
+             legacy_results,
+             best_of(runs, lambda: RaceResultSerializer(row_results, many=True).data)),
+            ("results, packed",
+             legacy_results,
+             best_of(runs, lambda: RaceResultSerializer(packed_results, many=True).data)),
+            ("format times",
+             best_of(runs, lambda: [legacy_format_duration(d) for d in durations]),
+             best_of(runs, lambda: format_duration_batch(durations))),
+            ("parse times",
+             best_of(runs, lambda: [legacy_parse(s) for s in strings]),
+             best_of(runs, lambda: parse_ms_batch(strings))),
+        ]
+
+        self.stdout.write(f"{'operation':<16} {'laps':>7} {'ms before':>10} {'ms after':>9} {'speedup':>8}")
+        for name, before, after in rows:
+            self.stdout.write(f"{name:<16} {len(laps):>7} {before:>10.2f} {after:>9.2f} {before / after:>7.1f}x")
+
+        # Both layouts serialize the same laps
+        assert RaceResultSerializer(row_results, many=True).data == RaceResultSerializer(packed_results, many=True).data
+
+        # The old formatter truncated float seconds, so it could print a lap a millisecond short
+        misformatted = sum(
+            before != after
+            for before, after in zip([legacy_format_duration(d) for d in durations], format_duration_batch(durations))
+        )
+        self.stdout.write(f"{misformatted} of {len(durations)} laps were formatted differently before.")
+
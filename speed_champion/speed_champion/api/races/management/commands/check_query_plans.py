@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from speed_champion.api.races.query_plans import SEQ_SCAN_PATTERNS, explain, key_queries, seed, sequential_scans
+from .bench_save_results import _Rollback
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN the queries of the key read paths against a seeded dataset and fail if any "
+        "of them plans a sequential scan. Runs inside a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--races', type=int, default=3000)
+        parser.add_argument('--drivers', type=int, default=200)
+        parser.add_argument('--circuits', type=int, default=10)
+        parser.add_argument('--laps', type=int, default=5)
+        parser.add_argument('--verbose-plans', action='store_true', help="Print every plan")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SEQ_SCAN_PATTERNS:
+            raise CommandError(f"Query plan checks are not supported on {connection.vendor}")
+
+        regressions = []
+        try:
+            with transaction.atomic():
+                queries = key_queries(*seed(
+                    options['races'], options['drivers'], options['circuits'], options['laps']
+                ))
+                for name, sqls in queries.items():
+                    plans = [explain(sql) for sql in sqls]
+                    scanned = sequential_scans(sqls, plans)
+                    plan = "\n\n".join(f"{sql}\n{plan}" for sql, plan in zip(sqls, plans))
+
+                    if scanned:
+                        regressions.append(name)
+                        self.stdout.write(self.style.ERROR(f"{name:<28} sequential scan on {', '.join(scanned)}"))
+                    else:
+                        self.stdout.write(f"{name:<28} ok")
+                    if scanned or options['verbose_plans']:
+                        self.stdout.write(plan)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} of {len(queries)} queries plan a sequential scan")
+        self.stdout.write(self.style.SUCCESS(f"All {len(queries)} query plans use indexes."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from speed_champion.api.races.lapseries import STORAGE_PACKED, STORAGE_ROWS, convert_lap_storage
+
+
+class Command(BaseCommand):
+    help = "Move existing race results between LapTime rows and packed lap series."
+
+    def add_arguments(self, parser):
+        parser.add_argument('to', choices=[STORAGE_PACKED, STORAGE_ROWS], help="Target lap storage")
+
+    def handle(self, *args, **options):
+        count = convert_lap_storage(options['to'])
+        self.stdout.write(self.style.SUCCESS(f"Converted {count} results to {options['to']} lap storage."))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from speed_champion.api.races.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the driver x circuit x month statistics rollup from race results."
+
+    def handle(self, *args, **options):
+        count = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} driver stats rows."))
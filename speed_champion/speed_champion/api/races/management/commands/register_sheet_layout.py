@@ -0,0 +1,57 @@
+import json
+import time
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from speed_champion.api.races.ocr_local import learn_layout, load_sheet
+
+
+class Command(BaseCommand):
+    help = (
+        "Register a timing-sheet layout for local OCR, learning its glyph templates "
+        "from sample sheets and their correct readings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help="Layout name, e.g. the circuit's slug")
+        parser.add_argument('--sample', nargs=2, action='append', required=True, metavar=('IMAGE', 'RESULT'),
+                            help="Sample sheet and a JSON file with its correct {\"drivers\": [...]} reading; repeatable")
+        parser.add_argument('--crop', help="Table area as left,top,right,bottom fractions of the image")
+        parser.add_argument('--header-rows', type=int, default=1, help="Rows above the first lap")
+        parser.add_argument('--summary-rows', default='fastest_lap,average_lap',
+                            help="Fields of the rows below the laps, top to bottom")
+
+    def handle(self, *args, **options):
+        samples = [
+            (Path(image).read_bytes(), json.loads(Path(result).read_text()))
+            for image, result in options['sample']
+        ]
+
+        config = {
+            'crop': [float(value) for value in options['crop'].split(',')] if options['crop'] else None,
+            'header_rows': options['header_rows'],
+            'summary_rows': [field for field in options['summary_rows'].split(',') if field],
+        }
+
+        try:
+            layout = learn_layout(options['name'], samples, config)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        # Read the samples back: the layout must reproduce their readings
+        start = time.perf_counter()
+        for number, (image_bytes, result) in enumerate(samples, start=1):
+            if layout.read(load_sheet(image_bytes, layout.crop)) != result:
+                raise CommandError(
+                    f"The learned layout does not read sample {number} back correctly; "
+                    "check --crop and --header-rows"
+                )
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(samples)
+
+        path = Path(settings.OCR_LOCAL_LAYOUTS_DIR) / options['name']
+        layout.save(path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Registered layout '{layout.name}' in {path}: {len(layout.chars)} glyphs "
+            f"({''.join(layout.chars)}), {elapsed_ms:.0f}ms per sheet"
+        ))
@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand
+from speed_champion.api.races.models import OCRJob
+from speed_champion.api.races.ocr_jobs import recover_stale_ocr_jobs, run_ocr_job
+
+
+class Command(BaseCommand):
+    help = "Process pending OCR jobs (use with OCR_JOB_EXECUTOR='worker')."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain pending jobs and exit")
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        self.stdout.write("OCR worker started")
+
+        while True:
+            # Jobs a stopped worker was running go back in the queue
+            recover_stale_ocr_jobs()
+
+            job_ids = list(
+                OCRJob.objects.filter(status=OCRJob.STATUS_PENDING)
+                .order_by('created_at')
+                .values_list('id', flat=True)
+            )
+
+            for job_id in job_ids:
+                job = run_ocr_job(job_id)
+                if job:
+                    self.stdout.write(f"Job {job.id}: {job.status}")
+
+            if options['once']:
+                break
+            if not job_ids:
+                time.sleep(options['poll_interval'])
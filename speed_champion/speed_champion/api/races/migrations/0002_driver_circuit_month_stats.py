@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-16 20:52
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def backfill_stats(apps, schema_editor):
+    RaceResult = apps.get_model('races', 'RaceResult')
+    DriverCircuitMonthStats = apps.get_model('races', 'DriverCircuitMonthStats')
+
+    rows = {}
+    results = RaceResult.objects.select_related('race').annotate(
+        lap_count=models.Count('laps')
+    )
+    for result in results.iterator():
+        key = (result.driver_id, result.race.circuit_id, result.race.date.replace(day=1))
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = DriverCircuitMonthStats(
+                driver_id=key[0], circuit_id=key[1], month=key[2]
+            )
+        row.race_count += 1
+        row.lap_count += result.lap_count
+        if result.fastest_lap and (row.fastest_lap is None or result.fastest_lap < row.fastest_lap):
+            row.fastest_lap = result.fastest_lap
+        if result.average_lap is not None:
+            row.average_lap_sum += result.average_lap // timedelta(microseconds=1)
+            row.average_lap_count += 1
+
+    DriverCircuitMonthStats.objects.bulk_create(rows.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0001_initial'),
+        ('drivers', '0001_initial'),
+        ('races', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverCircuitMonthStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('race_count', models.PositiveIntegerField(default=0)),
+                ('lap_count', models.PositiveIntegerField(default=0)),
+                ('fastest_lap', models.DurationField(blank=True, null=True)),
+                ('average_lap_sum', models.BigIntegerField(default=0)),
+                ('average_lap_count', models.PositiveIntegerField(default=0)),
+                ('circuit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_stats', to='circuits.circuit')),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_stats', to='drivers.driver')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('driver', 'circuit', 'month'), name='unique_driver_circuit_month_stats')],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0004_ocr_cache_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadedSheet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(upload_to='sheets/')),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='race',
+            name='sheet',
+            field=models.ForeignKey(blank=True, help_text='Timing sheet the results were read from', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='races', to='races.uploadedsheet'),
+        ),
+    ]
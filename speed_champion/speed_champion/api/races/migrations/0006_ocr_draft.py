@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:29
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0005_uploaded_sheet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRDraft',
+            fields=[
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('result', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('sheet', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='drafts', to='races.uploadedsheet', to_field='sha256')),
+            ],
+        ),
+    ]
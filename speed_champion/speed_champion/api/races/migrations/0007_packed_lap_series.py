@@ -0,0 +1,40 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:33
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_lap_count(apps, schema_editor):
+    RaceResult = apps.get_model('races', 'RaceResult')
+    LapTime = apps.get_model('races', 'LapTime')
+
+    lap_count = (
+        LapTime.objects
+        .filter(race_result=models.OuterRef('pk'))
+        .order_by()
+        .values('race_result')
+        .annotate(count=models.Count('id'))
+        .values('count')
+    )
+    RaceResult.objects.update(lap_count=Coalesce(models.Subquery(lap_count), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0006_ocr_draft'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='raceresult',
+            name='lap_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='raceresult',
+            name='lap_series',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_lap_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:36
+
+import logging
+import django.db.models.deletion
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def drop_duplicate_laps(apps, schema_editor):
+    """Keep the first LapTime of every repeated (race_result, lap_number) pair."""
+    RaceResult = apps.get_model('races', 'RaceResult')
+    LapTime = apps.get_model('races', 'LapTime')
+
+    duplicates = (
+        LapTime.objects
+        .values('race_result_id', 'lap_number')
+        .annotate(first_id=models.Min('id'), count=models.Count('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    affected = set()
+    removed = 0
+    for row in duplicates:
+        removed += LapTime.objects.filter(
+            race_result_id=row['race_result_id'], lap_number=row['lap_number'], id__gt=row['first_id']
+        ).delete()[0]
+        affected.add(row['race_result_id'])
+
+    if removed:
+        logger.warning(
+            f"Removed {removed} duplicate lap times from {len(affected)} race results "
+            f"before adding the (race_result, lap_number) unique constraint"
+        )
+
+    for result in RaceResult.objects.filter(id__in=affected):
+        result.lap_count = LapTime.objects.filter(race_result=result).count()
+        result.save(update_fields=['lap_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0001_initial'),
+        ('drivers', '0001_initial'),
+        ('races', '0007_packed_lap_series'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_laps, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='drivercircuitmonthstats',
+            index=models.Index(fields=['circuit', 'fastest_lap', 'driver'], name='stats_circuit_fastest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='race',
+            index=models.Index(fields=['-date'], name='race_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='race',
+            index=models.Index(fields=['circuit', 'date'], name='race_circuit_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='raceresult',
+            index=models.Index(fields=['driver', 'race'], name='result_driver_race_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='laptime',
+            constraint=models.UniqueConstraint(fields=('race_result', 'lap_number'), name='unique_race_result_lap_number'),
+        ),
+        migrations.AlterField(
+            model_name='laptime',
+            name='race_result',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='laps', to='races.raceresult'),
+        ),
+    ]
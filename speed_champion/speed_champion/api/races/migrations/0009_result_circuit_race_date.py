@@ -0,0 +1,52 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_race_fields(apps, schema_editor):
+    RaceResult = apps.get_model('races', 'RaceResult')
+    Race = apps.get_model('races', 'Race')
+
+    race = Race.objects.filter(pk=models.OuterRef('race_id'))
+    RaceResult.objects.update(
+        circuit_id=models.Subquery(race.values('circuit_id')[:1]),
+        race_date=models.Subquery(race.values('date')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0001_initial'),
+        ('drivers', '0001_initial'),
+        ('races', '0008_analytics_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='raceresult',
+            name='circuit',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='race_results', to='circuits.circuit'),
+        ),
+        migrations.AddField(
+            model_name='raceresult',
+            name='race_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(copy_race_fields, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='raceresult',
+            name='circuit',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='race_results', to='circuits.circuit'),
+        ),
+        migrations.AlterField(
+            model_name='raceresult',
+            name='race_date',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='raceresult',
+            index=models.Index(fields=['driver', 'circuit', 'race_date'], name='result_driver_circuit_date_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circuits', '0001_initial'),
+        ('races', '0009_result_circuit_race_date'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='race',
+            name='race_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='race',
+            index=models.Index(fields=['-date', '-id'], name='race_date_id_idx'),
+        ),
+    ]
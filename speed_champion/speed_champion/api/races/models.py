@@ -1,10 +1,74 @@
+import uuid
 from django.db import models
+from django.db.models.functions import Coalesce
 from speed_champion.api.circuits.models import Circuit
 from speed_champion.api.drivers.models import Driver
 
+class RaceQuerySet(models.QuerySet):
+    def with_results(self, laps=True):
+        """
+        Prefetch results with their drivers and ordered laps (3 queries per race
+        set). Packed results carry their laps and have no LapTime rows to fetch.
+        With laps=False neither the LapTime rows nor the packed series are read.
+        """
+        results = RaceResult.objects.select_related('driver').order_by('id')
+        if laps:
+            results = results.prefetch_related(
+                models.Prefetch('laps', queryset=LapTime.objects.order_by('lap_number'))
+            )
+        else:
+            results = results.defer('lap_series')
+        return self.prefetch_related(models.Prefetch('results', queryset=results))
+
+    def with_summary(self):
+        """
+        Annotate each race with its driver count, fastest lap and the driver who
+        set it (summary_*), as subqueries of the same SELECT on the results'
+        race index.
+        """
+        results = RaceResult.objects.filter(race=models.OuterRef('pk')).order_by()
+        fastest = results.filter(fastest_lap__isnull=False).order_by('fastest_lap', 'id')
+        return self.annotate(
+            summary_driver_count=Coalesce(
+                models.Subquery(results.values('race').annotate(count=models.Count('id')).values('count')),
+                0
+            ),
+            summary_fastest_lap=models.Subquery(fastest.values('fastest_lap')[:1]),
+            summary_winner_id=models.Subquery(fastest.values('driver_id')[:1]),
+            summary_winner_name=models.Subquery(fastest.values('driver__name')[:1]),
+        )
+
+
 class Race(models.Model):
     circuit = models.ForeignKey(Circuit, on_delete=models.CASCADE)
     date = models.DateField()
+    sheet = models.ForeignKey(
+        'UploadedSheet',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='races',
+        help_text="Timing sheet the results were read from"
+    )
+
+    objects = RaceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Race list, newest first, and its (date, id) keyset pages
+            models.Index(fields=['-date', '-id'], name='race_date_id_idx'),
+            # A circuit's races by date (race list filter, circuit evolution, stats refresh)
+            models.Index(fields=['circuit', 'date'], name='race_circuit_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            # Keep the copies on the results in step with an edited race
+            self.results.exclude(circuit_id=self.circuit_id, race_date=self.date).update(
+                circuit_id=self.circuit_id, race_date=self.date
+            )
 
     def __str__(self):
         return f"{self.circuit.name} - {self.date}"
@@ -13,10 +77,33 @@ class RaceResult(models.Model):
     race = models.ForeignKey(Race, on_delete=models.CASCADE, related_name='results')
     driver = models.ForeignKey(Driver, on_delete=models.CASCADE)
 
+    # Copies of race.circuit and race.date, so results filter by circuit and
+    # date without joining Race. Set on save and by Race.save().
+    circuit = models.ForeignKey(Circuit, on_delete=models.CASCADE, related_name='race_results', editable=False)
+    race_date = models.DateField(editable=False)
+
     total_time = models.DurationField(null=True, blank=True)
     fastest_lap = models.DurationField(null=True, blank=True)
     average_lap = models.DurationField(null=True, blank=True)
 
+    lap_count = models.PositiveSmallIntegerField(default=0)
+    # Packed (lap_number, milliseconds) records when LAP_STORAGE is 'packed',
+    # NULL when the laps are LapTime rows (see lapseries)
+    lap_series = models.BinaryField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # A driver's races (race list filter)
+            models.Index(fields=['driver', 'race'], name='result_driver_race_idx'),
+            # A driver's results at a circuit by date (evolution, stats refresh)
+            models.Index(fields=['driver', 'circuit', 'race_date'], name='result_driver_circuit_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.circuit_id = self.race.circuit_id
+        self.race_date = self.race.date
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.driver} - {self.race}"
 
@@ -24,10 +111,146 @@ class LapTime(models.Model):
     race_result = models.ForeignKey(
         RaceResult,
         on_delete=models.CASCADE,
-        related_name='laps'
+        related_name='laps',
+        # Covered by the (race_result, lap_number) constraint
+        db_index=False
     )
     lap_number = models.PositiveSmallIntegerField()
     lap_time = models.DurationField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['race_result', 'lap_number'],
+                name='unique_race_result_lap_number'
+            ),
+        ]
+
     def __str__(self):
         return f"Lap {self.lap_number} - {self.lap_time}"
+
+
+class DriverCircuitMonthStats(models.Model):
+    """
+    Rollup of a driver's results at a circuit within one calendar month.
+
+    Maintained by the save path (see stats.refresh_stats) and rebuilt from
+    scratch with the `rebuild_driver_stats` management command.
+    """
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, related_name='monthly_stats')
+    circuit = models.ForeignKey(Circuit, on_delete=models.CASCADE, related_name='monthly_stats')
+    month = models.DateField(help_text="First day of the month")
+
+    race_count = models.PositiveIntegerField(default=0)
+    lap_count = models.PositiveIntegerField(default=0)
+    fastest_lap = models.DurationField(null=True, blank=True)
+    # Sum of RaceResult.average_lap in microseconds, kept as an integer so the
+    # mean can be computed and ordered on by the database on every backend
+    average_lap_sum = models.BigIntegerField(default=0)
+    average_lap_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['driver', 'circuit', 'month'],
+                name='unique_driver_circuit_month_stats'
+            ),
+        ]
+        indexes = [
+            # Fastest lap ever at a circuit, answered from the index alone
+            models.Index(fields=['circuit', 'fastest_lap', 'driver'], name='stats_circuit_fastest_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.driver} - {self.circuit} - {self.month:%Y-%m}"
+
+
+class OCRJob(models.Model):
+    """An uploaded timing sheet waiting for, or done with, OCR extraction."""
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    image = models.FileField(upload_to='ocr_jobs/%Y/%m/')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # Times the job was claimed; a job whose process died is retried up to
+    # OCR_JOB_MAX_ATTEMPTS times (see ocr_jobs.recover_stale_ocr_jobs)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"OCR job {self.id} ({self.status})"
+
+
+class OCRCacheEntry(models.Model):
+    """Parsed OCR result cached by image content, model and prompt version."""
+    image_sha256 = models.CharField(max_length=64)
+    model = models.CharField(max_length=100)
+    prompt_version = models.CharField(max_length=20)
+    result = models.JSONField()
+
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['image_sha256', 'model', 'prompt_version'],
+                name='unique_ocr_cache_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.image_sha256[:12]} ({self.model}, prompt v{self.prompt_version})"
+
+
+class OCRDraft(models.Model):
+    """
+    An OCR result kept server-side until the user saves it, so save-results
+    can send its token plus corrections instead of the whole result.
+    """
+    token = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    sheet = models.ForeignKey(
+        'UploadedSheet',
+        to_field='sha256',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='drafts'
+    )
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"OCR draft {self.token}"
+
+
+class UploadedSheet(models.Model):
+    """
+    An uploaded timing-sheet image, stored once per content hash.
+
+    Files live under MEDIA_ROOT/sheets/ and are named after their SHA-256, see
+    uploads.store_upload().
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='sheets/')
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.size / 1024:.0f} KB)"
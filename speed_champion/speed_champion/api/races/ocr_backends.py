@@ -0,0 +1,288 @@
+"""
+Pluggable OCR backends.
+
+A backend turns a chat message list (prompt + image) into the model's reply
+text, either in one piece or as a stream of chunks. `response_format` asks for
+schema-constrained output where the provider supports it, and a `usage` dict,
+when given, is filled with the prompt and completion token counts reported by
+the provider. The active backend is
+chosen by settings.OCR_BACKEND and instantiated on first use, so processes
+that never run OCR (migrate, most workers, tests) never import the provider
+SDK.
+
+The image part of a message is an ImagePayload rather than a data URL
+string: the stored file is only read and base64-encoded by the backend, when
+it builds its request (see encode_messages), and the replay backend hashes it
+chunk by chunk without ever holding the encoded copy.
+
+Available backends:
+
+- 'mistral': the Mistral vision model (default)
+- 'replay':  deterministic offline replies recorded on disk, with configurable
+             latency, for tests and network-free benchmarks
+"""
+import base64
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+OCR_BACKENDS = {
+    'mistral': 'speed_champion.api.races.ocr_backends.MistralBackend',
+    'replay': 'speed_champion.api.races.ocr_backends.ReplayBackend',
+}
+
+
+class ImagePayload:
+    """
+    The image of a message, given as bytes or as a file path (mapped, not
+    read), and written out as a base64 data URL in chunks.
+    """
+
+    # A multiple of 3, so the chunks encode without padding in between
+    CHUNK_SIZE = 3 * 64 * 1024
+
+    def __init__(self, image, mime_type):
+        self.image = image
+        self.mime_type = mime_type
+
+    @property
+    def prefix(self) -> bytes:
+        return f"data:{self.mime_type};base64,".encode()
+
+    @property
+    def size(self) -> int:
+        return len(self.image) if isinstance(self.image, bytes) else os.path.getsize(self.image)
+
+    def __len__(self):
+        """Length of the data URL."""
+        return len(self.prefix) + 4 * -(-self.size // 3)
+
+    @contextmanager
+    def _buffer(self):
+        if isinstance(self.image, bytes):
+            yield memoryview(self.image)
+            return
+        with open(self.image, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                yield b''
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def iter_data_url(self) -> Iterator[bytes]:
+        """Yield the data URL in chunks."""
+        yield self.prefix
+        with self._buffer() as buffer:
+            for start in range(0, len(buffer), self.CHUNK_SIZE):
+                yield base64.b64encode(buffer[start:start + self.CHUNK_SIZE])
+
+    def digest(self) -> str:
+        """SHA-256 of the data URL."""
+        sha256 = hashlib.sha256()
+        for chunk in self.iter_data_url():
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def __str__(self):
+        return b''.join(self.iter_data_url()).decode('ascii')
+
+
+def encode_messages(messages):
+    """Copy of a message list with each ImagePayload replaced by its data URL string."""
+    encoded = []
+    for message in messages:
+        content = message['content']
+        if isinstance(content, list):
+            content = [
+                {**part, 'image_url': str(part['image_url'])}
+                if isinstance(part.get('image_url'), ImagePayload) else part
+                for part in content
+            ]
+        encoded.append({**message, 'content': content})
+    return encoded
+
+
+class OCRBackend:
+    """Base class for OCR backends."""
+
+    # Identifies the model in OCR cache keys
+    model = None
+
+    def __init__(self, options):
+        self.options = options
+
+    def complete(self, messages, response_format=None, usage=None) -> str:
+        """Return the full reply text for the messages."""
+        raise NotImplementedError
+
+    def stream(self, messages, response_format=None, usage=None) -> Iterator[str]:
+        """Yield the reply text in chunks. Defaults to one chunk."""
+        yield self.complete(messages, response_format=response_format, usage=usage)
+
+
+class MistralBackend(OCRBackend):
+    """Mistral chat completions with a vision model. The SDK is imported lazily."""
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.model = options.get('MODEL', 'pixtral-12b-2409')
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                from mistralai import Mistral
+
+                logger.info("Creating Mistral client")
+                self._client = Mistral(api_key=self.options.get('API_KEY') or os.getenv("MISTRAL_API_KEY"))
+        return self._client
+
+    @staticmethod
+    def _record_usage(usage, reported):
+        if usage is not None and reported is not None:
+            usage['prompt_tokens'] = reported.prompt_tokens
+            usage['completion_tokens'] = reported.completion_tokens
+
+    def complete(self, messages, response_format=None, usage=None) -> str:
+        response = self.client.chat.complete(
+            model=self.model,
+            messages=encode_messages(messages),
+            response_format=response_format
+        )
+        logger.info("Mistral API response received")
+        logger.debug(f"Response object: {response}")
+        self._record_usage(usage, response.usage)
+        return response.choices[0].message.content
+
+    def stream(self, messages, response_format=None, usage=None) -> Iterator[str]:
+        events = self.client.chat.stream(
+            model=self.model,
+            messages=encode_messages(messages),
+            response_format=response_format
+        )
+        for event in events:
+            # Usage arrives with the final event
+            self._record_usage(usage, event.data.usage)
+            choices = event.data.choices
+            if not choices:
+                continue
+            content = choices[0].delta.content
+            if isinstance(content, str):
+                yield content
+            elif content:
+                # Content can arrive as a list of typed chunks
+                yield ''.join(getattr(part, 'text', '') or '' for part in content)
+
+
+class ReplayBackend(OCRBackend):
+    """
+    Offline backend replaying recorded replies.
+
+    OPTIONS:
+        RESPONSES_DIR  directory of recorded replies (*.json / *.txt)
+        LATENCY        seconds before the reply (or first chunk) is returned
+        CHUNK_SIZE     characters per streamed chunk
+        CHUNK_DELAY    seconds between streamed chunks
+
+    A reply named after the SHA-256 of the image data URL sent to the model
+    is used when present; otherwise one is picked deterministically from that
+    hash. Without recordings an empty `{"drivers": []}` reply is returned.
+    """
+
+    model = 'replay'
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.latency = float(options.get('LATENCY', 0))
+        self.chunk_size = int(options.get('CHUNK_SIZE', 64))
+        self.chunk_delay = float(options.get('CHUNK_DELAY', 0))
+
+        self.responses = {}
+        responses_dir = options.get('RESPONSES_DIR')
+        if responses_dir:
+            for path in sorted(Path(responses_dir).iterdir()):
+                if path.suffix in ('.json', '.txt'):
+                    self.responses[path.stem] = path.read_text()
+
+    def _reply_for(self, messages) -> str:
+        image_url = next(
+            part['image_url']
+            for part in messages[0]['content']
+            if part['type'] == 'image_url'
+        )
+        if isinstance(image_url, ImagePayload):
+            key = image_url.digest()
+        else:
+            key = hashlib.sha256(image_url.encode()).hexdigest()
+
+        if key in self.responses:
+            return self.responses[key]
+        if self.responses:
+            names = sorted(self.responses)
+            return self.responses[names[int(key, 16) % len(names)]]
+        return json.dumps({"drivers": []})
+
+    def complete(self, messages, response_format=None, usage=None) -> str:
+        reply = self._reply_for(messages)
+        time.sleep(self.latency)
+        return reply
+
+    def stream(self, messages, response_format=None, usage=None) -> Iterator[str]:
+        reply = self._reply_for(messages)
+        time.sleep(self.latency)
+        for start in range(0, len(reply), self.chunk_size):
+            if start and self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield reply[start:start + self.chunk_size]
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def backend_class(name):
+    """The backend class registered as `name`, or at the dotted path `name`."""
+    path = OCR_BACKENDS.get(name, name)
+    if '.' not in path:
+        raise ImproperlyConfigured(
+            f"Unknown OCR backend {name!r}: use one of {', '.join(sorted(OCR_BACKENDS))} or a dotted path"
+        )
+    try:
+        return import_string(path)
+    except ImportError as e:
+        raise ImproperlyConfigured(f"Cannot import OCR backend {name!r}: {e}")
+
+
+def get_backend() -> OCRBackend:
+    """Return the configured OCR backend, building it on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = settings.OCR_BACKEND
+            _backend = backend_class(config['NAME'])(config.get('OPTIONS', {}))
+            logger.info(f"OCR backend: {config['NAME']} (model={_backend.model})")
+    return _backend
+
+
+@receiver(setting_changed)
+def _reset_backend(setting, **kwargs):
+    global _backend
+    if setting == 'OCR_BACKEND':
+        with _backend_lock:
+            _backend = None
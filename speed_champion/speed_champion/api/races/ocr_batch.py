@@ -0,0 +1,50 @@
+"""
+Concurrent OCR over a batch of timing-sheet images.
+
+Every image of a session is extracted on a bounded thread pool
+(OCR_BATCH_CONCURRENCY), so the batch takes about as long as its slowest
+image. Calls still go through the shared token bucket in ocr_ratelimit, and a
+failing image is reported in its own entry without failing the batch.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+from .ocr_parser import extract_race_data_from_image
+
+logger = logging.getLogger(__name__)
+
+
+def _extract_one(index, image):
+    try:
+        result = extract_race_data_from_image(image)
+        logger.info(f"Batch image {index} ({image.name}): {len(result.get('drivers', []))} drivers")
+        return {
+            "index": index,
+            "filename": image.name,
+            "status": "done",
+            "result": result
+        }
+    except Exception as e:
+        logger.error(f"Batch image {index} ({image.name}) failed: {e}", exc_info=True)
+        return {
+            "index": index,
+            "filename": image.name,
+            "status": "failed",
+            "error": str(e)
+        }
+    finally:
+        # The pool only lives for this batch: close the thread's connection
+        # rather than leave it open until CONN_MAX_AGE
+        connection.close()
+
+
+def extract_race_data_from_images(images):
+    """Run OCR on several images concurrently. Returns one entry per image, in order."""
+    if not images:
+        return []
+
+    workers = min(settings.OCR_BATCH_CONCURRENCY, len(images))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr-batch') as pool:
+        futures = [pool.submit(_extract_one, index, image) for index, image in enumerate(images)]
+        return [future.result() for future in futures]
@@ -0,0 +1,104 @@
+"""
+Persistent OCR result cache.
+
+Results are keyed by the SHA-256 of the uploaded image bytes plus the OCR model
+and prompt version, so re-uploading the same timing sheet after a failed save
+returns immediately without another API call. The table is bounded: entries
+older than OCR_CACHE_TTL_DAYS expire and the least recently used entries are
+evicted beyond OCR_CACHE_MAX_ENTRIES.
+"""
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+from .models import OCRCacheEntry
+
+logger = logging.getLogger(__name__)
+
+_stats_lock = threading.Lock()
+cache_stats = {'hits': 0, 'misses': 0}
+
+
+def image_digest(image_bytes):
+    """Return the hex SHA-256 of the image bytes."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _record(outcome):
+    with _stats_lock:
+        cache_stats[outcome] += 1
+        return dict(cache_stats)
+
+
+def _expiry_cutoff():
+    return timezone.now() - timedelta(days=settings.OCR_CACHE_TTL_DAYS)
+
+
+def get_cached_result(digest, model, prompt_version):
+    """Return the cached OCR result for this key, or None on a miss."""
+    if not settings.OCR_CACHE_ENABLED:
+        return None
+
+    entries = OCRCacheEntry.objects.filter(
+        image_sha256=digest,
+        model=model,
+        prompt_version=prompt_version,
+        created_at__gte=_expiry_cutoff()
+    )
+    try:
+        entry = entries.only('id', 'result').first()
+    except DatabaseError as e:
+        logger.warning(f"OCR cache lookup failed, treating as miss: {e}")
+        entry = None
+
+    if entry is None:
+        stats = _record('misses')
+        logger.info(f"OCR cache miss for {digest[:12]} (hits={stats['hits']}, misses={stats['misses']})")
+        return None
+
+    try:
+        entries.filter(id=entry.id).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    except DatabaseError as e:
+        logger.warning(f"OCR cache usage update failed: {e}")
+    stats = _record('hits')
+    logger.info(f"OCR cache hit for {digest[:12]} (hits={stats['hits']}, misses={stats['misses']})")
+    return entry.result
+
+
+def store_result(digest, model, prompt_version, result):
+    """Cache a successful OCR result and enforce the size and age bounds."""
+    if not settings.OCR_CACHE_ENABLED:
+        return
+
+    # The cache is best-effort: a failed write must never fail the OCR request
+    try:
+        OCRCacheEntry.objects.update_or_create(
+            image_sha256=digest,
+            model=model,
+            prompt_version=prompt_version,
+            defaults={'result': result, 'last_used_at': timezone.now()},
+            create_defaults={'result': result}
+        )
+        evict()
+    except DatabaseError as e:
+        logger.warning(f"OCR cache write failed: {e}")
+
+
+def evict():
+    """Drop expired entries, then least recently used ones beyond the size bound."""
+    expired, _ = OCRCacheEntry.objects.filter(created_at__lt=_expiry_cutoff()).delete()
+
+    overflow_ids = list(
+        OCRCacheEntry.objects.order_by('-last_used_at')
+        .values_list('id', flat=True)[settings.OCR_CACHE_MAX_ENTRIES:]
+    )
+    evicted = 0
+    if overflow_ids:
+        evicted, _ = OCRCacheEntry.objects.filter(id__in=overflow_ids).delete()
+
+    if expired or evicted:
+        logger.info(f"OCR cache eviction: {expired} expired, {evicted} least recently used")
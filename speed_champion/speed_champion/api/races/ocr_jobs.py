@@ -0,0 +1,158 @@
+"""
+Asynchronous OCR jobs.
+
+Uploads are stored as OCRJob rows and extracted outside the request cycle so a
+slow OCR round-trip never ties up a Gunicorn worker. How jobs run is chosen by
+settings.OCR_JOB_EXECUTOR:
+
+- 'thread': a bounded, process-local thread pool (OCR_JOB_WORKERS threads)
+- 'worker': jobs stay pending until `manage.py run_ocr_worker` picks them up
+- 'eager':  run inline when the job is committed (tests, debugging)
+
+The extraction callable is settings.OCR_JOB_EXTRACTOR, so a different
+extractor can be plugged in without touching the queue.
+
+A job's updated_at is its lease. A restart or deploy loses the jobs held in a
+process's thread pool, so jobs left pending or running past
+OCR_JOB_LEASE_SECONDS are recovered (recover_stale_ocr_jobs) when a process's
+pool starts, on every run_ocr_worker poll and when a client polls a stale
+job: running jobs are re-queued, or failed once they were claimed
+OCR_JOB_MAX_ATTEMPTS times, and pending ones are dispatched again.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from datetime import timedelta
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import OCRJob
+from .uploads import store_upload
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide OCR thread pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            return _executor
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.OCR_JOB_WORKERS,
+            thread_name_prefix='ocr-job'
+        )
+    # A new pool means a new process: pick up the jobs a previous one lost
+    recover_stale_ocr_jobs()
+    return _executor
+
+
+def submit_ocr_job(image):
+    """Store an uploaded image as a pending job and schedule it. Returns the OCRJob."""
+    # The job points at the content-addressed copy instead of storing its own
+    sheet = store_upload(image)
+    job = OCRJob.objects.create(image=sheet.file.name)
+    logger.info(f"OCR job {job.id} created for {image.name}")
+    transaction.on_commit(lambda: dispatch_ocr_job(job.id))
+    return job
+
+
+def dispatch_ocr_job(job_id):
+    """Hand a committed job to the configured executor."""
+    mode = settings.OCR_JOB_EXECUTOR
+    if mode == 'eager':
+        run_ocr_job(job_id)
+    elif mode == 'thread':
+        get_executor().submit(_run_in_thread, job_id)
+    # 'worker': left pending for the run_ocr_worker management command
+
+
+def _run_in_thread(job_id):
+    try:
+        run_ocr_job(job_id)
+    finally:
+        # Pool threads own their DB connection; don't leak it between jobs
+        close_old_connections()
+
+
+def claim_ocr_job(job_id):
+    """Atomically move a pending job to running. Returns False if someone else took it."""
+    return OCRJob.objects.filter(id=job_id, status=OCRJob.STATUS_PENDING).update(
+        status=OCRJob.STATUS_RUNNING,
+        attempts=F('attempts') + 1,
+        updated_at=timezone.now()
+    ) == 1
+
+
+def is_stale(job):
+    """True for a pending or running job whose lease has expired."""
+    expired = timezone.now() - timedelta(seconds=settings.OCR_JOB_LEASE_SECONDS)
+    return job.status in (OCRJob.STATUS_PENDING, OCRJob.STATUS_RUNNING) and job.updated_at < expired
+
+
+def recover_stale_ocr_jobs():
+    """
+    Recover jobs whose lease expired: fail running jobs that used up their
+    attempts and re-queue the other running ones. When jobs run in process
+    threads, the re-queued jobs and pending jobs no pool started are
+    dispatched again. Returns the ids of the jobs put back in the queue.
+    """
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.OCR_JOB_LEASE_SECONDS)
+    abandoned = OCRJob.objects.filter(status=OCRJob.STATUS_RUNNING, updated_at__lt=expired)
+
+    failed = abandoned.filter(attempts__gte=settings.OCR_JOB_MAX_ATTEMPTS).update(
+        status=OCRJob.STATUS_FAILED,
+        error="OCR job was interrupted too many times.",
+        updated_at=now
+    )
+    job_ids = list(abandoned.values_list('id', flat=True))
+    OCRJob.objects.filter(id__in=job_ids, status=OCRJob.STATUS_RUNNING).update(
+        status=OCRJob.STATUS_PENDING,
+        updated_at=now
+    )
+    if failed or job_ids:
+        logger.warning(f"Recovered interrupted OCR jobs: {len(job_ids)} re-queued, {failed} failed")
+
+    # 'worker' picks pending jobs up by polling and 'eager' never leaves any
+    if settings.OCR_JOB_EXECUTOR == 'thread':
+        lost = list(
+            OCRJob.objects.filter(status=OCRJob.STATUS_PENDING, updated_at__lt=expired)
+            .values_list('id', flat=True)
+        )
+        # Renew their lease so the next recovery does not queue them twice
+        OCRJob.objects.filter(id__in=lost, status=OCRJob.STATUS_PENDING).update(updated_at=now)
+        job_ids += lost
+        for job_id in job_ids:
+            get_executor().submit(_run_in_thread, job_id)
+
+    return job_ids
+
+
+def run_ocr_job(job_id):
+    """Claim and run a single job, storing the parsed result or the error."""
+    if not claim_ocr_job(job_id):
+        logger.info(f"OCR job {job_id} already claimed, skipping")
+        return
+
+    job = OCRJob.objects.get(id=job_id)
+    extract = import_string(settings.OCR_JOB_EXTRACTOR)
+    logger.info(f"OCR job {job.id} started")
+
+    try:
+        with job.image.open('rb') as image:
+            job.result = extract(image)
+        job.status = OCRJob.STATUS_DONE
+        logger.info(f"OCR job {job.id} done: {len(job.result.get('drivers', []))} drivers")
+    except Exception as e:
+        job.status = OCRJob.STATUS_FAILED
+        job.error = str(e)
+        logger.error(f"OCR job {job.id} failed: {e}", exc_info=True)
+
+    job.save(update_fields=['status', 'result', 'error', 'updated_at'])
+    return job
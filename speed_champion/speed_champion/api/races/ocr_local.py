@@ -0,0 +1,516 @@
+"""
+Local template-matching OCR for registered timing-sheet layouts.
+
+Our circuits print their timing sheets from the same software, in the same
+fixed font, every time. For a registered layout the sheet is read on the box
+itself, without a network round-trip:
+
+1. the image is binarized (Otsu) and the table grid is found with the
+   projection profiles of ocr_tiling.find_bands()
+2. the sheet is rescaled once so a table row is GLYPH_SIZE high; every cell is
+   split into glyphs at blank pixel columns, each keeping the full row height
+3. all glyphs of the sheet are classified at once by normalized correlation
+   against the layout's templates (one matrix product)
+
+The result has the same shape as extract_race_data_from_image(). Any glyph
+that matches no template clearly enough makes the layout decline the sheet,
+and the caller falls back to the remote model. Layouts are learned from sample
+sheets and their correct readings with `manage.py register_sheet_layout`.
+
+A layout directory holds:
+
+- layout.json: {"crop": [left, top, right, bottom] fractions or null,
+                "header_rows": rows above the first lap,
+                "summary_rows": e.g. ["fastest_lap", "average_lap"],
+                "space_factor": word gap as a fraction of the row height}
+- glyphs.npz:  the characters and their templates
+"""
+import json
+import logging
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from PIL import Image, ImageOps, UnidentifiedImageError
+from .image_preprocessing import open_image
+from .ocr_tiling import find_bands
+
+logger = logging.getLogger(__name__)
+
+# Width and height every glyph is normalized to; the sheet is scaled so a row is this high
+GLYPH_SIZE = (20, 32)
+
+# Minimum correlation for a glyph to count as recognized
+MIN_GLYPH_SCORE = 0.92
+
+# Minimum lead of the best template over the runner-up (S vs 8, O vs 0)
+MIN_GLYPH_MARGIN = 0.03
+
+# A gap wider than this fraction of the row height separates words, unless
+# the layout learned its own threshold from the samples
+SPACE_FACTOR = 0.2
+
+# A pixel row/column inked over this fraction of the cell is a ruled line
+CELL_RULE_FRACTION = 0.9
+
+# Column runs with fewer inked pixels than this are specks, not glyphs
+MIN_GLYPH_INK = 5
+
+# Fraction of each column's width ignored when locating rows (ruled lines)
+COLUMN_MARGIN = 0.1
+
+# Row bands are much thinner than columns; see find_bands()
+MIN_ROW_FRACTION = 0.005
+MIN_ROW_GUTTER_FRACTION = 0.002
+
+TIME_PATTERN = re.compile(r'^\d+:\d{2}\.\d{3}$')
+
+# Characters of lap numbers and times. Cells below the header rows are read
+# with these only, so letter look-alikes such as O/0 cannot compete there;
+# header cells are told apart by their row and may contain any character
+# (e.g. "Kart 12")
+TIME_CHARS = frozenset('0123456789:.-')
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """Grayscale level separating ink from paper (Otsu's method)."""
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weights = np.cumsum(histogram)
+    means = np.cumsum(histogram * np.arange(256))
+    total, total_mean = weights[-1], means[-1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (total_mean * weights - means * total) ** 2 / (weights * (total - weights))
+    return int(np.nanargmax(between))
+
+
+class SheetImage:
+    """
+    A decoded sheet. The ink mask drives segmentation; glyphs are matched on
+    the grayscale darkness, which keeps thin strokes that binarization loses.
+    """
+
+    def __init__(self, darkness: np.ndarray, ink: np.ndarray):
+        self.darkness = darkness
+        self.ink = ink
+
+    @classmethod
+    def from_gray(cls, gray: np.ndarray):
+        return cls(1 - gray.astype(np.float32) / 255, gray <= otsu_threshold(gray))
+
+    def resized(self, factor):
+        """
+        Rescale the sheet. The mask is resampled on its own: thresholding the
+        resampled darkness would turn half-covered ruled lines into speckles.
+        """
+        height, width = self.darkness.shape
+        size = (max(1, round(width * factor)), max(1, round(height * factor)))
+        darkness = Image.fromarray(self.darkness).resize(size, Image.Resampling.BILINEAR)
+        ink = Image.fromarray(self.ink.astype(np.float32)).resize(size, Image.Resampling.BILINEAR)
+        return SheetImage(np.asarray(darkness), np.asarray(ink) >= 0.5)
+
+    def cell(self, rows, columns):
+        """(darkness, ink) of the cell spanning the (top, bottom) and (left, right) bands."""
+        (top, bottom), (left, right) = rows, columns
+        return self.darkness[top:bottom, left:right], self.ink[top:bottom, left:right]
+
+
+def load_sheet(image, crop=None) -> Optional[SheetImage]:
+    """
+    Decode, orient and downscale a sheet (bytes or file path), optionally
+    cropped to the table.
+    """
+    max_dimension = settings.OCR_IMAGE_MAX_DIMENSION
+    try:
+        img = open_image(image)
+        img.draft('L', (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img).convert('L')
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning(f"Could not decode image for local OCR: {e}")
+        return None
+
+    img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+    if crop:
+        left, top, right, bottom = crop
+        img = img.crop((
+            round(left * img.width), round(top * img.height),
+            round(right * img.width), round(bottom * img.height)
+        ))
+
+    return SheetImage.from_gray(np.asarray(img))
+
+
+def segment_grid(ink):
+    """Return the (columns, rows) pixel ranges of the table."""
+    columns = find_bands(ink, axis=0)
+    if not columns:
+        return [], []
+
+    # Locate rows on the column interiors only, so vertical rules don't hide gutters
+    interiors = []
+    for left, right in columns:
+        margin = int((right - left) * COLUMN_MARGIN)
+        interiors.append(ink[:, left + margin:right - margin])
+    rows = find_bands(
+        np.hstack(interiors),
+        axis=1,
+        min_band=MIN_ROW_FRACTION,
+        min_gutter=MIN_ROW_GUTTER_FRACTION
+    )
+    return columns, rows
+
+
+def fit_sheet(sheet: SheetImage):
+    """
+    Rescale the sheet so its median row is GLYPH_SIZE high. Returns the sheet
+    with its (columns, rows); glyphs then need no per-glyph resampling.
+    """
+    columns, rows = segment_grid(sheet.ink)
+    if not rows:
+        return sheet, columns, rows
+
+    factor = GLYPH_SIZE[1] / np.median([bottom - top for top, bottom in rows])
+    if abs(factor - 1) > 0.05:
+        sheet = sheet.resized(factor)
+        columns, rows = segment_grid(sheet.ink)
+    return sheet, columns, rows
+
+
+def _strip_rules(darkness, ink):
+    """Drop ruled-line pixel rows and columns from a cell."""
+    if not ink.size:
+        return darkness, ink
+    keep_rows = ink.mean(axis=1) <= CELL_RULE_FRACTION
+    keep_columns = ink.mean(axis=0) <= CELL_RULE_FRACTION
+    return darkness[keep_rows][:, keep_columns], ink[keep_rows][:, keep_columns]
+
+
+def _glyph_runs(darkness, ink):
+    """
+    Strip ruled lines from a cell. Returns its darkness and the (start, end)
+    of each inked column run, widened by a pixel for anti-aliased edges.
+    """
+    darkness, ink = _strip_rules(darkness, ink)
+    if not ink.any():
+        return darkness, []
+
+    column_ink = ink.sum(axis=0)
+    padded = np.concatenate(([False], column_ink > 0, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return darkness, [
+        (max(0, start - 1), min(ink.shape[1], end + 1))
+        for start, end in zip(edges[::2], edges[1::2])
+        if column_ink[start:end].sum() >= MIN_GLYPH_INK
+    ]
+
+
+def segment_glyphs(darkness, ink, space_factor=SPACE_FACTOR) -> List[Optional[np.ndarray]]:
+    """
+    Split a cell into glyph crops, left to right. None marks a space between
+    words. An empty cell gives an empty list.
+    """
+    darkness, runs = _glyph_runs(darkness, ink)
+
+    # Glyphs keep the full row height, so '.', ':' and '-' stay distinct and
+    # letters with and without descenders line up alike
+    space = space_factor * darkness.shape[0]
+
+    glyphs = []
+    previous_end = None
+    for start, end in runs:
+        if previous_end is not None and start - previous_end > space:
+            glyphs.append(None)
+        glyphs.append(darkness[:, start:end])
+        previous_end = end
+    return glyphs
+
+
+def glyph_vectors(glyphs: List[np.ndarray]) -> np.ndarray:
+    """
+    Centre the glyph crops in GLYPH_SIZE boxes and return them as zero-mean
+    unit vectors, one row per glyph.
+    """
+    width, height = GLYPH_SIZE
+    batch = np.zeros((len(glyphs), height + 2, width + 2), dtype=np.float32)
+
+    for index, glyph in enumerate(glyphs):
+        if glyph.shape[1] > width:
+            # Only unusually wide glyphs are resampled
+            glyph = np.asarray(Image.fromarray(glyph).resize((width, glyph.shape[0]), Image.Resampling.BILINEAR))
+        top = max(0, (glyph.shape[0] - height) // 2)
+        glyph = glyph[top:top + height]
+
+        row = 1 + (height - glyph.shape[0]) // 2
+        column = 1 + (width - glyph.shape[1]) // 2
+        batch[index, row:row + glyph.shape[0], column:column + glyph.shape[1]] = glyph
+
+    # A [1 2 1] blur makes thin strokes tolerant to one-pixel shifts
+    batch = (batch[:, :, :-2] + 2 * batch[:, :, 1:-1] + batch[:, :, 2:]) / 4
+    batch = (batch[:, :-2] + 2 * batch[:, 1:-1] + batch[:, 2:]) / 4
+
+    vectors = batch.reshape(len(glyphs), -1)
+    vectors -= vectors.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms, norms, 1)
+
+
+class SheetLayout:
+    """A registered timing-sheet layout: grid settings plus glyph templates."""
+
+    def __init__(self, name, config, chars, templates):
+        self.name = name
+        self.crop = config.get('crop')
+        self.header_rows = config.get('header_rows', 1)
+        self.summary_rows = config.get('summary_rows', ['fastest_lap', 'average_lap'])
+        self.space_factor = config.get('space_factor', SPACE_FACTOR)
+        self.chars = list(chars)
+        self.templates = np.asarray(templates, dtype=np.float32)
+
+    @property
+    def config(self):
+        return {
+            'crop': self.crop,
+            'header_rows': self.header_rows,
+            'summary_rows': self.summary_rows,
+            'space_factor': self.space_factor,
+        }
+
+    @classmethod
+    def load(cls, path: Path):
+        config = json.loads((path / 'layout.json').read_text())
+        glyphs = np.load(path / 'glyphs.npz')
+        return cls(path.name, config, glyphs['chars'], glyphs['templates'])
+
+    def save(self, path: Path):
+        path.mkdir(parents=True, exist_ok=True)
+        (path / 'layout.json').write_text(json.dumps(self.config, indent=2))
+        np.savez(path / 'glyphs.npz', chars=np.array(self.chars), templates=self.templates)
+
+    def read_grid(self, sheet: SheetImage, columns, rows) -> List[List[Optional[str]]]:
+        """
+        Read the text of every cell, scoring all glyphs of the sheet in one
+        matrix product. Header cells are read with every known character,
+        all others with TIME_CHARS. A cell with a glyph that is not clearly recognized
+        reads as None.
+        """
+        # Each cell is a list of indexes into crops, None for spaces
+        cells, crops, in_header = [], [], []
+        for number, row in enumerate(rows):
+            for column in columns:
+                cell = []
+                for glyph in segment_glyphs(*sheet.cell(row, column), self.space_factor):
+                    if glyph is None:
+                        cell.append(None)
+                    else:
+                        cell.append(len(crops))
+                        crops.append(glyph)
+                        in_header.append(number < self.header_rows)
+                cells.append(cell)
+
+        texts = [''] * len(cells)
+        if crops:
+            is_time_char = np.array([char in TIME_CHARS for char in self.chars])
+            allowed = np.array(in_header)[:, None] | is_time_char[None, :]
+            scores = np.where(allowed, glyph_vectors(crops) @ self.templates.T, -1)
+            best = scores.argmax(axis=1)
+            if len(self.chars) > 1:
+                runner_up, top = np.partition(scores, -2, axis=1)[:, -2:].T
+            else:
+                runner_up, top = np.full(len(best), -1), scores[:, 0]
+            recognized = (top >= MIN_GLYPH_SCORE) & (top - runner_up >= MIN_GLYPH_MARGIN)
+
+            for number, cell in enumerate(cells):
+                if all(recognized[index] for index in cell if index is not None):
+                    texts[number] = ''.join(' ' if index is None else self.chars[best[index]] for index in cell)
+                else:
+                    texts[number] = None
+
+        return [texts[start:start + len(columns)] for start in range(0, len(texts), len(columns))]
+
+    def read(self, sheet: SheetImage) -> Optional[Dict]:
+        """Read a sheet into the OCR result format, or None if it does not fit the layout."""
+        sheet, columns, rows = fit_sheet(sheet)
+        if len(columns) < 2 or len(rows) <= self.header_rows:
+            return None
+
+        grid = self.read_grid(sheet, columns, rows)
+
+        names = grid[self.header_rows - 1][1:]
+        if any(not name for name in names):
+            return None
+
+        lap_rows, summary = [], {}
+        for row in range(self.header_rows, len(rows)):
+            label = (grid[row][0] or '').replace(' ', '')
+            if label.isdigit() and not summary:
+                lap_rows.append((row, int(label)))
+            elif len(summary) < len(self.summary_rows):
+                summary[self.summary_rows[len(summary)]] = row
+
+        if not lap_rows:
+            return None
+
+        drivers = []
+        for column, name in enumerate(names, start=1):
+            laps = []
+            for row, lap_number in lap_rows:
+                text = grid[row][column]
+                if text is None:
+                    return None
+                # Only names contain spaces; wide gaps around narrow digits are not words
+                text = text.replace(' ', '')
+                if text in ('', '-'):
+                    break
+                if not TIME_PATTERN.match(text):
+                    return None
+                laps.append({"lap_number": lap_number, "lap_time": text})
+
+            driver = {"name": name.strip(), "laps": laps, "fastest_lap": None, "average_lap": None}
+            for field, row in summary.items():
+                text = (grid[row][column] or '').replace(' ', '')
+                if TIME_PATTERN.match(text):
+                    driver[field] = text
+            drivers.append(driver)
+
+        return {"drivers": drivers}
+
+
+def cell_texts(layout: SheetLayout, result: Dict, rows: int) -> Dict:
+    """Map (row, column) grid positions to the text a correct reading has there."""
+    texts = {}
+    header = layout.header_rows - 1
+    for column, driver in enumerate(result['drivers'], start=1):
+        texts[(header, column)] = driver['name']
+        for lap in driver['laps']:
+            row = header + lap['lap_number']
+            texts[(row, 0)] = str(lap['lap_number'])
+            texts[(row, column)] = lap['lap_time']
+
+    lap_count = max((len(driver['laps']) for driver in result['drivers']), default=0)
+    for offset, field in enumerate(layout.summary_rows):
+        row = layout.header_rows + lap_count + offset
+        if row < rows:
+            for column, driver in enumerate(result['drivers'], start=1):
+                if driver.get(field):
+                    texts[(row, column)] = driver[field]
+    return texts
+
+
+def learn_layout(name, sheets, config: Dict) -> SheetLayout:
+    """
+    Build a layout from sample sheets, given as (image_bytes, correct result)
+    pairs. Each cell whose glyph count matches its expected text contributes
+    its glyphs; a character's template is the mean of its samples. More sheets
+    mean more letters of driver names are known.
+    """
+    layout = SheetLayout(name, config, [], np.zeros((0, GLYPH_SIZE[0] * GLYPH_SIZE[1])))
+
+    samples = {}
+    letter_gaps, word_gaps = [], []
+    for number, (image_bytes, result) in enumerate(sheets, start=1):
+        sheet = load_sheet(image_bytes, layout.crop)
+        if sheet is None:
+            raise ValueError(f"Sample {number} could not be decoded")
+
+        sheet, columns, rows = fit_sheet(sheet)
+        if len(columns) != len(result['drivers']) + 1:
+            raise ValueError(f"Sample {number}: found {len(columns)} columns for {len(result['drivers'])} drivers")
+
+        for (row, column), text in cell_texts(layout, result, len(rows)).items():
+            if row >= len(rows):
+                continue
+            darkness, runs = _glyph_runs(*sheet.cell(rows[row], columns[column]))
+            chars = text.replace(' ', '')
+            if len(runs) != len(chars):
+                logger.info(f"Sample {number}: skipping cell {row},{column} ({text!r}), {len(runs)} glyphs for {len(chars)} characters")
+                continue
+
+            for char, (start, end) in zip(chars, runs):
+                samples.setdefault(char, []).append(darkness[:, start:end])
+
+            # Only names have words; digit gaps in proportional fonts would blur the threshold
+            if not any(char.isalpha() for char in chars):
+                continue
+
+            # Gap i sits between glyphs i and i + 1; it is a word gap when a space follows glyph i
+            word_gap_indexes = {len(text[:index].replace(' ', '')) - 1 for index, char in enumerate(text) if char == ' '}
+            for index, ((_, end), (start, _)) in enumerate(zip(runs, runs[1:])):
+                gap = (start - end) / darkness.shape[0]
+                (word_gaps if index in word_gap_indexes else letter_gaps).append(gap)
+
+    if not samples:
+        raise ValueError("No cell of the samples matched its expected text")
+
+    # Split word and letter gaps halfway when the samples have both
+    if word_gaps and letter_gaps and min(word_gaps) > max(letter_gaps):
+        layout.space_factor = (min(word_gaps) + max(letter_gaps)) / 2
+
+    chars = sorted(samples)
+    templates = []
+    for char in chars:
+        template = glyph_vectors(samples[char]).mean(axis=0)
+        templates.append(template / np.linalg.norm(template))
+
+    layout.chars = chars
+    layout.templates = np.asarray(templates, dtype=np.float32)
+    return layout
+
+
+_layouts = None
+_layouts_lock = threading.Lock()
+
+
+def get_layouts() -> List[SheetLayout]:
+    """Return the registered layouts, loading them on first use."""
+    global _layouts
+    with _layouts_lock:
+        if _layouts is None:
+            _layouts = []
+            layouts_dir = Path(settings.OCR_LOCAL_LAYOUTS_DIR)
+            if layouts_dir.is_dir():
+                for path in sorted(layouts_dir.iterdir()):
+                    if (path / 'layout.json').exists():
+                        _layouts.append(SheetLayout.load(path))
+            logger.info(f"Loaded {len(_layouts)} local OCR layouts")
+    return _layouts
+
+
+@receiver(setting_changed)
+def _reset_layouts(setting, **kwargs):
+    global _layouts
+    if setting == 'OCR_LOCAL_LAYOUTS_DIR':
+        with _layouts_lock:
+            _layouts = None
+
+
+def extract_race_data_locally(image) -> Optional[Dict]:
+    """Read the sheet with the first registered layout that accepts it, or return None."""
+    layouts = get_layouts()
+    if not layouts:
+        return None
+
+    started = time.perf_counter()
+    sheets = {}
+    for layout in layouts:
+        crop = tuple(layout.crop) if layout.crop else None
+        if crop not in sheets:
+            sheets[crop] = load_sheet(image, crop)
+        if sheets[crop] is None:
+            return None
+
+        result = layout.read(sheets[crop])
+        if result:
+            logger.info(
+                f"Local OCR read {len(result['drivers'])} drivers with layout '{layout.name}' "
+                f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+            )
+            return result
+
+    logger.info(f"No local OCR layout matched ({(time.perf_counter() - started) * 1000:.0f}ms)")
+    return None
@@ -1,143 +1,97 @@
 import re
-import os
-import base64
 import json
 import logging
+import time
+from pathlib import Path
 from typing import Dict
-from datetime import timedelta
-from mistralai import Mistral
+from django.conf import settings
+from .drafts import attach_draft
+from .ocr_backends import ImagePayload, get_backend
+from .ocr_cache import image_digest, get_cached_result, store_result
+from .ocr_prompts import get_prompt, get_verify_prompt
+from .ocr_ratelimit import get_rate_limiter
+from .uploads import store_upload
 
 logger = logging.getLogger(__name__)
 
-client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
 
+class OCRRateLimitError(Exception):
+    pass
 
-def parse_time_to_duration(time_str: str) -> timedelta:
-    """Convert time string (e.g. '0:36.776') to timedelta."""
-    try:
-        time_str = time_str.strip().replace(' ', '')
-        match = re.match(r'(\d+):(\d+)\.(\d+)', time_str)
-        if match:
-            minutes = int(match.group(1))
-            seconds = int(match.group(2))
-            milliseconds = int(match.group(3))
-            return timedelta(minutes=minutes, seconds=seconds, milliseconds=milliseconds)
-    except Exception:
-        pass
-    return None
-
-
-def extract_race_data_from_image(image_file) -> Dict:
+
+RATE_LIMIT_MESSAGE = "Rate limit exceeded. Please wait a few minutes before trying again."
+
+
+def read_image(image_file):
     """
-    Extract race data from image using Mistral OCR.
+    Read an image to OCR. Returns (image, sha256 digest).
 
-    Returns dict with drivers list containing name, laps, fastest and average lap times.
+    Uploads (anything with chunks()) are streamed to content-addressed storage
+    and returned as the stored file's Path; in-memory files such as tiles are
+    returned as bytes.
     """
-    logger.info("Reading and encoding image...")
-    # Read and encode image
+    if hasattr(image_file, 'chunks'):
+        sheet = store_upload(image_file)
+        logger.info(f"Image size: {sheet.size / 1024:.2f} KB")
+        return Path(sheet.file.path), sheet.sha256
+
     image_file.seek(0)
     image_bytes = image_file.read()
-    image_size_kb = len(image_bytes) / 1024
-    logger.info(f"Image size: {image_size_kb:.2f} KB")
-
-    base64_image = base64.b64encode(image_bytes).decode('utf-8')
-    logger.info(f"Base64 encoded image length: {len(base64_image)} chars")
-
-    # Prompt for Mistral
-    prompt = """
-    Extract race results from this karting timing sheet.
-
-    TABLE STRUCTURE:
-    - First column: Lap numbers (1, 2, 3, ...)
-    - Remaining columns: One column per driver with their lap times
-    - Header row: Driver names (e.g., Tiago, Gonçalo, Pedro Vil, Diogo, Mestre, Soham, Plata, Mota)
-    - Bottom section: "M. Volta" (fastest lap) and "Média" (average lap) for each driver
-
-    TIME FORMAT (CRITICAL - READ CAREFULLY):
-    Lap times can be in these formats:
-    - 0:36.776 (0 minutes, 36.776 seconds)
-    - 0:41.609 (0 minutes, 41.609 seconds)
-    - 1:23.456 (1 minute, 23.456 seconds)
-    - 01:23.456 (same as above - 1 minute, 23.456 seconds)
-    - 12:34.567 (12 minutes, 34.567 seconds)
-
-    ⚠️ CRITICAL TIME READING RULES:
-    1. Read ALL digits before the colon (:) - this is the MINUTES
-       - "0:41.609" = 0 minutes (NOT 1 minute!)
-       - "1:41.609" = 1 minute (NOT 0 minutes!)
-       - "01:41.609" = 1 minute (leading zero can be present or absent)
-    2. If the minutes digit is partially obscured or unclear, look at the context:
-       - Lap times are usually 35-50 seconds (0:35 to 0:50)
-       - Times over 1 minute are RARE but possible
-       - If you see "?:41.609" where ? is unclear, it's most likely "1:41.609" NOT "0:41.609"
-    3. Read ALL THREE digits after the decimal point (milliseconds)
-    4. NEVER truncate or drop leading digits
-
-    CRITICAL COLUMN ALIGNMENT RULES:
-    1. First, identify ALL driver names in the header row from left to right
-    2. For each row, read lap times STRICTLY in the same column order as the driver names
-    3. DO NOT mix up columns - lap time in column 2 belongs to driver in position 2, etc.
-    4. If a cell is EMPTY, BLANK, or contains a dash (-), DO NOT include that lap for that driver
-    5. STOP reading laps for a driver when you encounter an empty cell for that driver
-    6. NOT ALL DRIVERS complete the same number of laps - this is NORMAL and EXPECTED
-
-    EXAMPLE CORRECT READING:
-    Header: Tiago | Gonçalo | Rui
-    Row 1:  0:40.123 | 0:39.456  | 1:41.789  → Tiago lap 1 = 0:40.123, Gonçalo lap 1 = 0:39.456, Rui lap 1 = 1:41.789
-    Row 2:  0:39.876 | 0:38.901  | (empty)   → Tiago lap 2 = 0:39.876, Gonçalo lap 2 = 0:38.901, Rui has NO lap 2
-    Row 3:  (empty)  | 1:39.111  | (empty)   → Tiago has NO lap 3, Gonçalo lap 3 = 1:39.111, Rui has NO lap 3
-
-    FORBIDDEN ERRORS TO AVOID:
-    - ❌ DO NOT drop leading digits (1:41.609 becoming 0:41.609)
-    - ❌ DO NOT assign a time from column 5 to the driver in column 3
-    - ❌ DO NOT continue reading laps after encountering an empty cell for that driver
-    - ❌ DO NOT invent or duplicate lap times
-    - ❌ DO NOT skip drivers - include ALL drivers from the header row
-    - ❌ DO NOT truncate milliseconds (0:36.776 NOT 0:36.77)
-
-    Return ONLY valid JSON in this exact format:
-    {
-        "drivers": [
-            {
-                "name": "Driver Name",
-                "laps": [
-                    {"lap_number": 1, "lap_time": "0:36.776"},
-                    {"lap_number": 2, "lap_time": "1:23.854"}
-                ],
-                "fastest_lap": "0:35.703",
-                "average_lap": "0:36.323"
-            }
-        ]
-    }
-
-    No additional text, only JSON.
-    """
+    logger.info(f"Image size: {len(image_bytes) / 1024:.2f} KB")
+    return image_bytes, image_digest(image_bytes)
 
-    logger.info("Calling Mistral API with pixtral-12b-2409 model...")
 
-    result_text = None
-    try:
-        response = client.chat.complete(
-            model="pixtral-12b-2409",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": f"data:image/jpeg;base64,{base64_image}"}
-                    ]
-                }
+def build_messages(image, prompt):
+    """Preprocess the image into a chat message list; it is base64-encoded when sent."""
+    from .image_preprocessing import preprocess_image
+
+    image, mime_type = preprocess_image(image)
+
+    payload = ImagePayload(image, mime_type)
+    logger.info(f"Base64 encoded image length: {len(payload)} chars")
+
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": payload}
             ]
-        )
+        }
+    ]
 
-        logger.info("Mistral API response received")
-        logger.debug(f"Response object: {response}")
 
-        # Parse response
-        result_text = response.choices[0].message.content
-        logger.info(f"Raw response length: {len(result_text)} chars")
-        logger.debug(f"Raw response text: {result_text[:500]}...")
+def acquire_rate_limit():
+    """Wait for a token from the shared OCR rate limiter."""
+    if not get_rate_limiter().acquire(timeout=settings.OCR_RATE_LIMIT_TIMEOUT):
+        raise OCRRateLimitError(RATE_LIMIT_MESSAGE)
+
+
+def is_rate_limit_error(error):
+    """True for provider 429 / rate limit errors."""
+    return isinstance(error, OCRRateLimitError) or "429" in str(error) or "rate limit" in str(error).lower()
 
+
+def log_usage(backend, prompt, started, usage):
+    """Log token usage and latency of one OCR call."""
+    latency_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        f"OCR usage: model={backend.model} prompt=v{prompt.version} "
+        f"prompt_tokens={usage.get('prompt_tokens', 'n/a')} "
+        f"completion_tokens={usage.get('completion_tokens', 'n/a')} "
+        f"latency={latency_ms:.0f}ms"
+    )
+
+
+def parse_response_text(result_text, structured=False) -> Dict:
+    """
+    Parse the model's reply. Structured replies are plain JSON; free-text
+    replies have the JSON object extracted first.
+    """
+    logger.info(f"Raw response length: {len(result_text)} chars")
+    logger.debug(f"Raw response text: {result_text[:500]}...")
+
+    if not structured:
         # Extract JSON from response (in case there's extra text)
         json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
         if json_match:
@@ -146,11 +100,122 @@ def extract_race_data_from_image(image_file) -> Dict:
         else:
             logger.warning("No JSON pattern found in response, using raw text")
 
-        logger.info("Parsing JSON response...")
-        result = json.loads(result_text)
+    logger.info("Parsing JSON response...")
+    result = json.loads(result_text)
+
+    driver_count = len(result.get('drivers', []))
+    logger.info(f"Successfully parsed JSON: {driver_count} drivers found")
+
+    return result
+
+
+def correct_suspect_laps(result, image, backend) -> Dict:
+    """
+    Re-read the laps flagged by ocr_validation with one small follow-up call
+    over the affected drivers' columns and merge the corrections in place.
+    """
+    from .ocr_tiling import crop_driver_columns
+    from .ocr_validation import apply_corrections, find_suspect_laps
+
+    suspects = find_suspect_laps(result)
+    if not suspects:
+        return result
+    if len(suspects) > settings.OCR_VALIDATION_MAX_SUSPECTS:
+        logger.warning(f"Skipping re-read: {len(suspects)} suspect laps is more than a targeted re-read can fix")
+        return result
+
+    driver_indexes = sorted({suspect['driver_index'] for suspect in suspects})
+    crop = crop_driver_columns(image, driver_indexes, len(result['drivers']))
+
+    prompt = get_verify_prompt(suspects)
+    messages = build_messages(crop or image, prompt.text)
+
+    try:
+        acquire_rate_limit()
+
+        usage = {}
+        started = time.perf_counter()
+        reply = backend.complete(messages, response_format=prompt.response_format, usage=usage)
+        log_usage(backend, prompt, started, usage)
+
+        corrections = parse_response_text(reply, structured=prompt.structured).get('corrections', [])
+    except Exception as e:
+        # The first reading is still usable; never fail the extraction here
+        logger.warning(f"Re-reading suspect laps failed, keeping first reading: {e}")
+        return result
+
+    changed = apply_corrections(result, suspects, corrections)
+    logger.info(f"Re-read {len(suspects)} suspect laps, {changed} corrected")
+    return result
+
+
+def extract_race_data_from_image(image_file, tiling=None, local=None) -> Dict:
+    """
+    Extract race data from image using the configured OCR backend.
+
+    With local (default: settings.OCR_LOCAL_ENABLED) sheets matching a
+    registered layout are read on the box first, see ocr_local. With tiling
+    (default: settings.OCR_TILING_ENABLED) wide sheets are read as concurrent
+    column tiles, see ocr_tiling.
+
+    Returns dict with drivers list containing name, laps, fastest and average
+    lap times. Results of uploads are kept as drafts and also carry their
+    `image_sha256` and `draft_token`, see drafts.
+    """
+    image, digest = read_image(image_file)
+    result = _extract_race_data(image, digest, tiling, local)
+    if isinstance(image, Path):
+        result = attach_draft(result, digest)
+    return result
+
+
+def _extract_race_data(image, digest, tiling, local) -> Dict:
+    # The image pipeline pulls in numpy, Pillow and pillow_heif; importing it
+    # here keeps them out of app startup until the first sheet is read
+    from .ocr_local import extract_race_data_locally
+    from .ocr_tiling import extract_tiles, split_into_tiles
+
+    backend = get_backend()
+    prompt = get_prompt()
+
+    cached = get_cached_result(digest, backend.model, prompt.version)
+    if cached is not None:
+        return cached
+
+    if local is None:
+        local = settings.OCR_LOCAL_ENABLED
+    result = extract_race_data_locally(image) if local else None
+    if result:
+        return result
+
+    if tiling is None:
+        tiling = settings.OCR_TILING_ENABLED
+    tiles = split_into_tiles(image) if tiling else []
+    if tiles:
+        result = extract_tiles(tiles, lambda tile: extract_race_data_from_image(tile, tiling=False, local=False))
+        store_result(digest, backend.model, prompt.version, result)
+        return result
+
+    messages = build_messages(image, prompt.text)
+
+    logger.info(f"Calling OCR backend with {backend.model} model...")
+
+    result_text = None
+    try:
+        acquire_rate_limit()
+
+        usage = {}
+        started = time.perf_counter()
+        result_text = backend.complete(messages, response_format=prompt.response_format, usage=usage)
+        log_usage(backend, prompt, started, usage)
+
+        # Parse response
+        result = parse_response_text(result_text, structured=prompt.structured)
+
+        if settings.OCR_VALIDATION_ENABLED:
+            result = correct_suspect_laps(result, image, backend)
 
-        driver_count = len(result.get('drivers', []))
-        logger.info(f"Successfully parsed JSON: {driver_count} drivers found")
+        store_result(digest, backend.model, prompt.version, result)
 
         return result
 
@@ -161,9 +226,9 @@ def extract_race_data_from_image(image_file) -> Dict:
 
     except Exception as e:
         # Check for rate limit error
-        if "429" in str(e) or "rate limit" in str(e).lower():
-            logger.warning(f"Mistral API rate limit hit: {e}")
-            raise Exception("Rate limit exceeded. Please wait a few minutes before trying again.")
+        if is_rate_limit_error(e):
+            logger.warning(f"OCR API rate limit hit: {e}")
+            raise Exception(RATE_LIMIT_MESSAGE)
 
-        logger.error(f"Mistral API call failed: {e}", exc_info=True)
+        logger.error(f"OCR API call failed: {e}", exc_info=True)
         raise
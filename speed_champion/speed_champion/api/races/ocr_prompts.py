@@ -0,0 +1,206 @@
+"""
+Versioned OCR prompts.
+
+Every prompt has a version that is part of the OCR cache key, so editing a
+prompt means adding a new version rather than changing an existing one. The
+active version is settings.OCR_PROMPT_VERSION. get_verify_prompt() builds the
+follow-up prompt that re-reads suspect cells.
+
+- '1': the original free-text prompt; the JSON is scraped out of the reply
+- '2': a compact prompt sent with the provider's structured output mode and a
+       JSON schema matching DriverRaceDataSerializer, so the reply is parsed
+       as-is
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional
+from django.conf import settings
+
+
+@dataclass(frozen=True)
+class OCRPrompt:
+    version: str
+    text: str
+    # JSON schema the reply must follow; None for free-text replies
+    response_schema: Optional[Dict] = None
+
+    @property
+    def structured(self) -> bool:
+        return self.response_schema is not None
+
+    @property
+    def response_format(self) -> Optional[Dict]:
+        """Provider `response_format` constraining the reply to the schema."""
+        if not self.structured:
+            return None
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "race_results",
+                "schema": self.response_schema,
+                "strict": True,
+            },
+        }
+
+
+# Original prompt, kept so cached version 1 results stay meaningful
+VERBOSE_PROMPT = """
+    Extract race results from this karting timing sheet.
+
+    TABLE STRUCTURE:
+    - First column: Lap numbers (1, 2, 3, ...)
+    - Remaining columns: One column per driver with their lap times
+    - Header row: Driver names (e.g., Tiago, Gonçalo, Pedro Vil, Diogo, Mestre, Soham, Plata, Mota)
+    - Bottom section: "M. Volta" (fastest lap) and "Média" (average lap) for each driver
+
+    TIME FORMAT (CRITICAL - READ CAREFULLY):
+    Lap times can be in these formats:
+    - 0:36.776 (0 minutes, 36.776 seconds)
+    - 0:41.609 (0 minutes, 41.609 seconds)
+    - 1:23.456 (1 minute, 23.456 seconds)
+    - 01:23.456 (same as above - 1 minute, 23.456 seconds)
+    - 12:34.567 (12 minutes, 34.567 seconds)
+
+    ⚠️ CRITICAL TIME READING RULES:
+    1. Read ALL digits before the colon (:) - this is the MINUTES
+       - "0:41.609" = 0 minutes (NOT 1 minute!)
+       - "1:41.609" = 1 minute (NOT 0 minutes!)
+       - "01:41.609" = 1 minute (leading zero can be present or absent)
+    2. If the minutes digit is partially obscured or unclear, look at the context:
+       - Lap times are usually 35-50 seconds (0:35 to 0:50)
+       - Times over 1 minute are RARE but possible
+       - If you see "?:41.609" where ? is unclear, it's most likely "1:41.609" NOT "0:41.609"
+    3. Read ALL THREE digits after the decimal point (milliseconds)
+    4. NEVER truncate or drop leading digits
+
+    CRITICAL COLUMN ALIGNMENT RULES:
+    1. First, identify ALL driver names in the header row from left to right
+    2. For each row, read lap times STRICTLY in the same column order as the driver names
+    3. DO NOT mix up columns - lap time in column 2 belongs to driver in position 2, etc.
+    4. If a cell is EMPTY, BLANK, or contains a dash (-), DO NOT include that lap for that driver
+    5. STOP reading laps for a driver when you encounter an empty cell for that driver
+    6. NOT ALL DRIVERS complete the same number of laps - this is NORMAL and EXPECTED
+
+    EXAMPLE CORRECT READING:
+    Header: Tiago | Gonçalo | Rui
+    Row 1:  0:40.123 | 0:39.456  | 1:41.789  → Tiago lap 1 = 0:40.123, Gonçalo lap 1 = 0:39.456, Rui lap 1 = 1:41.789
+    Row 2:  0:39.876 | 0:38.901  | (empty)   → Tiago lap 2 = 0:39.876, Gonçalo lap 2 = 0:38.901, Rui has NO lap 2
+    Row 3:  (empty)  | 1:39.111  | (empty)   → Tiago has NO lap 3, Gonçalo lap 3 = 1:39.111, Rui has NO lap 3
+
+    FORBIDDEN ERRORS TO AVOID:
+    - ❌ DO NOT drop leading digits (1:41.609 becoming 0:41.609)
+    - ❌ DO NOT assign a time from column 5 to the driver in column 3
+    - ❌ DO NOT continue reading laps after encountering an empty cell for that driver
+    - ❌ DO NOT invent or duplicate lap times
+    - ❌ DO NOT skip drivers - include ALL drivers from the header row
+    - ❌ DO NOT truncate milliseconds (0:36.776 NOT 0:36.77)
+
+    Return ONLY valid JSON in this exact format:
+    {
+        "drivers": [
+            {
+                "name": "Driver Name",
+                "laps": [
+                    {"lap_number": 1, "lap_time": "0:36.776"},
+                    {"lap_number": 2, "lap_time": "1:23.854"}
+                ],
+                "fastest_lap": "0:35.703",
+                "average_lap": "0:36.323"
+            }
+        ]
+    }
+
+    No additional text, only JSON.
+    """
+
+COMPACT_PROMPT = """Read this karting timing sheet.
+Column 1 is the lap number; every other column is one driver, named in the header row.
+Times are M:SS.mmm (0:41.609, 1:23.456): keep every minute digit and all three millisecond digits.
+Laps are usually 0:35-0:50, so an unclear minute digit is more likely 1 than 0.
+Keep each time in its own driver's column. A driver's laps stop at their first empty or "-" cell.
+"M. Volta" is the fastest lap and "Média" the average lap.
+Include every driver and never invent laps.
+Answer with JSON: {"drivers": [{"name", "laps": [{"lap_number", "lap_time"}], "fastest_lap", "average_lap"}]}"""
+
+# Mirrors DriverRaceDataSerializer / LapTimeDataSerializer
+RACE_RESULTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "drivers": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "laps": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "lap_number": {"type": "integer"},
+                                "lap_time": {"type": "string"},
+                            },
+                            "required": ["lap_number", "lap_time"],
+                            "additionalProperties": False,
+                        },
+                    },
+                    "fastest_lap": {"type": ["string", "null"]},
+                    "average_lap": {"type": ["string", "null"]},
+                },
+                "required": ["name", "laps", "fastest_lap", "average_lap"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["drivers"],
+    "additionalProperties": False,
+}
+
+PROMPTS = {
+    '1': OCRPrompt(version='1', text=VERBOSE_PROMPT),
+    '2': OCRPrompt(version='2', text=COMPACT_PROMPT, response_schema=RACE_RESULTS_SCHEMA),
+}
+
+
+def get_prompt(version=None) -> OCRPrompt:
+    """Return the prompt for `version`, defaulting to settings.OCR_PROMPT_VERSION."""
+    return PROMPTS[version or settings.OCR_PROMPT_VERSION]
+
+
+# Follow-up prompt re-reading only the cells flagged by ocr_validation
+VERIFY_PROMPT = """This image shows the lap-number column of a karting timing sheet followed by the columns of: {drivers}.
+Re-read only these cells, carefully, digit by digit:
+{cells}
+Times are M:SS.mmm. Keep every minute digit (0:41.609 and 1:41.609 are different) and all three millisecond digits.
+Answer with JSON: {{"corrections": [{{"name", "lap_number", "lap_time"}}]}}"""
+
+CORRECTIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "corrections": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "lap_number": {"type": "integer"},
+                    "lap_time": {"type": "string"},
+                },
+                "required": ["name", "lap_number", "lap_time"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["corrections"],
+    "additionalProperties": False,
+}
+
+
+def get_verify_prompt(suspects) -> OCRPrompt:
+    """Build the follow-up prompt for the suspect cells (see ocr_validation)."""
+    names = list(dict.fromkeys(suspect['name'] for suspect in suspects))
+    cells = '\n'.join(f"- {suspect['name']}, lap {suspect['lap_number']}" for suspect in suspects)
+    return OCRPrompt(
+        version='verify',
+        text=VERIFY_PROMPT.format(drivers=', '.join(names), cells=cells),
+        response_schema=CORRECTIONS_SCHEMA
+    )
@@ -0,0 +1,85 @@
+"""
+Client-side rate limiting for the OCR provider.
+
+A process-wide token bucket is consulted before every OCR API call so that
+concurrent uploads (batches, job workers) stay under the provider's request
+rate instead of tripping its 429 responses. OCR_RATE_LIMIT_PER_SECOND = 0
+turns the limiting off.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("A token bucket needs a positive rate and a capacity of at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """Take one token, waiting up to `timeout` seconds. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class NoRateLimit:
+    """Stands in for the token bucket when rate limiting is off."""
+
+    def acquire(self, timeout=None):
+        return True
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide OCR token bucket built from settings."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            rate = settings.OCR_RATE_LIMIT_PER_SECOND
+            if rate <= 0:
+                _limiter = NoRateLimit()
+            elif settings.OCR_RATE_LIMIT_BURST < 1:
+                raise ImproperlyConfigured("OCR_RATE_LIMIT_BURST must be at least 1")
+            else:
+                _limiter = TokenBucket(rate=rate, capacity=settings.OCR_RATE_LIMIT_BURST)
+    return _limiter
+
+
+@receiver(setting_changed)
+def _reset_limiter(setting, **kwargs):
+    global _limiter
+    if setting in ('OCR_RATE_LIMIT_PER_SECOND', 'OCR_RATE_LIMIT_BURST'):
+        with _limiter_lock:
+            _limiter = None
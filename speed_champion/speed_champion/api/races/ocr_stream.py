@@ -0,0 +1,165 @@
+"""
+Streaming OCR extraction.
+
+The model's reply is consumed chunk by chunk through the OCR backend's
+streaming API and fed to an incremental JSON scanner, so every driver object is emitted as
+soon as its closing brace arrives instead of after the whole sheet is read.
+The view layer turns these events into Server-Sent Events.
+"""
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+from django.conf import settings
+from .drafts import attach_draft
+from .ocr_backends import get_backend
+from .ocr_cache import get_cached_result, store_result
+from .ocr_parser import (
+    RATE_LIMIT_MESSAGE,
+    acquire_rate_limit,
+    build_messages,
+    is_rate_limit_error,
+    log_usage,
+    parse_response_text,
+    read_image,
+)
+from .ocr_prompts import get_prompt
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalDriverParser:
+    """
+    Incremental scanner for the `{"drivers": [{...}, ...]}` reply format.
+
+    feed() accepts arbitrary text chunks and returns the driver objects that
+    became complete, i.e. objects nested directly inside the root object's
+    array. String literals and escapes are tracked so braces inside names do
+    not confuse the scanner.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._length = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+
+    def feed(self, chunk: str) -> List[Dict]:
+        completed = []
+
+        for char in chunk:
+            position = self._length
+            self._buffer.append(char)
+            self._length += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"' and self._stack:
+                self._in_string = True
+            elif char in '{[':
+                if char == '{' and self._stack == ['{', '[']:
+                    self._object_start = position
+                self._stack.append(char)
+            elif char in '}]' and self._stack:
+                self._stack.pop()
+                if char == '}' and self._stack == ['{', '['] and self._object_start is not None:
+                    text = ''.join(self._buffer[self._object_start:])
+                    self._object_start = None
+                    try:
+                        completed.append(json.loads(text))
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"Skipping malformed driver object in stream: {e}")
+
+        return completed
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        return ''.join(self._buffer)
+
+
+def stream_drivers(chunks: Iterable[str], structured=False) -> Iterator[Tuple[str, Dict]]:
+    """
+    Turn a stream of reply text chunks into ('driver', data) events.
+
+    Ends with a ('done', result) event carrying the fully parsed reply. Any
+    iterable of strings works, so a local fake stream can stand in for the
+    OCR provider.
+    """
+    parser = IncrementalDriverParser()
+
+    for chunk in chunks:
+        for driver in parser.feed(chunk):
+            yield 'driver', driver
+
+    yield 'done', parse_response_text(parser.text, structured=structured)
+
+
+def stream_race_data_from_image(image_file, chunks=None) -> Iterator[Tuple[str, Dict]]:
+    """
+    Stream OCR extraction events for an uploaded image.
+
+    Yields ('driver', data) for each driver as it is read and a final
+    ('done', result). Cached results and sheets read by the local engine are
+    replayed immediately. `chunks` replaces the backend stream (e.g. with a
+    recorded reply) when given. As with extract_race_data_from_image(), the
+    result of an upload is kept as a draft and carries its `draft_token`.
+    """
+    backend = get_backend()
+    prompt = get_prompt()
+    image, digest = read_image(image_file)
+
+    def finish(result):
+        return attach_draft(result, digest) if isinstance(image, Path) else result
+
+    cached = get_cached_result(digest, backend.model, prompt.version)
+    if cached is None and settings.OCR_LOCAL_ENABLED:
+        from .ocr_local import extract_race_data_locally
+        cached = extract_race_data_locally(image)
+    if cached is not None:
+        for driver in cached.get('drivers', []):
+            yield 'driver', driver
+        yield 'done', finish(cached)
+        return
+
+    live = chunks is None
+    usage = {}
+
+    try:
+        if live:
+            acquire_rate_limit()
+            logger.info(f"Streaming from OCR backend with {backend.model} model...")
+            started = time.perf_counter()
+            chunks = backend.stream(
+                build_messages(image, prompt.text),
+                response_format=prompt.response_format,
+                usage=usage
+            )
+
+        for event, data in stream_drivers(chunks, structured=prompt.structured and live):
+            if event == 'done':
+                if live:
+                    log_usage(backend, prompt, started, usage)
+                    store_result(digest, backend.model, prompt.version, data)
+                data = finish(data)
+            yield event, data
+
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse streamed JSON response: {e}")
+        raise Exception(f"Invalid JSON response from OCR: {e}")
+
+    except Exception as e:
+        if is_rate_limit_error(e):
+            logger.warning(f"OCR API rate limit hit: {e}")
+            raise Exception(RATE_LIMIT_MESSAGE)
+        raise
@@ -0,0 +1,205 @@
+"""
+Column-tiled OCR for wide timing sheets.
+
+A sheet with many driver columns is read in one long pass by the model, which
+is both the slowest and the least accurate case. With OCR_TILING_ENABLED the
+table's columns are located with a vertical projection profile (Pillow +
+NumPy), the sheet is cut into tiles of the lap-number column plus
+OCR_TILING_COLUMNS_PER_TILE driver columns, the tiles are read concurrently and
+their drivers are merged back, left to right, into one `{"drivers": [...]}`
+result. Sheets whose grid cannot be found, or that are narrow enough to read
+in one pass, are not tiled.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from PIL import Image, ImageOps, UnidentifiedImageError
+from .image_preprocessing import open_image
+
+logger = logging.getLogger(__name__)
+
+# Grayscale level (0-255) below which a pixel counts as ink
+INK_THRESHOLD = 128
+
+# A pixel column inked over this fraction of the table height is a ruled line
+RULE_FRACTION = 0.6
+
+# A pixel column inked under this fraction of the table height is blank gutter
+GUTTER_FRACTION = 0.01
+
+# Gutters narrower than this fraction of the sheet width are gaps between characters
+MIN_GUTTER_FRACTION = 0.01
+
+# Columns narrower than this fraction of the sheet width are noise
+MIN_COLUMN_FRACTION = 0.02
+
+# Limit for the projection analysis; boundaries are scaled back to full size
+ANALYSIS_MAX_DIMENSION = 1600
+
+
+def _runs(mask) -> List[Tuple[int, int]]:
+    """Return (start, end) of every run of True values, end exclusive."""
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def _trim(ink, axis):
+    """Crop the ink mask along `axis` to the span that carries any ink (drops page margins)."""
+    inked = np.flatnonzero(ink.any(axis=1 - axis))
+    if not len(inked):
+        return ink
+    return np.take(ink, np.arange(inked[0], inked[-1] + 1), axis=axis)
+
+
+def find_bands(ink, axis=0, min_band=MIN_COLUMN_FRACTION, min_gutter=MIN_GUTTER_FRACTION) -> List[Tuple[int, int]]:
+    """
+    Locate the bands of an ink mask: columns for axis=0, rows for axis=1.
+
+    Ruled grid lines are used when the sheet has them; otherwise bands are
+    separated by blank gutters. `min_band` and `min_gutter` are fractions of
+    the mask's extent. Returns (start, end) pixel ranges, empty when no grid
+    is found.
+    """
+    profile = _trim(ink, axis).mean(axis=axis)
+    extent = profile.size
+
+    min_width = extent * min_band
+    min_gap = max(2, extent * min_gutter)
+
+    is_rule = profile > RULE_FRACTION
+    rules = _runs(is_rule)
+    if len(rules) >= 3:
+        # Bands sit between consecutive ruled lines
+        edges = [(start + end) // 2 for start, end in rules]
+    else:
+        gutters = _runs(profile < GUTTER_FRACTION)
+        edges = [
+            (start + end) // 2 for start, end in gutters
+            if 0 < start and end < extent and end - start >= min_gap
+        ]
+
+    # Sheets without an outer border still have content before/after the edges
+    if not edges or edges[0] > min_width:
+        edges.insert(0, 0)
+    if edges[-1] < extent - min_width:
+        edges.append(extent)
+
+    # Keep only bands with content other than the ruled lines themselves
+    content = np.where(is_rule, 0, profile)
+    return [
+        (int(start), int(end))
+        for start, end in zip(edges, edges[1:])
+        if end - start >= min_width and content[start:end].max() >= GUTTER_FRACTION
+    ]
+
+
+def find_columns(img) -> List[Tuple[int, int]]:
+    """Locate the table's columns as (left, right) pixel ranges, see find_bands()."""
+    scale = min(1.0, ANALYSIS_MAX_DIMENSION / max(img.size))
+    sample = img.convert('L')
+    if scale < 1.0:
+        sample = sample.resize((round(img.width * scale), round(img.height * scale)))
+
+    ink = np.asarray(sample) < INK_THRESHOLD
+    return [(round(left / scale), round(right / scale)) for left, right in find_bands(ink, axis=0)]
+
+
+def _open(image):
+    try:
+        return ImageOps.exif_transpose(open_image(image))
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning(f"Could not decode image for tiling: {e}")
+        return None
+
+
+def compose_tile(img, ranges) -> bytes:
+    """Paste the (left, right) column ranges side by side and return a PNG."""
+    strips = [img.crop((left, 0, right, img.height)) for left, right in ranges]
+    tile = Image.new(img.mode, (sum(strip.width for strip in strips), img.height), 'white')
+    x = 0
+    for strip in strips:
+        tile.paste(strip, (x, 0))
+        x += strip.width
+
+    buffer = BytesIO()
+    tile.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def split_into_tiles(image) -> List[bytes]:
+    """
+    Cut a timing sheet into column tiles. Returns the PNG-encoded tiles, or an
+    empty list when the sheet should be read in a single pass.
+    """
+    img = _open(image)
+    if img is None:
+        return []
+
+    columns = find_columns(img)
+    per_tile = settings.OCR_TILING_COLUMNS_PER_TILE
+    driver_columns = columns[1:]
+
+    if len(driver_columns) < settings.OCR_TILING_MIN_DRIVER_COLUMNS or len(driver_columns) <= per_tile:
+        logger.info(f"Tiling skipped: {len(driver_columns)} driver columns detected")
+        return []
+
+    tiles = []
+    for start in range(0, len(driver_columns), per_tile):
+        group = driver_columns[start:start + per_tile]
+        # Lap numbers stay next to the driver columns so rows remain aligned
+        tiles.append(compose_tile(img, [columns[0], (group[0][0], group[-1][1])]))
+
+    logger.info(f"Split sheet into {len(tiles)} tiles ({len(driver_columns)} driver columns, {per_tile} per tile)")
+    return tiles
+
+
+def crop_driver_columns(image, driver_indexes, driver_count):
+    """
+    Crop the lap-number column plus the given drivers' columns into one image.
+
+    Returns None when the detected grid does not have one column per driver,
+    in which case the columns cannot be matched to drivers.
+    """
+    img = _open(image)
+    if img is None:
+        return None
+
+    columns = find_columns(img)
+    if len(columns) != driver_count + 1:
+        logger.info(f"Column crop unavailable: {len(columns)} columns for {driver_count} drivers")
+        return None
+
+    return compose_tile(img, [columns[0]] + [columns[1 + index] for index in driver_indexes])
+
+
+def merge_tile_results(results: List[Dict]) -> Dict:
+    """
+    Concatenate per-tile results, left to right, into a single result. Tiles
+    do not share driver columns, so two drivers with the same name are two
+    drivers.
+    """
+    return {"drivers": [driver for result in results for driver in result.get('drivers') or []]}
+
+
+def _extract_tile(extract, index, tile):
+    try:
+        result = extract(BytesIO(tile))
+        logger.info(f"Tile {index}: {len(result.get('drivers', []))} drivers")
+        return result
+    finally:
+        # The pool only lives for this sheet: close the thread's connection
+        # rather than leave it open until CONN_MAX_AGE
+        connection.close()
+
+
+def extract_tiles(tiles: List[bytes], extract: Callable) -> Dict:
+    """OCR the tiles concurrently with `extract` and merge the results."""
+    workers = min(settings.OCR_TILING_CONCURRENCY, len(tiles))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr-tile') as pool:
+        futures = [pool.submit(_extract_tile, extract, index, tile) for index, tile in enumerate(tiles)]
+        return merge_tile_results([future.result() for future in futures])
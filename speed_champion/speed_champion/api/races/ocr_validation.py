@@ -0,0 +1,140 @@
+"""
+Validation of parsed OCR results.
+
+The most common OCR mistake is a dropped or misread minute digit (0:41.609
+read for 1:41.609), which turns one lap into a wild outlier. Instead of
+re-running the whole sheet, the parsed laps are checked in one vectorized pass:
+
+- robust z-scores of every lap against its driver's median (median absolute
+  deviation, so the outlier itself does not skew the check)
+- the sheet's reported fastest lap: a lap faster than it was misread
+- the sheet's reported average: a gap of about one minute over the driver's
+  lap count points at the fastest or slowest lap
+
+Only the flagged cells are then re-read (see ocr_parser.correct_suspect_laps)
+and the corrections are merged back with apply_corrections().
+"""
+import logging
+from typing import Dict, List
+import numpy as np
+from .timecodec import parse_ms
+
+logger = logging.getLogger(__name__)
+
+# |robust z| above which a lap is an outlier (Iglewicz and Hoaglin)
+Z_THRESHOLD = 3.5
+
+# Scales the MAD to a standard deviation for normally distributed laps
+MAD_SCALE = 0.6745
+
+# Seconds; keeps consistent drivers (MAD ~ 0) from flagging every small wobble
+MAD_FLOOR = 0.25
+
+# Fewer laps than this give no meaningful median
+MIN_LAPS = 4
+
+# Seconds of slack when comparing with the sheet's reported fastest/average lap
+FASTEST_TOLERANCE = 0.0015
+AVERAGE_TOLERANCE = 0.01
+
+
+def _seconds(time_str):
+    ms = parse_ms(time_str)
+    return np.nan if ms is None else ms / 1000
+
+
+def lap_matrix(drivers) -> np.ndarray:
+    """Lap times in seconds, one row per driver, padded with NaN."""
+    width = max((len(driver.get('laps', [])) for driver in drivers), default=0)
+    matrix = np.full((len(drivers), width), np.nan)
+    for row, driver in enumerate(drivers):
+        for column, lap in enumerate(driver.get('laps', [])):
+            matrix[row, column] = _seconds(lap.get('lap_time'))
+    return matrix
+
+
+def find_suspect_laps(result: Dict) -> List[Dict]:
+    """
+    Flag laps that are probably misread. Returns one entry per suspect cell
+    with the driver and lap indexes, name, lap number, time and reason.
+    """
+    drivers = result.get('drivers', [])
+    laps = lap_matrix(drivers)
+    if not laps.size:
+        return []
+
+    counts = np.sum(~np.isnan(laps), axis=1)
+    valid = counts >= MIN_LAPS
+    reasons = {}
+
+    if valid.any():
+        sample = laps[valid]
+        median = np.nanmedian(sample, axis=1, keepdims=True)
+        mad = np.nanmedian(np.abs(sample - median), axis=1, keepdims=True)
+        z = MAD_SCALE * (sample - median) / np.maximum(mad, MAD_FLOOR)
+
+        outliers = np.zeros(laps.shape, dtype=bool)
+        outliers[valid] = np.abs(np.nan_to_num(z)) > Z_THRESHOLD
+        for row, column in zip(*np.nonzero(outliers)):
+            reasons[(row, column)] = 'outlier'
+
+    has_laps = counts > 0
+    fastest = np.array([_seconds(driver.get('fastest_lap')) for driver in drivers])
+    average = np.array([_seconds(driver.get('average_lap')) for driver in drivers])
+    lap_min = np.where(has_laps, np.nanmin(np.where(has_laps[:, None], laps, np.inf), axis=1), np.nan)
+    lap_mean = np.where(has_laps, np.nansum(laps, axis=1) / np.maximum(counts, 1), np.nan)
+
+    # A lap below the sheet's own fastest lap cannot be right
+    with np.errstate(invalid='ignore'):
+        below_fastest = lap_min < fastest - FASTEST_TOLERANCE
+
+        # One lap off by a minute moves the mean by 60 / laps
+        minute_shift = 60 / np.maximum(counts, 1)
+        missing_minute = np.abs((average - lap_mean) - minute_shift) < AVERAGE_TOLERANCE
+        extra_minute = np.abs((lap_mean - average) - minute_shift) < AVERAGE_TOLERANCE
+
+    for row in np.flatnonzero(below_fastest | missing_minute):
+        reasons.setdefault((row, int(np.nanargmin(laps[row]))), 'fastest_lap' if below_fastest[row] else 'average_lap')
+    for row in np.flatnonzero(extra_minute):
+        reasons.setdefault((row, int(np.nanargmax(laps[row]))), 'average_lap')
+
+    suspects = []
+    for (row, column), reason in sorted(reasons.items()):
+        lap = drivers[row]['laps'][column]
+        suspects.append({
+            'driver_index': int(row),
+            'lap_index': int(column),
+            'name': drivers[row].get('name'),
+            'lap_number': lap.get('lap_number', column + 1),
+            'lap_time': lap.get('lap_time'),
+            'reason': reason
+        })
+
+    if suspects:
+        logger.info(f"OCR validation flagged {len(suspects)} suspect laps: {suspects}")
+    return suspects
+
+
+def apply_corrections(result: Dict, suspects: List[Dict], corrections: List[Dict]) -> int:
+    """
+    Merge re-read lap times into the result in place. Only suspect cells are
+    touched and only with times that parse. Returns the number of changed laps.
+    """
+    by_cell = {
+        (str(correction.get('name', '')).strip().lower(), correction.get('lap_number')): correction.get('lap_time')
+        for correction in corrections
+    }
+
+    changed = 0
+    for suspect in suspects:
+        lap_time = by_cell.get((str(suspect['name']).strip().lower(), suspect['lap_number']))
+        if lap_time is None or np.isnan(_seconds(lap_time)):
+            continue
+
+        lap = result['drivers'][suspect['driver_index']]['laps'][suspect['lap_index']]
+        if lap['lap_time'] != lap_time:
+            logger.info(f"Corrected {suspect['name']} lap {suspect['lap_number']}: {lap['lap_time']} -> {lap_time}")
+            lap['lap_time'] = lap_time
+            changed += 1
+
+    return changed
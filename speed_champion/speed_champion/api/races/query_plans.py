@@ -0,0 +1,136 @@
+"""
+Query plan checks for the indexed read paths.
+
+seed() inserts a synthetic season and key_queries() returns the list, detail
+and analytics queries that must stay on indexes, captured from the views
+themselves rather than copied from them. sequential_scans() EXPLAINs one
+read path's queries and returns the tables they read with a full scan. Used
+by the QueryPlanTests test case and the `check_query_plans` management
+command, which run them with the response cache off.
+"""
+import random
+import re
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from speed_champion.api.circuits.models import Circuit
+from speed_champion.api.drivers.models import Driver
+from .models import LapTime, Race, RaceResult
+from .stats import rebuild_stats, refresh_stats_for_race
+
+# Full table scans, per backend. SQLite's "SCAN t USING [COVERING] INDEX" walks
+# an index in order and is not a sequential scan.
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)(?! USING)(?:\s|$)'),
+}
+
+# Tables small enough that scanning them is the right plan at any size
+SCAN_ALLOWED = {Circuit._meta.db_table}
+
+
+def seed(races, drivers, circuits, laps):
+    """Insert a synthetic season with LapTime rows and the stats rollup."""
+    rng = random.Random(0)
+    circuit_rows = Circuit.objects.bulk_create([
+        Circuit(name=f"Plan Circuit {index}", city="Plan", type="indoor") for index in range(circuits)
+    ])
+    driver_rows = Driver.objects.bulk_create([Driver(name=f"Plan Driver {index}") for index in range(drivers)])
+
+    race_rows = Race.objects.bulk_create([
+        Race(circuit=rng.choice(circuit_rows), date=date.today() - timedelta(days=index // 3))
+        for index in range(races)
+    ])
+    results = RaceResult.objects.bulk_create([
+        RaceResult(
+            race=race,
+            driver=driver,
+            circuit_id=race.circuit_id,
+            race_date=race.date,
+            fastest_lap=timedelta(milliseconds=rng.randint(34_000, 40_000)),
+            average_lap=timedelta(milliseconds=rng.randint(36_000, 44_000)),
+            lap_count=laps,
+        )
+        for race in race_rows
+        for driver in rng.sample(driver_rows, min(12, drivers))
+    ], batch_size=1000)
+    LapTime.objects.bulk_create([
+        LapTime(race_result=result, lap_number=number, lap_time=timedelta(milliseconds=rng.randint(34_000, 44_000)))
+        for result in results
+        for number in range(1, laps + 1)
+    ], batch_size=5000)
+    rebuild_stats()
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+    return circuit_rows[0], driver_rows[0], race_rows[len(race_rows) // 2]
+
+
+def _selects(run) -> List[str]:
+    """The SQL of the SELECTs issued by run()."""
+    with CaptureQueriesContext(connection) as captured:
+        run()
+    return [query['sql'] for query in captured.captured_queries if query['sql'].lstrip().upper().startswith('SELECT')]
+
+
+def key_queries(circuit, driver, race) -> Dict[str, List[str]]:
+    """
+    The list, detail and analytics queries that must stay on indexes, by
+    name: each read path is requested through its real view (and the stats
+    refresh run through the save path's helper) and the SELECTs it issued are
+    returned, so the checked queries are the ones production runs.
+    """
+    with override_settings(RESPONSE_CACHE_ENABLED=False, ALLOWED_HOSTS=['testserver']):
+        return _key_queries(Client(), circuit, driver, race)
+
+
+def _get(client, path, params):
+    response = client.get(path, params)
+    if response.status_code != 200:
+        raise AssertionError(f"GET {path} returned {response.status_code}")
+
+
+def _key_queries(client, circuit, driver, race):
+    next_races = client.get('/api/races/').json()['next']
+    next_drivers = client.get('/api/drivers/').json()['next']
+
+    requests = {
+        "race list": ('/api/races/', {}),
+        "race list page": ('/api/races/', {'cursor': next_races}),
+        "race list summary": ('/api/races/', {'include': 'summary'}),
+        "race list by circuit": ('/api/races/', {'circuit': circuit.id}),
+        "race list by driver": ('/api/races/', {'driver': driver.id}),
+        "race detail": (f'/api/races/{race.id}/', {}),
+        "driver list page": ('/api/drivers/', {'cursor': next_drivers}),
+        "driver detail": (f'/api/drivers/{driver.id}/', {}),
+        "driver evolution": (f'/api/drivers/{driver.id}/evolution/', {}),
+        "driver evolution by circuit": (f'/api/drivers/{driver.id}/evolution/', {'circuit': circuit.id}),
+        "driver compare": ('/api/drivers/compare/', {'ids': driver.id}),
+        "circuit detail": (f'/api/circuits/{circuit.id}/', {}),
+        "circuit evolution": (f'/api/circuits/{circuit.id}/evolution/', {}),
+    }
+    queries = {}
+    for name, (path, params) in requests.items():
+        queries[name] = _selects(lambda: _get(client, path, params))
+    queries["stats refresh"] = _selects(lambda: refresh_stats_for_race(race))
+    return queries
+
+
+def explain(sql: str) -> str:
+    """The plan of one captured query."""
+    prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {sql}")
+        return "\n".join(str(row[-1]) for row in cursor.fetchall())
+
+
+def sequential_scans(queries: List[str], plans: Optional[List[str]] = None) -> List[str]:
+    """Tables the queries' plans (EXPLAINed when not given) read with a full scan."""
+    plans = [explain(sql) for sql in queries] if plans is None else plans
+    scanned = set()
+    for plan in plans:
+        scanned.update(SEQ_SCAN_PATTERNS[connection.vendor].findall(plan))
+    return sorted(scanned - SCAN_ALLOWED)
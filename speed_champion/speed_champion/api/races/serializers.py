@@ -1,17 +1,11 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Race, RaceResult, LapTime
+from .drafts import DraftPatchError, get_draft, select_drivers
+from .lapseries import MAX_LAP_NUMBER, serialize_result_laps
+from .models import Race, RaceResult, OCRJob, UploadedSheet
+from .timecodec import format_duration, parse_duration
 from ..circuits.models import Circuit
-
-
-def format_duration(duration):
-    """Format timedelta to M:SS.mmm"""
-    if not duration:
-        return None
-    total_seconds = duration.total_seconds()
-    minutes = int(total_seconds // 60)
-    seconds = int(total_seconds % 60)
-    milliseconds = int((total_seconds % 1) * 1000)
-    return f"{minutes}:{seconds:02d}.{milliseconds:03d}"
+from ..fieldsets import SparseFieldsMixin
 
 
 class OCRUploadSerializer(serializers.Serializer):
@@ -23,10 +17,37 @@ class OCRUploadSerializer(serializers.Serializer):
         return value
 
 
+class OCRBatchUploadSerializer(serializers.Serializer):
+    images = serializers.ListField(child=serializers.ImageField(), allow_empty=False)
+
+    def validate_images(self, value):
+        if len(value) > settings.OCR_BATCH_MAX_IMAGES:
+            raise serializers.ValidationError(
+                f"Too many images. Maximum {settings.OCR_BATCH_MAX_IMAGES} per batch."
+            )
+        for image in value:
+            if image.size > 10 * 1024 * 1024:
+                raise serializers.ValidationError(f"Image {image.name} too large. Maximum 10MB.")
+        return value
+
+
+class OCRJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id', read_only=True)
+
+    class Meta:
+        model = OCRJob
+        fields = ['job_id', 'status', 'result', 'error', 'created_at', 'updated_at']
+
+
 class LapTimeDataSerializer(serializers.Serializer):
-    lap_number = serializers.IntegerField()
+    lap_number = serializers.IntegerField(min_value=1, max_value=MAX_LAP_NUMBER)
     lap_time = serializers.CharField()
 
+    def validate_lap_time(self, value):
+        if parse_duration(value) is None:
+            raise serializers.ValidationError("Invalid lap time. Expected M:SS.mmm.")
+        return value
+
 
 class DriverRaceDataSerializer(serializers.Serializer):
     name = serializers.CharField()
@@ -36,33 +57,85 @@ class DriverRaceDataSerializer(serializers.Serializer):
 
 
 class SaveRaceResultSerializer(serializers.Serializer):
+    """
+    Either `selected_drivers` with the full driver data, or the `draft_token`
+    of an OCR result with the `selected_indexes` of its drivers to keep and a
+    JSON Patch of corrections (see drafts).
+    """
     circuit_id = serializers.IntegerField()
     date = serializers.DateField()
     selected_drivers = serializers.ListField(
         child=serializers.DictField(),
+        required=False,
         help_text="List of driver data to register"
     )
+    draft_token = serializers.UUIDField(required=False)
+    selected_indexes = serializers.ListField(
+        child=serializers.IntegerField(min_value=0),
+        required=False,
+        help_text="Indexes of the draft's drivers to register, after the patch; all when omitted"
+    )
+    patch = serializers.ListField(
+        child=serializers.DictField(),
+        required=False,
+        help_text="JSON Patch (add, remove, replace, test) applied to the draft result"
+    )
+    image_sha256 = serializers.CharField(
+        required=False,
+        allow_null=True,
+        help_text="image_sha256 of the OCR result the drivers were read from"
+    )
 
     def validate_circuit_id(self, value):
         if not Circuit.objects.filter(id=value).exists():
             raise serializers.ValidationError("Circuit does not exist.")
         return value
 
+    def validate_selected_indexes(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("Duplicate indexes.")
+        return value
 
-class LapTimeSerializer(serializers.ModelSerializer):
-    lap_time = serializers.SerializerMethodField()
+    def validate_image_sha256(self, value):
+        if value and not UploadedSheet.objects.filter(sha256=value).exists():
+            raise serializers.ValidationError("Uploaded sheet does not exist.")
+        return value
 
-    class Meta:
-        model = LapTime
-        fields = ['lap_number', 'lap_time']
+    def validate(self, data):
+        token = data.pop('draft_token', None)
+        indexes = data.pop('selected_indexes', None)
+        patch = data.pop('patch', None)
+
+        if token is None:
+            if 'selected_drivers' not in data:
+                raise serializers.ValidationError({"selected_drivers": ["This field is required."]})
+            return data
+
+        draft = get_draft(token)
+        if draft is None:
+            raise serializers.ValidationError({"draft_token": ["Draft does not exist or has expired."]})
 
-    def get_lap_time(self, obj):
-        return format_duration(obj.lap_time)
+        try:
+            selected, changed = select_drivers(draft.result, indexes, patch)
+        except DraftPatchError as e:
+            raise serializers.ValidationError({"patch": [str(e)]})
 
+        # Only the user's corrections need validating; the rest came from OCR
+        for driver in changed:
+            driver_serializer = DriverRaceDataSerializer(data=driver)
+            if not driver_serializer.is_valid():
+                raise serializers.ValidationError({"patch": driver_serializer.errors})
 
-class RaceResultSerializer(serializers.ModelSerializer):
+        data['selected_drivers'] = selected
+        data['draft'] = draft
+        if not data.get('image_sha256'):
+            data['image_sha256'] = draft.sheet_id
+        return data
+
+
+class RaceResultSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     driver_name = serializers.CharField(source='driver.name')
-    laps = LapTimeSerializer(many=True, read_only=True)
+    laps = serializers.SerializerMethodField()
     total_time = serializers.SerializerMethodField()
     fastest_lap = serializers.SerializerMethodField()
     average_lap = serializers.SerializerMethodField()
@@ -71,6 +144,9 @@ class RaceResultSerializer(serializers.ModelSerializer):
         model = RaceResult
         fields = ['driver_name', 'total_time', 'fastest_lap', 'average_lap', 'laps']
 
+    def get_laps(self, obj):
+        return serialize_result_laps(obj)
+
     def get_total_time(self, obj):
         return format_duration(obj.total_time)
 
@@ -81,16 +157,28 @@ class RaceResultSerializer(serializers.ModelSerializer):
         return format_duration(obj.average_lap)
 
 
-class RaceListSerializer(serializers.ModelSerializer):
-    circuit_id = serializers.IntegerField(source='circuit.id')
+class RaceListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    circuit_id = serializers.IntegerField()
     circuit_name = serializers.CharField(source='circuit.name')
+    summary = serializers.SerializerMethodField()
 
     class Meta:
         model = Race
-        fields = ['id', 'date', 'circuit_id', 'circuit_name']
+        fields = ['id', 'date', 'circuit_id', 'circuit_name', 'summary']
+
+    def get_summary(self, obj):
+        """Winner (fastest lap), fastest lap and driver count, from Race.objects.with_summary()."""
+        winner = None
+        if obj.summary_winner_id is not None:
+            winner = {'id': obj.summary_winner_id, 'name': obj.summary_winner_name}
+        return {
+            'winner': winner,
+            'fastest_lap': format_duration(obj.summary_fastest_lap),
+            'driver_count': obj.summary_driver_count,
+        }
 
 
-class RaceDetailSerializer(serializers.ModelSerializer):
+class RaceDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     circuit = serializers.SerializerMethodField()
     results = RaceResultSerializer(many=True, read_only=True)
 
@@ -98,5 +186,10 @@ class RaceDetailSerializer(serializers.ModelSerializer):
         model = Race
         fields = ['id', 'circuit', 'date', 'results']
 
+    def __init__(self, *args, result_fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if result_fields is not None and 'results' in self.fields:
+            self.fields['results'] = RaceResultSerializer(many=True, read_only=True, fields=result_fields)
+
     def get_circuit(self, obj):
-        return obj.circuit.id
+        return obj.circuit_id
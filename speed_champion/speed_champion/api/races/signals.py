@@ -0,0 +1,28 @@
+"""
+Start a new response-cache generation (see api.response_cache) whenever a
+write to race data commits: races and results from the save path and the
+admin, and the drivers and circuits whose names the responses carry.
+
+LapTime is left out on purpose: a receiver on it would make every cascade
+delete load the laps one by one, and laps are only written together with
+their RaceResult or Race, which already bump.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from ..circuits.models import Circuit
+from ..drivers.models import Driver
+from ..response_cache import bump_data_generation
+from .models import Race, RaceResult
+
+
+@receiver(post_save, sender=Race)
+@receiver(post_delete, sender=Race)
+@receiver(post_save, sender=RaceResult)
+@receiver(post_delete, sender=RaceResult)
+@receiver(post_save, sender=Driver)
+@receiver(post_delete, sender=Driver)
+@receiver(post_save, sender=Circuit)
+@receiver(post_delete, sender=Circuit)
+def race_data_changed(sender, **kwargs):
+    transaction.on_commit(bump_data_generation)
@@ -0,0 +1,186 @@
+"""
+Driver x circuit x month statistics rollup.
+
+DriverCircuitMonthStats holds, per (driver, circuit, month), everything the
+analytics endpoints need: race and lap counts, the fastest lap and the sum and
+count of average laps. Cells are recomputed from RaceResult alone, lap counts
+(RaceResult.lap_count) and the circuit and date included, whenever a race
+touching them is written, so reads never have to scan the lap history.
+"""
+import operator
+from datetime import timedelta
+from functools import reduce
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import Coalesce, NullIf, TruncMonth
+from ..response_cache import bump_data_generation
+from .models import DriverCircuitMonthStats, RaceResult
+
+STATS_BATCH_SIZE = 500
+
+STATS_UPDATE_FIELDS = [
+    'race_count',
+    'lap_count',
+    'fastest_lap',
+    'average_lap_sum',
+    'average_lap_count',
+]
+
+
+def month_start(day):
+    """Return the first day of the month containing day."""
+    return day.replace(day=1)
+
+
+def next_month_start(day):
+    """Return the first day of the month after the one containing day."""
+    return (month_start(day) + timedelta(days=32)).replace(day=1)
+
+
+def to_microseconds(duration):
+    """Convert a timedelta to integer microseconds (None counts as zero)."""
+    if not duration:
+        return 0
+    return duration // timedelta(microseconds=1)
+
+
+def average_lap_expression():
+    """Mean of RaceResult.average_lap (in microseconds) over a grouped stats queryset."""
+    return Sum('average_lap_sum') / NullIf(Sum('average_lap_count'), 0)
+
+
+def average_lap_from(microseconds):
+    """Convert the result of average_lap_expression back to a timedelta."""
+    if microseconds is None:
+        return None
+    return timedelta(microseconds=int(microseconds))
+
+
+def stats_cells(results):
+    """Return the (driver_id, circuit_id, month) cells touched by a RaceResult queryset."""
+    return {
+        (driver_id, circuit_id, month_start(day))
+        for driver_id, circuit_id, day in results.values_list(
+            'driver_id', 'circuit_id', 'race_date'
+        )
+    }
+
+
+def _aggregate(results):
+    """Aggregate a RaceResult queryset into unsaved rollup rows keyed by cell."""
+    rows = {}
+
+    grouped = (
+        results
+        .annotate(month=TruncMonth('race_date'))
+        .values('driver_id', 'circuit_id', 'month')
+        .annotate(
+            race_count=Count('id'),
+            lap_count=Sum('lap_count'),
+            fastest_lap=Min('fastest_lap'),
+            average_lap_sum=Sum('average_lap'),
+            average_lap_count=Count('average_lap'),
+        )
+        .order_by()
+    )
+    for row in grouped:
+        key = (row['driver_id'], row['circuit_id'], row['month'])
+        rows[key] = DriverCircuitMonthStats(
+            driver_id=row['driver_id'],
+            circuit_id=row['circuit_id'],
+            month=row['month'],
+            race_count=row['race_count'],
+            lap_count=row['lap_count'] or 0,
+            fastest_lap=row['fastest_lap'],
+            average_lap_sum=to_microseconds(row['average_lap_sum']),
+            average_lap_count=row['average_lap_count'],
+        )
+
+    return rows
+
+
+def refresh_stats(cells):
+    """
+    Recompute the given (driver_id, circuit_id, month) cells from the source tables.
+
+    Cells that no longer have any results are deleted. Call inside the
+    transaction that wrote the races so the rollup never drifts.
+    """
+    cells = set(cells)
+    if not cells:
+        return
+
+    driver_ids = {driver_id for driver_id, _, _ in cells}
+    circuit_ids = {circuit_id for _, circuit_id, _ in cells}
+    months = {month for _, _, month in cells}
+
+    results = RaceResult.objects.filter(
+        driver_id__in=driver_ids,
+        circuit_id__in=circuit_ids,
+        race_date__gte=min(months),
+        race_date__lt=next_month_start(max(months)),
+    )
+    rows = {key: row for key, row in _aggregate(results).items() if key in cells}
+
+    stale = cells - rows.keys()
+    if stale:
+        DriverCircuitMonthStats.objects.filter(reduce(operator.or_, (
+            Q(driver_id=driver_id, circuit_id=circuit_id, month=month)
+            for driver_id, circuit_id, month in stale
+        ))).delete()
+
+    if rows:
+        DriverCircuitMonthStats.objects.bulk_create(
+            rows.values(),
+            update_conflicts=True,
+            unique_fields=['driver', 'circuit', 'month'],
+            update_fields=STATS_UPDATE_FIELDS,
+        )
+
+
+def refresh_stats_for_race(race):
+    """Recompute every rollup cell touched by a race's results."""
+    refresh_stats(stats_cells(RaceResult.objects.filter(race=race)))
+
+
+def rebuild_stats():
+    """Rebuild the whole rollup table from RaceResult. Returns the row count."""
+    with transaction.atomic():
+        DriverCircuitMonthStats.objects.all().delete()
+        rows = _aggregate(RaceResult.objects.all())
+        DriverCircuitMonthStats.objects.bulk_create(rows.values(), batch_size=STATS_BATCH_SIZE)
+        # Bulk writes send no signals, so retire the cached responses here
+        transaction.on_commit(bump_data_generation)
+    return len(rows)
+
+
+def summarize_stats(stats):
+    """Collapse a DriverCircuitMonthStats queryset into totals with one query."""
+    totals = stats.aggregate(
+        total_races=Coalesce(Sum('race_count'), 0),
+        total_laps=Coalesce(Sum('lap_count'), 0),
+        fastest_lap=Min('fastest_lap'),
+        average_lap=average_lap_expression(),
+    )
+    totals['average_lap'] = average_lap_from(totals['average_lap'])
+    return totals
+
+
+def summarize_stats_by_driver(stats):
+    """Like summarize_stats, grouped per driver. Returns a dict keyed by driver id."""
+    rows = (
+        stats
+        .values('driver_id')
+        .annotate(
+            total_races=Sum('race_count'),
+            total_laps=Sum('lap_count'),
+            fastest_lap=Min('fastest_lap'),
+            average_lap=average_lap_expression(),
+        )
+        .order_by()
+    )
+    summary = {}
+    for row in rows:
+        row['average_lap'] = average_lap_from(row['average_lap'])
+        summary[row.pop('driver_id')] = row
+    return summary
@@ -0,0 +1,553 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+from io import BytesIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image, ImageDraw, ImageFont
+from speed_champion.api.circuits.models import Circuit
+from ..response_cache import GENERATION_KEY, start_of_today
+from .image_preprocessing import preprocess_image
+from .ingest import save_race_results
+from .lapseries import STORAGE_PACKED, convert_lap_storage
+from .models import OCRJob
+from .ocr_local import learn_layout, load_sheet
+from .ocr_backends import ImagePayload, ReplayBackend, get_backend
+from .ocr_jobs import is_stale, recover_stale_ocr_jobs, run_ocr_job
+from .ocr_stream import IncrementalDriverParser, stream_drivers, stream_race_data_from_image
+from .query_plans import SEQ_SCAN_PATTERNS, key_queries, seed, sequential_scans
+from .serializers import SaveRaceResultSerializer
+from .stats import rebuild_stats
+
+
+def driver_data(name, laps):
+    return {
+        'name': name,
+        'laps': [{'lap_number': number, 'lap_time': f"0:{40 + number % 5}.{number:03d}"} for number in range(1, laps + 1)],
+    }
+
+
+class QueryCountTests:
+    """
+    The read and save endpoints run a fixed number of queries however many
+    drivers a race has: the subclasses run the same counts with 1 and 50.
+    """
+
+    DRIVERS = None
+    LAPS = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.circuit = Circuit.objects.create(name="Kartodromo", city="Braga", type="outdoor")
+        cls.drivers = [driver_data(f"Driver {index}", laps=cls.LAPS) for index in range(cls.DRIVERS)]
+        cls.races = [
+            save_race_results(cls.circuit, date.today() - timedelta(days=index * 40), cls.drivers)
+            for index in range(5)
+        ]
+
+    def test_leaderboard(self):
+        # One grouped query per ranking window
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/races/leaderboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['overall']['best_average_lap']), self.DRIVERS)
+        # The rollup is monthly, so the window is widened to whole months
+        since = date.fromisoformat(response.json()['last_year_since'])
+        self.assertEqual(since.day, 1)
+        self.assertLessEqual(since, date.today() - timedelta(days=365))
+
+    def test_leaderboard_by_circuit(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/races/leaderboard/', {'circuit': self.circuit.id})
+        self.assertEqual(response.status_code, 200)
+
+    def test_race_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/races/')
+        self.assertEqual(len(response.json()['results']), 5)
+
+    def test_race_list_with_summary(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/races/', {'include': 'summary'})
+        self.assertEqual(response.json()['results'][0]['summary']['driver_count'], self.DRIVERS)
+
+    def test_race_list_by_driver(self):
+        driver_id = self.races[0].results.first().driver_id
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/races/', {'driver': driver_id})
+        self.assertEqual(len(response.json()['results']), 5)
+
+    def test_race_detail(self):
+        # Race, results with their drivers, then every result's laps
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/races/{self.races[0].id}/')
+        results = response.json()['results']
+        self.assertEqual([len(result['laps']) for result in results], [self.LAPS] * self.DRIVERS)
+
+    def test_race_detail_without_laps(self):
+        # Race, then results with their drivers
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/races/{self.races[0].id}/', {'fields': 'id,results.driver_name'})
+        self.assertEqual(response.json()['results'][0], {'driver_name': 'Driver 0'})
+
+    def test_race_detail_fields_with_laps(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                f'/api/races/{self.races[0].id}/', {'fields': 'id,results.driver_name', 'include': 'laps'}
+            )
+        self.assertEqual(len(response.json()['results'][0]['laps']), self.LAPS)
+
+    def test_save_results(self):
+        # Validation, the bulk inserts, the rollup refresh and the 201 body;
+        # none of them is per driver
+        with self.assertNumQueries(16):
+            response = self.client.post('/api/races/save-results/', {
+                'circuit_id': self.circuit.id,
+                'date': date.today().isoformat(),
+                'selected_drivers': self.drivers,
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['results']), self.DRIVERS)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class OneDriverQueryCountTests(QueryCountTests, TestCase):
+    DRIVERS = 1
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class FiftyDriversQueryCountTests(QueryCountTests, TestCase):
+    DRIVERS = 50
+
+
+class SaveRaceResultsTests(TestCase):
+
+    def test_sheet_pruned_after_validation(self):
+        circuit = Circuit.objects.create(name="Kartodromo", city="Braga", type="outdoor")
+        # As if prune_uploads removed the sheet between validation and the save
+        with mock.patch.object(SaveRaceResultSerializer, 'validate_image_sha256', lambda self, value: value):
+            response = self.client.post('/api/races/save-results/', {
+                'circuit_id': circuit.id,
+                'date': date.today().isoformat(),
+                'selected_drivers': [driver_data("Driver 0", laps=3)],
+                'image_sha256': '0' * 64,
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image_sha256', response.json())
+
+
+class ConditionalGetTests(TestCase):
+    """The leaderboard's window moves with the date, so it is modified at midnight too."""
+
+    def setUp(self):
+        # Last write two days ago
+        self.written = start_of_today() - 2 * 24 * 3600
+        cache.set(GENERATION_KEY, ('generation', self.written), timeout=None)
+        self.addCleanup(cache.delete, GENERATION_KEY)
+
+    def test_leaderboard_is_modified_at_midnight(self):
+        response = self.client.get('/api/races/leaderboard/', HTTP_IF_MODIFIED_SINCE=http_date(self.written))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Last-Modified'], http_date(start_of_today()))
+
+        response = self.client.get('/api/races/leaderboard/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_race_list_is_modified_at_last_write(self):
+        response = self.client.get('/api/races/', HTTP_IF_MODIFIED_SINCE=http_date(self.written))
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_race_is_not_answered_with_304(self):
+        response = self.client.get('/api/races/99999/', HTTP_IF_MODIFIED_SINCE=http_date(self.written))
+        self.assertEqual(response.status_code, 404)
+
+
+class RebuildInvalidationTests(TestCase):
+    """Bulk rebuilds send no model signals, so they retire the cached responses themselves."""
+
+    def test_rebuild_stats_invalidates_cached_leaderboard(self):
+        circuit = Circuit.objects.create(name="Kartodromo", city="Braga", type="outdoor")
+        with self.captureOnCommitCallbacks(execute=True):
+            save_race_results(circuit, date.today(), [driver_data("Driver 0", laps=3)])
+
+        response = self.client.get('/api/races/leaderboard/')
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertEqual(self.client.get('/api/races/leaderboard/')['X-Cache'], 'hit')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild_stats()
+
+        retry = self.client.get('/api/races/leaderboard/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['X-Cache'], 'miss')
+
+    def test_convert_lap_storage_invalidates_cached_race(self):
+        circuit = Circuit.objects.create(name="Kartodromo", city="Braga", type="outdoor")
+        with self.captureOnCommitCallbacks(execute=True):
+            race = save_race_results(circuit, date.today(), [driver_data("Driver 0", laps=3)])
+
+        response = self.client.get(f'/api/races/{race.id}/')
+        self.assertEqual(self.client.get(f'/api/races/{race.id}/')['X-Cache'], 'hit')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(convert_lap_storage(STORAGE_PACKED), 1)
+
+        retry = self.client.get(f'/api/races/{race.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json()['results'][0]['laps'], response.json()['results'][0]['laps'])
+
+
+REPLY = {
+    'drivers': [
+        {'name': "Driver 0", 'laps': [{'lap_number': 1, 'lap_time': "0:41.123"}, {'lap_number': 2, 'lap_time': "0:40.987"}]},
+        {'name': "Driver \"1\"", 'laps': [{'lap_number': 1, 'lap_time': "0:42.500"}]},
+    ]
+}
+
+
+def sheet_upload(name='sheet.png'):
+    """A small PNG upload; the replay backend answers for it whatever it shows."""
+    buffer = BytesIO()
+    Image.new('RGB', (64, 48), 'white').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class OCRTestCase(TestCase):
+    """
+    Runs OCR on the replay backend with `reply` as its only recording, jobs
+    inline ('eager'), and uploads stored in a temporary MEDIA_ROOT.
+    """
+
+    reply = json.dumps(REPLY)
+
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        responses_dir = Path(media_root) / 'replies'
+        responses_dir.mkdir()
+        (responses_dir / 'reply.txt').write_text(self.reply)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=media_root,
+            OCR_BACKEND={'NAME': 'replay', 'OPTIONS': {'RESPONSES_DIR': str(responses_dir)}},
+            OCR_JOB_EXECUTOR='eager',
+            OCR_CACHE_ENABLED=False,
+            OCR_LOCAL_ENABLED=False,
+            OCR_TILING_ENABLED=False,
+            OCR_VALIDATION_ENABLED=False,
+            OCR_RATE_LIMIT_PER_SECOND=0,
+        ))
+
+
+class OCRJobTests(OCRTestCase):
+
+    def submit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/races/ocr-jobs/', {'image': sheet_upload()})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], OCRJob.STATUS_PENDING)
+        return response.json()['job_id']
+
+    def poll(self, job_id):
+        response = self.client.get(f'/api/races/ocr-jobs/{job_id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def expire(self, job_id, **fields):
+        """Move a job's lease into the past, as if its process died."""
+        expired = timezone.now() - timedelta(seconds=settings.OCR_JOB_LEASE_SECONDS + 1)
+        OCRJob.objects.filter(id=job_id).update(updated_at=expired, **fields)
+
+    def test_done(self):
+        job = self.poll(self.submit())
+        self.assertEqual(job['status'], OCRJob.STATUS_DONE)
+        self.assertEqual([driver['name'] for driver in job['result']['drivers']], ["Driver 0", 'Driver "1"'])
+        self.assertIn('draft_token', job['result'])
+        self.assertEqual(OCRJob.objects.get(id=job['job_id']).attempts, 1)
+
+    def test_not_found(self):
+        response = self.client.get('/api/races/ocr-jobs/00000000-0000-0000-0000-000000000000/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_claimed_once(self):
+        job_id = self.submit()
+        self.assertIsNone(run_ocr_job(job_id))
+        self.assertEqual(OCRJob.objects.get(id=job_id).attempts, 1)
+
+    @override_settings(OCR_JOB_EXECUTOR='worker')
+    def test_stale_running_job_is_requeued(self):
+        job_id = self.submit()
+        self.assertTrue(OCRJob.objects.filter(id=job_id, status=OCRJob.STATUS_PENDING).exists())
+        self.expire(job_id, status=OCRJob.STATUS_RUNNING, attempts=1)
+        self.assertTrue(is_stale(OCRJob.objects.get(id=job_id)))
+
+        # Polling the stale job recovers it; the worker then runs it again
+        self.assertEqual(self.poll(job_id)['status'], OCRJob.STATUS_PENDING)
+        run_ocr_job(job_id)
+        job = self.poll(job_id)
+        self.assertEqual(job['status'], OCRJob.STATUS_DONE)
+        self.assertEqual(OCRJob.objects.get(id=job_id).attempts, 2)
+
+    @override_settings(OCR_JOB_EXECUTOR='worker')
+    def test_stale_job_out_of_attempts_fails(self):
+        job_id = self.submit()
+        self.expire(job_id, status=OCRJob.STATUS_RUNNING, attempts=settings.OCR_JOB_MAX_ATTEMPTS)
+
+        job = self.poll(job_id)
+        self.assertEqual(job['status'], OCRJob.STATUS_FAILED)
+        self.assertEqual(job['error'], "OCR job was interrupted too many times.")
+
+    @override_settings(OCR_JOB_EXECUTOR='worker')
+    def test_live_lease_is_left_alone(self):
+        job_id = self.submit()
+        OCRJob.objects.filter(id=job_id).update(status=OCRJob.STATUS_RUNNING, attempts=1)
+        self.assertFalse(is_stale(OCRJob.objects.get(id=job_id)))
+        self.assertEqual(recover_stale_ocr_jobs(), [])
+        self.assertEqual(self.poll(job_id)['status'], OCRJob.STATUS_RUNNING)
+
+
+class FailedOCRJobTests(OCRTestCase):
+    reply = '{"drivers": [{"name": "Driver 0", "laps": ['
+
+    def test_failed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job_id = self.client.post('/api/races/ocr-jobs/', {'image': sheet_upload()}).json()['job_id']
+        job = self.client.get(f'/api/races/ocr-jobs/{job_id}/').json()
+        self.assertEqual(job['status'], OCRJob.STATUS_FAILED)
+        self.assertIn("Invalid JSON response from OCR", job['error'])
+        self.assertIsNone(job['result'])
+
+
+class UndecodableImageTests(TestCase):
+    """Images Pillow cannot decode go to the OCR API as-is under their real MIME type."""
+
+    def assertPassedThrough(self, head, mime_type):
+        data = head + b'\0' * 32
+        with self.assertLogs('speed_champion.api.races.image_preprocessing', 'WARNING'):
+            self.assertEqual(preprocess_image(data), (data, mime_type))
+
+    def test_truncated_png(self):
+        self.assertPassedThrough(b'\x89PNG\r\n\x1a\n', 'image/png')
+
+    def test_heic(self):
+        self.assertPassedThrough(b'\0\0\0\x18ftypheic', 'image/heif')
+
+    def test_file_path(self):
+        with tempfile.NamedTemporaryFile(suffix='.png') as f:
+            f.write(b'\x89PNG\r\n\x1a\n' + b'\0' * 32)
+            f.flush()
+            with self.assertLogs('speed_champion.api.races.image_preprocessing', 'WARNING'):
+                self.assertEqual(preprocess_image(Path(f.name))[1], 'image/png')
+
+    def test_unknown_signature(self):
+        self.assertPassedThrough(b'not an image', 'image/jpeg')
+
+
+def render_sheet(rows, column_width=400, row_height=62, advance=32):
+    """A ruled timing sheet with one glyph every `advance` pixels, as PNG bytes."""
+    font = ImageFont.load_default(size=52)
+    width, height = len(rows[0]) * column_width, len(rows) * row_height
+    img = Image.new('L', (width + 20, height + 20), 'white')
+    draw = ImageDraw.Draw(img)
+    for row, cells in enumerate(rows):
+        for column, text in enumerate(cells):
+            for index, char in enumerate(text):
+                draw.text((22 + column * column_width + index * advance, 12 + row * row_height), char, font=font, fill=0)
+    for x in range(10, width + 11, column_width):
+        draw.line([(x, 10), (x, height + 10)], fill=0, width=2)
+    for y in range(10, height + 11, row_height):
+        draw.line([(10, y), (width + 10, y)], fill=0, width=2)
+    buffer = BytesIO()
+    img.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class SheetLayoutTests(TestCase):
+    """A learned layout reads its header row by position, digits included."""
+
+    def test_header_with_digits(self):
+        times = [['1:02.345', '1:03.456'], ['1:01.987', '1:00.123'], ['0:59.876', '1:04.210']]
+        sheet = render_sheet([['Lap', 'Kart 12', 'Kart 7']] + [[str(lap)] + row for lap, row in enumerate(times, start=1)])
+        result = {"drivers": [
+            {"name": name, "laps": [{"lap_number": lap, "lap_time": row[column]} for lap, row in enumerate(times, start=1)]}
+            for column, name in enumerate(['Kart 12', 'Kart 7'])
+        ]}
+        layout = learn_layout('test', [(sheet, result)], {'summary_rows': []})
+
+        drivers = layout.read(load_sheet(sheet))['drivers']
+        self.assertEqual([driver['name'] for driver in drivers], ['Kart 12', 'Kart 7'])
+        self.assertEqual([driver['laps'] for driver in drivers], [driver['laps'] for driver in result['drivers']])
+
+
+class IncrementalDriverParserTests(TestCase):
+    """Drivers come out of any chunking of the reply, as soon as each one is closed."""
+
+    # Braces, brackets, quotes and backslashes inside strings must not be read as structure
+    drivers = [
+        {'name': 'Driver {0}', 'laps': [{'lap_number': 1, 'lap_time': "0:41.123"}]},
+        {'name': 'Driver "[1]" \\ }', 'laps': []},
+        {'name': 'Driver \u00e9', 'laps': [{'lap_number': 1, 'lap_time': "0:40.100"}, {'lap_number': 2, 'lap_time': "0:40.200"}]},
+    ]
+    reply = json.dumps({'drivers': drivers})
+
+    def feed(self, chunks):
+        parser = IncrementalDriverParser()
+        return [driver for chunk in chunks for driver in parser.feed(chunk)]
+
+    def test_one_chunk(self):
+        self.assertEqual(self.feed([self.reply]), self.drivers)
+
+    def test_every_split(self):
+        for split in range(1, len(self.reply)):
+            with self.subTest(split=split, at=self.reply[split - 1:split + 1]):
+                self.assertEqual(self.feed([self.reply[:split], self.reply[split:]]), self.drivers)
+
+    def test_one_character_chunks(self):
+        self.assertEqual(self.feed(list(self.reply)), self.drivers)
+
+    def test_driver_emitted_on_its_closing_brace(self):
+        parser = IncrementalDriverParser()
+        end = self.reply.index('}]}') + 3  # up to the first driver's closing brace
+        self.assertEqual(parser.feed(self.reply[:end - 1]), [])
+        self.assertEqual(parser.feed(self.reply[end - 1:end]), self.drivers[:1])
+
+    def test_free_text_around_the_reply(self):
+        events = list(stream_drivers(["Here you go:\n", self.reply[:30], self.reply[30:], "\nDone."]))
+        self.assertEqual([data for event, data in events if event == 'driver'], self.drivers)
+        self.assertEqual(events[-1], ('done', {'drivers': self.drivers}))
+
+    def test_malformed_driver_is_skipped(self):
+        reply = '{"drivers": [{"name": "A", "laps": [1 2]}, {"name": "B", "laps": []}]}'
+        self.assertEqual(self.feed([reply]), [{'name': 'B', 'laps': []}])
+
+    def test_truncated_stream_fails_when_done(self):
+        events = stream_drivers([self.reply[:-20]])
+        self.assertEqual([next(events), next(events)], [('driver', driver) for driver in self.drivers[:2]])
+        with self.assertRaises(json.JSONDecodeError):
+            list(events)
+
+
+class StreamUploadTests(OCRTestCase):
+
+    def events(self, response):
+        """Split an SSE body into (event, data) pairs, checking the framing."""
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.endswith('\n\n'))
+        events = []
+        for frame in body[:-2].split('\n\n'):
+            event, data = frame.split('\n')
+            self.assertTrue(event.startswith('event: ') and data.startswith('data: '))
+            events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+        return events
+
+    def test_sse_framing(self):
+        response = self.client.post('/api/races/upload-image/stream/', {'image': sheet_upload()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+        events = self.events(response)
+        self.assertEqual([event for event, _ in events], ['driver', 'driver', 'done'])
+        self.assertEqual([data for _, data in events[:2]], REPLY['drivers'])
+        self.assertEqual(events[-1][1]['drivers'], REPLY['drivers'])
+        self.assertIn('draft_token', events[-1][1])
+
+    def test_fake_chunks(self):
+        reply = json.dumps(REPLY)
+        chunks = (reply[start:start + 7] for start in range(0, len(reply), 7))
+        events = list(stream_race_data_from_image(sheet_upload(), chunks=chunks))
+        self.assertEqual([data for event, data in events if event == 'driver'], REPLY['drivers'])
+
+    def test_malformed_stream_sends_error_event(self):
+        chunks = iter(['{"drivers": [{"name": "Driver 0", "laps": []}, {"na'])
+        with mock.patch('speed_champion.api.races.views.stream_race_data_from_image',
+                        lambda image: stream_race_data_from_image(image, chunks=chunks)):
+            response = self.client.post('/api/races/upload-image/stream/', {'image': sheet_upload()})
+            events = self.events(response)
+
+        self.assertEqual([event for event, _ in events], ['driver', 'error'])
+        self.assertIn("Invalid JSON response from OCR", events[-1][1]['error'])
+
+
+# Loads the app and every URLconf and admin module, then lists the heavy imports it pulled in
+STARTUP_IMPORTS_SCRIPT = """
+import sys
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print('loaded:', *(name for name in ('numpy', 'PIL', 'pillow_heif', 'mistralai') if name in sys.modules))
+"""
+
+
+class OCRBackendTests(TestCase):
+
+    def messages(self, image):
+        return [{'role': 'user', 'content': [
+            {'type': 'text', 'text': "prompt"},
+            {'type': 'image_url', 'image_url': ImagePayload(image, 'image/png')},
+        ]}]
+
+    def test_replay_resolved_lazily_once(self):
+        with override_settings(OCR_BACKEND={'NAME': 'replay', 'OPTIONS': {}}):
+            backend = get_backend()
+            self.assertIsInstance(backend, ReplayBackend)
+            self.assertIs(get_backend(), backend)
+        with override_settings(OCR_BACKEND={'NAME': 'speed_champion.api.races.ocr_backends.ReplayBackend'}):
+            self.assertIsNot(get_backend(), backend)
+
+    def test_unknown_backend_rejected(self):
+        for name in ('bogus', 'speed_champion.api.races.ocr_backends.NoSuchBackend', 'no_such_module.Backend'):
+            with self.subTest(name), override_settings(OCR_BACKEND={'NAME': name, 'OPTIONS': {}}):
+                with self.assertRaises(ImproperlyConfigured):
+                    get_backend()
+
+    def test_replay_recording_lookup(self):
+        responses_dir = self.enterContext(tempfile.TemporaryDirectory())
+        sheet = b'sheet'
+        recorded = ImagePayload(sheet, 'image/png').digest()
+        Path(responses_dir, f'{recorded}.json').write_text('{"drivers": ["recorded"]}')
+        Path(responses_dir, 'other.txt').write_text('{"drivers": ["other"]}')
+        Path(responses_dir, 'notes.md').write_text('not a recording')
+        backend = ReplayBackend({'RESPONSES_DIR': responses_dir})
+
+        # The recording named after the image wins; others are picked by hash, always the same
+        self.assertEqual(backend.complete(self.messages(sheet)), '{"drivers": ["recorded"]}')
+        picked = backend.complete(self.messages(b'another sheet'))
+        self.assertIn(picked, ['{"drivers": ["recorded"]}', '{"drivers": ["other"]}'])
+        self.assertEqual(backend.complete(self.messages(b'another sheet')), picked)
+        self.assertEqual(''.join(backend.stream(self.messages(sheet))), '{"drivers": ["recorded"]}')
+
+        self.assertEqual(json.loads(ReplayBackend({}).complete(self.messages(sheet))), {'drivers': []})
+
+    def test_image_libraries_stay_out_of_startup(self):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_IMPORTS_SCRIPT],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(output.strip().splitlines()[-1], 'loaded:')
+
+
+@skipUnless(connection.vendor in SEQ_SCAN_PATTERNS, "no sequential scan pattern for this database")
+class QueryPlanTests(TestCase):
+    """The list, detail and analytics queries stay on indexes (see query_plans)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.circuit, cls.driver, cls.race = seed(races=300, drivers=100, circuits=10, laps=3)
+
+    def test_key_queries_use_indexes(self):
+        for name, queries in key_queries(self.circuit, self.driver, self.race).items():
+            with self.subTest(name):
+                self.assertTrue(queries)
+                self.assertEqual(sequential_scans(queries), [])
+
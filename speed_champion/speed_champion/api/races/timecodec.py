@@ -0,0 +1,87 @@
+"""
+Lap time codec shared by every module.
+
+Times are handled as integer milliseconds, so parsing and formatting are
+exact: timedelta(seconds=36.776) formats as '0:36.776', never '0:36.775' as
+float total_seconds() arithmetic could give. Strings are 'M:SS.mmm'. A shorter
+fraction is a decimal fraction ('0:36.7' is 36.700 s) and a longer one is
+truncated to milliseconds. The batch variants format or parse whole lists in
+one call, for serializers that emit many laps.
+"""
+import re
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+TIME_PATTERN = re.compile(r'(\d+):(\d+)\.(\d+)')
+
+ONE_MS = timedelta(milliseconds=1)
+
+
+def duration_to_ms(duration: Optional[timedelta]) -> Optional[int]:
+    """Whole milliseconds of a timedelta (truncated), or None."""
+    if duration is None:
+        return None
+    return duration // ONE_MS
+
+
+def ms_to_duration(ms: Optional[int]) -> Optional[timedelta]:
+    """Timedelta of a number of milliseconds, or None."""
+    if ms is None:
+        return None
+    return timedelta(milliseconds=ms)
+
+
+def format_ms(ms: Optional[int]) -> Optional[str]:
+    """Format milliseconds as M:SS.mmm."""
+    if ms is None:
+        return None
+    seconds, milliseconds = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    return '%d:%02d.%03d' % (minutes, seconds, milliseconds)
+
+
+def format_duration(duration: Optional[timedelta]) -> Optional[str]:
+    """Format a timedelta as M:SS.mmm."""
+    if duration is None:
+        return None
+    return format_ms(duration // ONE_MS)
+
+
+def parse_ms(time_str) -> Optional[int]:
+    """Parse a time string such as '0:36.776' into milliseconds, or None."""
+    if not isinstance(time_str, str):
+        return None
+    match = TIME_PATTERN.match(time_str.strip().replace(' ', ''))
+    if not match:
+        return None
+    minutes, seconds, fraction = match.groups()
+    return (int(minutes) * 60 + int(seconds)) * 1000 + int(fraction[:3].ljust(3, '0'))
+
+
+def parse_duration(time_str) -> Optional[timedelta]:
+    """Parse a time string such as '0:36.776' into a timedelta, or None."""
+    return ms_to_duration(parse_ms(time_str))
+
+
+def format_ms_batch(values: Iterable[Optional[int]]) -> List[Optional[str]]:
+    """Format a list of milliseconds (None stays None), without a call per value."""
+    formatted = []
+    append = formatted.append
+    for ms in values:
+        if ms is None:
+            append(None)
+            continue
+        seconds, milliseconds = divmod(ms, 1000)
+        minutes, seconds = divmod(seconds, 60)
+        append('%d:%02d.%03d' % (minutes, seconds, milliseconds))
+    return formatted
+
+
+def format_duration_batch(durations: Iterable[Optional[timedelta]]) -> List[Optional[str]]:
+    """Format a list of timedeltas (None stays None)."""
+    return format_ms_batch(None if duration is None else duration // ONE_MS for duration in durations)
+
+
+def parse_ms_batch(time_strs: Iterable) -> List[Optional[int]]:
+    """Parse a list of time strings into milliseconds (None where unreadable)."""
+    return [parse_ms(time_str) for time_str in time_strs]
@@ -0,0 +1,118 @@
+"""
+Content-addressed storage for uploaded timing sheets.
+
+Uploads are streamed chunk by chunk to MEDIA_ROOT/sheets/<aa>/<sha256><ext>,
+hashing as they are written, so a 10 MB photo is never held in memory as one
+bytes object. The same sheet uploaded twice is stored once. The OCR pipeline
+works from the stored file, and saving a race can reference it by its hash
+(Race.sheet). Sheets no race, queued OCR job or live draft refers to are
+pruned OCR_UPLOAD_RETENTION_DAYS after they were last uploaded.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from .drafts import live_drafts
+from .models import OCRJob, UploadedSheet
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = 'sheets'
+
+# Read size when the upload is a plain file object without chunks()
+CHUNK_SIZE = 64 * 1024
+
+
+def _chunks(image_file):
+    if hasattr(image_file, 'chunks'):
+        yield from image_file.chunks()
+        return
+    while chunk := image_file.read(CHUNK_SIZE):
+        yield chunk
+
+
+def store_upload(image_file) -> UploadedSheet:
+    """
+    Stream an uploaded image to content-addressed storage and return its
+    UploadedSheet, creating the row only for content not seen before.
+    """
+    upload_dir = Path(settings.MEDIA_ROOT) / UPLOAD_DIR
+    upload_dir.mkdir(parents=True, exist_ok=True)
+
+    image_file.seek(0)
+    sha256 = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=upload_dir, suffix='.part', delete=False) as temp:
+        try:
+            for chunk in _chunks(image_file):
+                sha256.update(chunk)
+                temp.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            os.unlink(temp.name)
+            raise
+    digest = sha256.hexdigest()
+
+    sheet = UploadedSheet.objects.filter(sha256=digest).first()
+    if sheet is not None:
+        # Uploading a sheet again restarts its retention period
+        sheet.created_at = timezone.now()
+        UploadedSheet.objects.filter(pk=sheet.pk).update(created_at=sheet.created_at)
+
+    if sheet is not None and os.path.exists(sheet.file.path):
+        os.unlink(temp.name)
+        logger.info(f"Upload {digest[:12]} already stored ({size / 1024:.1f} KB)")
+        return sheet
+
+    extension = Path(getattr(image_file, 'name', '') or '').suffix.lower()
+    name = f"{UPLOAD_DIR}/{digest[:2]}/{digest}{extension}"
+    path = Path(settings.MEDIA_ROOT) / name
+    path.parent.mkdir(exist_ok=True)
+    os.replace(temp.name, path)
+
+    if sheet is not None:
+        # The row outlived its file (e.g. a restored database): point it at the new copy
+        sheet.file.name = name
+        sheet.save(update_fields=['file'])
+        return sheet
+
+    try:
+        sheet = UploadedSheet.objects.create(sha256=digest, file=name, size=size)
+    except IntegrityError:
+        # A concurrent upload of the same sheet won; both wrote identical bytes
+        return UploadedSheet.objects.get(sha256=digest)
+
+    logger.info(f"Stored upload {digest[:12]} ({size / 1024:.1f} KB) as {name}")
+    prune_uploads()
+    return sheet
+
+
+def prune_uploads():
+    """
+    Delete sheets last uploaded over OCR_UPLOAD_RETENTION_DAYS ago that no
+    race refers to and that no pending or running OCR job or live draft
+    still needs.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.OCR_UPLOAD_RETENTION_DAYS)
+    queued_images = OCRJob.objects.filter(
+        status__in=[OCRJob.STATUS_PENDING, OCRJob.STATUS_RUNNING]
+    ).values('image')
+    stale = (
+        UploadedSheet.objects.filter(created_at__lt=cutoff, races__isnull=True)
+        .exclude(file__in=queued_images)
+        .exclude(sha256__in=live_drafts().filter(sheet__isnull=False).values('sheet_id'))
+    )
+
+    pruned = 0
+    for sheet in stale:
+        sheet.file.delete(save=False)
+        sheet.delete()
+        pruned += 1
+
+    if pruned:
+        logger.info(f"Pruned {pruned} unreferenced uploads")
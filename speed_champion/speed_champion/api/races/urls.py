@@ -6,5 +6,9 @@ urlpatterns = [
     path('leaderboard/', views.LeaderboardView.as_view(), name='leaderboard'),
     path('<int:race_id>/', views.RaceDetailView.as_view(), name='race-detail'),
     path('upload-image/', views.UploadRaceImageView.as_view(), name='upload-race-image'),
+    path('upload-image/stream/', views.StreamUploadRaceImageView.as_view(), name='stream-upload-race-image'),
+    path('upload-images/', views.BatchUploadRaceImagesView.as_view(), name='batch-upload-race-images'),
     path('save-results/', views.SaveRaceResultsView.as_view(), name='save-race-results'),
+    path('ocr-jobs/', views.CreateOCRJobView.as_view(), name='create-ocr-job'),
+    path('ocr-jobs/<uuid:job_id>/', views.OCRJobDetailView.as_view(), name='ocr-job-detail'),
 ]
@@ -1,32 +1,42 @@
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.db.models import Min, Avg
-from datetime import datetime, timedelta
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from datetime import date, datetime, timedelta
+import json
 import logging
 from .serializers import (
     OCRUploadSerializer,
+    OCRBatchUploadSerializer,
+    OCRJobSerializer,
     SaveRaceResultSerializer,
     RaceListSerializer,
-    RaceDetailSerializer
+    RaceDetailSerializer,
+    RaceResultSerializer
 )
-from .ocr_parser import extract_race_data_from_image, parse_time_to_duration
-from .models import Race, RaceResult, LapTime
-from ..drivers.models import Driver
+from .ocr_parser import extract_race_data_from_image
+from .ocr_jobs import is_stale, recover_stale_ocr_jobs, submit_ocr_job
+from .ocr_batch import extract_race_data_from_images
+from .ocr_stream import stream_race_data_from_image
+from .drafts import lock_draft
+from .ingest import save_race_results
+from .leaderboard import build_leaderboard
+from .models import Race, OCRJob, UploadedSheet
 from ..circuits.models import Circuit
+from ..fieldsets import FieldsetError, parse_fields, parse_include
+from ..pagination import PaginationError, keyset_page
+from ..response_cache import LONG_CACHE_CONTROL, SHORT_CACHE_CONTROL, STATS_CACHE_CONTROL, cached_response
 
 logger = logging.getLogger(__name__)
 
 
-def format_duration(duration):
-    """Format timedelta to M:SS.mmm"""
-    if not duration:
-        return None
-    total_seconds = duration.total_seconds()
-    minutes = int(total_seconds // 60)
-    seconds = int(total_seconds % 60)
-    milliseconds = int((total_seconds % 1) * 1000)
-    return f"{minutes}:{seconds:02d}.{milliseconds:03d}"
+def race_cache_control(data):
+    """Past races are edge-cacheable for long; today's may still be corrected."""
+    race_date = (data or {}).get('date')  # absent when left out with ?fields=
+    if race_date and race_date < date.today().isoformat():
+        return LONG_CACHE_CONTROL
+    return SHORT_CACHE_CONTROL
 
 
 class UploadRaceImageView(APIView):
@@ -45,7 +55,7 @@ class UploadRaceImageView(APIView):
         logger.info(f"Image received: name={image.name}, size={image.size} bytes")
 
         try:
-            logger.info("Starting OCR extraction with Mistral...")
+            logger.info("Starting OCR extraction...")
             result = extract_race_data_from_image(image)
 
             driver_count = len(result.get('drivers', []))
@@ -65,11 +75,129 @@ class UploadRaceImageView(APIView):
             )
 
 
+def sse_event(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class StreamUploadRaceImageView(APIView):
+    """Upload race result image and stream each driver over SSE as OCR reads it."""
+
+    def post(self, request):
+        logger.info("=== OCR Stream Upload Started ===")
+
+        serializer = OCRUploadSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            logger.error(f"Validation failed: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        image = serializer.validated_data['image']
+        logger.info(f"Image received: name={image.name}, size={image.size} bytes")
+
+        def events():
+            try:
+                for event, data in stream_race_data_from_image(image):
+                    yield sse_event(event, data)
+                logger.info("=== OCR Stream Upload Completed Successfully ===")
+            except Exception as e:
+                logger.error(f"OCR streaming failed: {str(e)}", exc_info=True)
+                yield sse_event('error', {"error": f"OCR extraction failed: {str(e)}"})
+
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Disable Nginx buffering
+        return response
+
+
+class BatchUploadRaceImagesView(APIView):
+    """Upload several race result images and extract them concurrently via OCR."""
+
+    def post(self, request):
+        logger.info("=== OCR Batch Upload Started ===")
+
+        serializer = OCRBatchUploadSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            logger.error(f"Validation failed: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        images = serializer.validated_data['images']
+        logger.info(f"Batch received: {len(images)} images")
+
+        results = extract_race_data_from_images(images)
+        failed = sum(1 for entry in results if entry['status'] == 'failed')
+
+        logger.info(f"=== OCR Batch Upload Completed: {len(results) - failed} ok, {failed} failed ===")
+        return Response({
+            "results": results,
+            "succeeded": len(results) - failed,
+            "failed": failed
+        }, status=status.HTTP_200_OK)
+
+
+class CreateOCRJobView(APIView):
+    """Upload race result image and queue OCR extraction; returns a job to poll."""
+
+    def post(self, request):
+        serializer = OCRUploadSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            logger.error(f"Validation failed: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        image = serializer.validated_data['image']
+        logger.info(f"Image received for OCR job: name={image.name}, size={image.size} bytes")
+
+        job = submit_ocr_job(image)
+
+        return Response(OCRJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class OCRJobDetailView(APIView):
+    """Get OCR job status and, once done, the parsed result."""
+
+    def get(self, request, job_id):
+        try:
+            job = OCRJob.objects.get(id=job_id)
+        except OCRJob.DoesNotExist:
+            return Response(
+                {"error": "OCR job not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        # Don't let a client poll a job that a restart left behind forever
+        if is_stale(job):
+            recover_stale_ocr_jobs()
+            job.refresh_from_db()
+
+        return Response(OCRJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
 class ListRacesView(APIView):
-    """List all races, optionally filter by circuit or driver."""
+    """
+    List races newest first, one keyset page at a time, optionally filter by
+    circuit or driver. `?include=summary` adds each race's winner, fastest lap
+    and driver count, `?fields=` picks the fields returned.
+    """
 
+    @cached_response
     def get(self, request):
+        try:
+            requested, _ = parse_fields(request.query_params, RaceListSerializer.Meta.fields)
+            include = parse_include(request.query_params, ['summary'])
+        except FieldsetError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The summary costs three subqueries per race, so it is only computed when asked for
+        fields = requested if requested is not None else set(RaceListSerializer.Meta.fields) - {'summary'}
+        fields |= include
+
         races = Race.objects.all()
+        if 'circuit_name' in fields:
+            races = races.select_related('circuit')
+        if 'summary' in fields:
+            races = races.with_summary()
 
         # Filter by circuit if provided
         circuit_id = request.query_params.get('circuit')
@@ -95,24 +223,56 @@ class ListRacesView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-        races = races.order_by('-date')
-        serializer = RaceListSerializer(races, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        try:
+            page = keyset_page(
+                races,
+                request.query_params,
+                ordering=('-date', '-id'),
+                serialize=lambda rows: RaceListSerializer(rows, many=True, fields=fields).data
+            )
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(page, status=status.HTTP_200_OK)
 
 
 class RaceDetailView(APIView):
-    """Get race details with results."""
+    """
+    Get race details with results and their lap times. `?fields=` picks the
+    race and `results.*` fields; leaving out `results.laps` skips reading them.
+    """
 
+    @cached_response(cache_control=race_cache_control)
     def get(self, request, race_id):
         try:
-            race = Race.objects.get(id=race_id)
+            requested, nested = parse_fields(
+                request.query_params,
+                RaceDetailSerializer.Meta.fields,
+                {'results': RaceResultSerializer.Meta.fields}
+            )
+            include = parse_include(request.query_params, ['laps'])
+        except FieldsetError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Laps are returned by default; include=laps only adds them to a ?fields= selection
+        result_fields = nested['results']
+        if result_fields is not None:
+            result_fields |= include
+        if requested is not None and include:
+            requested.add('results')
+
+        races = Race.objects.all()
+        if requested is None or 'results' in requested:
+            races = races.with_results(laps=result_fields is None or 'laps' in result_fields)
+        try:
+            race = races.get(id=race_id)
         except Race.DoesNotExist:
             return Response(
                 {"error": "Race not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        serializer = RaceDetailSerializer(race)
+        serializer = RaceDetailSerializer(race, fields=requested, result_fields=result_fields)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -131,88 +291,36 @@ class SaveRaceResultsView(APIView):
         circuit = Circuit.objects.get(id=serializer.validated_data['circuit_id'])
         date = serializer.validated_data['date']
         selected_drivers = serializer.validated_data['selected_drivers']
+        image_sha256 = serializer.validated_data.get('image_sha256')
+        sheet = UploadedSheet.objects.filter(sha256=image_sha256).first() if image_sha256 else None
+        if image_sha256 and sheet is None:
+            # Pruned since validation (see uploads.prune_uploads)
+            return Response(
+                {"image_sha256": ["Uploaded sheet does not exist."]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         logger.info(f"Creating race: circuit={circuit.name}, date={date}, drivers={len(selected_drivers)}")
 
-        race = Race.objects.create(circuit=circuit, date=date)
-        logger.info(f"Race created with ID={race.id}")
-
-        for idx, driver_data in enumerate(selected_drivers, 1):
-            driver_name = driver_data.get('name')
-            logger.info(f"Processing driver {idx}/{len(selected_drivers)}: {driver_name}")
-
-            driver, created = Driver.objects.get_or_create(name=driver_name)
-            if created:
-                logger.info(f"  Created new driver: {driver_name}")
-            else:
-                logger.info(f"  Using existing driver: {driver_name}")
-
-            # Parse lap times and calculate statistics
-            from datetime import timedelta
-            laps_data = driver_data.get('laps', [])
-            logger.info(f"  Processing {len(laps_data)} laps")
-
-            # Debug: Log first lap structure
-            if laps_data:
-                logger.info(f"  First lap structure: {laps_data[0]}")
-
-            # Collect all lap durations
-            lap_durations = []
-            total_time = timedelta(0)
-
-            for lap in laps_data:
-                # Handle both 'lap_time' and 'time' keys for backwards compatibility
-                lap_time_str = lap.get('lap_time') or lap.get('time')
-                if not lap_time_str:
-                    logger.warning(f"  Lap missing time field: {lap}")
-                    continue
-
-                lap_duration = parse_time_to_duration(lap_time_str)
-                if lap_duration:
-                    lap_durations.append(lap_duration)
-                    total_time += lap_duration
-
-            # Calculate fastest and average lap from actual lap times (NOT from OCR)
-            fastest_lap = min(lap_durations) if lap_durations else None
-            average_lap = total_time / len(lap_durations) if lap_durations else None
-
-            logger.info(f"  Total laps: {len(lap_durations)}")
-            logger.info(f"  Total time: {format_duration(total_time) if total_time.total_seconds() > 0 else 'N/A'}")
-            logger.info(f"  Fastest lap (calculated): {format_duration(fastest_lap)}")
-            logger.info(f"  Average lap (calculated): {format_duration(average_lap)}")
-
-            # Create race result with calculated values
-            race_result = RaceResult.objects.create(
-                race=race,
-                driver=driver,
-                total_time=total_time if total_time.total_seconds() > 0 else None,
-                fastest_lap=fastest_lap,
-                average_lap=average_lap
-            )
-            logger.info(f"  Race result created with ID={race_result.id}")
-
-            # Save individual lap times
-            lap_count = 0
-            for lap_data in laps_data:
-                # Handle both 'lap_time' and 'time' keys for backwards compatibility
-                lap_time_str = lap_data.get('lap_time') or lap_data.get('time')
-                if not lap_time_str:
-                    logger.warning(f"  Skipping lap without time: {lap_data}")
-                    continue
-
-                lap_time = parse_time_to_duration(lap_time_str)
-                if lap_time:
-                    LapTime.objects.create(
-                        race_result=race_result,
-                        lap_number=lap_data.get('lap_number', lap_count + 1),
-                        lap_time=lap_time
-                    )
-                    lap_count += 1
-
-            logger.info(f"  Saved {lap_count} lap times")
+        draft = serializer.validated_data.get('draft')
+        with transaction.atomic():
+            # A draft is saved once: hold its lock until the race is saved and
+            # the draft deleted, so a concurrent save of the token finds it gone
+            if draft is not None and lock_draft(draft.token) is None:
+                return Response(
+                    {"draft_token": ["Draft does not exist or has expired."]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            race = save_race_results(circuit, date, selected_drivers, sheet=sheet)
+
+            if draft is not None:
+                draft.delete()
 
         logger.info(f"=== Save Race Results Completed Successfully: Race ID={race.id} ===")
 
+        race = Race.objects.with_results().get(id=race.id)
+
         return Response(
             RaceDetailSerializer(race).data,
             status=status.HTTP_201_CREATED
@@ -222,85 +330,20 @@ class SaveRaceResultsView(APIView):
 class LeaderboardView(APIView):
     """Get leaderboard with best average and fastest lap (overall and last year). Optional filter by circuit."""
 
+    @cached_response(cache_control=STATS_CACHE_CONTROL, date_keyed=True)
     def get(self, request):
         # Optional circuit filter
         circuit_id = request.query_params.get('circuit')
+        try:
+            circuit_id = int(circuit_id) if circuit_id else None
+        except ValueError:
+            circuit_id = None
 
-        drivers = Driver.objects.all()
-
-        # Overall rankings
-        best_avg_overall = []
-        fastest_lap_overall = []
-
-        # Last year rankings
         one_year_ago = datetime.now().date() - timedelta(days=365)
-        best_avg_last_year = []
-        fastest_lap_last_year = []
-
-        for driver in drivers:
-            all_results = RaceResult.objects.filter(driver=driver)
-
-            # Apply circuit filter if provided
-            if circuit_id:
-                try:
-                    circuit_id_int = int(circuit_id)
-                    all_results = all_results.filter(race__circuit_id=circuit_id_int)
-                except ValueError:
-                    pass
-
-            if all_results.exists():
-                # Overall stats
-                avg_overall = all_results.aggregate(Avg('average_lap'))['average_lap__avg']
-                fastest_overall = all_results.aggregate(Min('fastest_lap'))['fastest_lap__min']
-
-                if avg_overall:
-                    best_avg_overall.append({
-                        "driver_id": driver.id,
-                        "driver_name": driver.name,
-                        "average_lap": format_duration(avg_overall)
-                    })
-
-                if fastest_overall:
-                    fastest_lap_overall.append({
-                        "driver_id": driver.id,
-                        "driver_name": driver.name,
-                        "fastest_lap": format_duration(fastest_overall)
-                    })
-
-                # Last year stats
-                last_year_results = all_results.filter(race__date__gte=one_year_ago)
-
-                if last_year_results.exists():
-                    avg_last_year = last_year_results.aggregate(Avg('average_lap'))['average_lap__avg']
-                    fastest_last_year = last_year_results.aggregate(Min('fastest_lap'))['fastest_lap__min']
-
-                    if avg_last_year:
-                        best_avg_last_year.append({
-                            "driver_id": driver.id,
-                            "driver_name": driver.name,
-                            "average_lap": format_duration(avg_last_year)
-                        })
-
-                    if fastest_last_year:
-                        fastest_lap_last_year.append({
-                            "driver_id": driver.id,
-                            "driver_name": driver.name,
-                            "fastest_lap": format_duration(fastest_last_year)
-                        })
-
-        # Sort by time (lower is better)
-        best_avg_overall.sort(key=lambda x: x['average_lap'] if x['average_lap'] else 'Z')
-        fastest_lap_overall.sort(key=lambda x: x['fastest_lap'] if x['fastest_lap'] else 'Z')
-        best_avg_last_year.sort(key=lambda x: x['average_lap'] if x['average_lap'] else 'Z')
-        fastest_lap_last_year.sort(key=lambda x: x['fastest_lap'] if x['fastest_lap'] else 'Z')
 
-        return Response({
-            "overall": {
-                "best_average_lap": best_avg_overall,
-                "fastest_lap": fastest_lap_overall
-            },
-            "last_year": {
-                "best_average_lap": best_avg_last_year,
-                "fastest_lap": fastest_lap_last_year
-            }
-        }, status=status.HTTP_200_OK)
+        leaderboard = build_leaderboard(
+            circuit_id=circuit_id,
+            last_year_since=one_year_ago
+        )
+
+        return Response(leaderboard, status=status.HTTP_200_OK)
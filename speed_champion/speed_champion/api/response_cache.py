@@ -0,0 +1,148 @@
+"""
+Response cache and conditional GET for the public read endpoints.
+
+Race data only changes when results are saved or an admin edits a race,
+driver or circuit, so GET responses are cached under a key made of the path,
+the sorted query parameters, the date and the current data generation. Every
+committed write replaces the generation (see races.signals), which orphans all
+cached responses at once: invalidation is one cache write, and a response
+computed before a write can only ever be stored under the generation it
+started with.
+
+The generation is a fresh random token rather than an incremented counter,
+so two writes bumping at once can never land on the same value. It also
+records when it was started, i.e. the time of the latest race write.
+
+The same key gives the response's strong ETag (with the negotiated media type
+added) and the generation's start its Last-Modified. A matching If-None-Match
+or If-Modified-Since is answered with a 304 straight from the cached body,
+without a query; when nothing is cached the view runs first, so only a
+resource that exists is ever answered with a 304. Views whose data depends on
+the date (the leaderboard's last-year window) are also modified at midnight,
+so their Last-Modified is never earlier than the start of today.
+
+Cache-Control is set per endpoint so Cloudflare can serve repeat traffic from
+the edge.
+"""
+import functools
+import hashlib
+import logging
+import time
+import uuid
+from datetime import date
+from typing import Tuple
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'response-cache:data-generation'
+
+# Browsers revalidate every time (a cheap 304), the CDN keeps a copy for a minute
+SHORT_CACHE_CONTROL = {'public': True, 'max_age': 0, 'must_revalidate': True, 's_maxage': 60}
+
+# Aggregates where a few minutes at the edge are acceptable
+STATS_CACHE_CONTROL = {'public': True, 'max_age': 0, 'must_revalidate': True, 's_maxage': 300}
+
+# Data that practically never changes again, e.g. a past race's results
+LONG_CACHE_CONTROL = {'public': True, 'max_age': 3600, 's_maxage': 7 * 24 * 3600}
+
+
+def data_generation() -> Tuple[str, int]:
+    """The current data generation and the Unix time it started, created on first use."""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, (uuid.uuid4().hex, int(time.time())), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_data_generation():
+    """Start a new data generation, invalidating every cached response and ETag."""
+    previous = cache.get(GENERATION_KEY)
+    started = int(time.time())
+    if previous is not None:
+        # Last-Modified has one-second resolution: two writes within a second
+        # must still give the later generation a later date
+        started = max(started, previous[1] + 1)
+    cache.set(GENERATION_KEY, (uuid.uuid4().hex, started), timeout=None)
+    logger.debug("Response cache generation bumped")
+
+
+def response_key(request, generation) -> str:
+    query = '&'.join(f"{key}={value}" for key, value in sorted(request.query_params.lists()))
+    digest = hashlib.sha256(f"{request.path}?{query}".encode()).hexdigest()
+    # Today's date is part of the key as the leaderboard's last-year window moves with it
+    return f"response-cache:{generation}:{date.today().isoformat()}:{digest}"
+
+
+def start_of_today() -> int:
+    """Unix time of local midnight, when the date in the response key changes."""
+    return int(time.mktime(date.today().timetuple()))
+
+
+def response_etag(request, key) -> str:
+    """Strong ETag of a response: its cache key and the negotiated media type."""
+    media_type = getattr(request, 'accepted_media_type', '')
+    return '"%s"' % hashlib.sha256(f"{key}|{media_type}".encode()).hexdigest()[:32]
+
+
+def _set_headers(response, etag, last_modified, policy):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, **policy)
+    return response
+
+
+def cached_response(get=None, *, cache_control=SHORT_CACHE_CONTROL, date_keyed=False):
+    """
+    Cache the data of an APIView.get() method's 200 responses until the next
+    data generation, and answer conditional GETs with 304.
+
+    cache_control is a dict of Cache-Control directives, or a callable that
+    picks them from the response data (e.g. by the race's date). date_keyed
+    marks views whose data changes with today's date.
+    """
+    if get is None:
+        return functools.partial(cached_response, cache_control=cache_control, date_keyed=date_keyed)
+
+    def policy_for(data):
+        return cache_control(data) if callable(cache_control) else cache_control
+
+    @functools.wraps(get)
+    def wrapper(self, request, *args, **kwargs):
+        # Read the generation before computing, so a write committed meanwhile
+        # leaves this response under an already retired key
+        generation, last_modified = data_generation()
+        if date_keyed:
+            # Yesterday's response is stale even when no race was written since
+            last_modified = max(last_modified, start_of_today())
+        key = response_key(request, generation)
+        etag = response_etag(request, key)
+        entry = cache.get(key) if settings.RESPONSE_CACHE_ENABLED else None
+
+        if entry is not None:
+            data, policy = entry
+            response = Response(data, status=status.HTTP_200_OK)
+            response['X-Cache'] = 'hit'
+        else:
+            # Without a cached body only the view knows whether the resource
+            # exists; errors are never answered with a 304
+            response = get(self, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+            policy = policy_for(response.data)
+            if settings.RESPONSE_CACHE_ENABLED:
+                cache.set(key, (response.data, policy), timeout=settings.RESPONSE_CACHE_TIMEOUT)
+                response['X-Cache'] = 'miss'
+
+        if get_conditional_response(request, etag=etag, last_modified=last_modified) is not None:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        return _set_headers(response, etag, last_modified, policy)
+
+    return wrapper
@@ -99,6 +99,93 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Media files (user uploads, e.g. timing sheets queued for OCR)
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = '/media/'
+
+# Lap storage for new results: 'rows' (one LapTime row per lap) or 'packed'
+# (a lap series on the RaceResult, see lapseries). Existing results are moved
+# with `manage.py convert_lap_storage`.
+LAP_STORAGE = os.getenv('LAP_STORAGE', 'rows')
+
+# Cache for public read responses (see api.response_cache). Entries are keyed
+# by a data generation replaced on every committed race write, so they are
+# never served stale; the timeout only bounds memory.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'speed-champion',
+    }
+}
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_TIMEOUT = 600
+
+# Keyset pagination of the race and driver lists (see api.pagination)
+PAGINATION_DEFAULT_LIMIT = 20
+PAGINATION_MAX_LIMIT = 100
+
+# OCR backend: 'mistral' or 'replay' (offline recorded replies, see ocr_backends)
+OCR_BACKEND = {
+    'NAME': os.getenv('OCR_BACKEND', 'mistral'),
+    'OPTIONS': {
+        'MODEL': 'pixtral-12b-2409',
+        'RESPONSES_DIR': os.getenv('OCR_REPLAY_DIR'),
+        'LATENCY': float(os.getenv('OCR_REPLAY_LATENCY', '0')),
+    },
+}
+
+# OCR prompt version (see ocr_prompts): '2' is the compact structured-output prompt
+OCR_PROMPT_VERSION = os.getenv('OCR_PROMPT_VERSION', '2')
+
+# OCR jobs
+# 'thread': bounded in-process pool, 'worker': run `manage.py run_ocr_worker`,
+# 'eager': run inline (tests)
+OCR_JOB_EXECUTOR = os.getenv('OCR_JOB_EXECUTOR', 'thread')
+OCR_JOB_WORKERS = int(os.getenv('OCR_JOB_WORKERS', '1'))
+OCR_JOB_EXTRACTOR = 'speed_champion.api.races.ocr_parser.extract_race_data_from_image'
+# A job left pending or running this long lost its process (restart, deploy):
+# it is re-queued, or failed after OCR_JOB_MAX_ATTEMPTS claims
+OCR_JOB_LEASE_SECONDS = 600
+OCR_JOB_MAX_ATTEMPTS = 2
+
+# OCR result cache (keyed by image SHA-256, model and prompt version)
+OCR_CACHE_ENABLED = True
+OCR_CACHE_MAX_ENTRIES = 500
+OCR_CACHE_TTL_DAYS = 30
+
+# Uploaded timing sheets (content-addressed under MEDIA_ROOT/sheets, see uploads)
+OCR_UPLOAD_RETENTION_DAYS = 30  # unused sheets are pruned this long after their last upload
+
+# OCR results kept server-side for save-results (see drafts)
+OCR_DRAFT_TTL_HOURS = 24
+
+# OCR image preprocessing (downscale + recompress before upload to the model)
+OCR_IMAGE_MAX_DIMENSION = 2048
+OCR_IMAGE_FORMAT = 'JPEG'  # 'JPEG' or 'WEBP'
+OCR_IMAGE_QUALITY = 85
+OCR_IMAGE_GRAYSCALE = True
+
+# OCR concurrency and provider rate limiting (token bucket shared per process)
+OCR_BATCH_CONCURRENCY = int(os.getenv('OCR_BATCH_CONCURRENCY', '4'))
+OCR_BATCH_MAX_IMAGES = 10
+OCR_RATE_LIMIT_PER_SECOND = float(os.getenv('OCR_RATE_LIMIT_PER_SECOND', '1'))  # 0 turns rate limiting off
+OCR_RATE_LIMIT_BURST = int(os.getenv('OCR_RATE_LIMIT_BURST', '4'))
+OCR_RATE_LIMIT_TIMEOUT = 60  # seconds to wait for a token before giving up
+
+# Local template-matching OCR for registered sheet layouts (manage.py register_sheet_layout)
+OCR_LOCAL_ENABLED = True
+OCR_LOCAL_LAYOUTS_DIR = os.getenv('OCR_LOCAL_LAYOUTS_DIR', BASE_DIR / 'ocr_layouts')
+
+# Re-read laps that fail validation (see ocr_validation) with one small follow-up call
+OCR_VALIDATION_ENABLED = True
+OCR_VALIDATION_MAX_SUSPECTS = 8
+
+# Column-tiled OCR for wide sheets (see ocr_tiling)
+OCR_TILING_ENABLED = os.getenv('OCR_TILING_ENABLED', 'False') == 'True'
+OCR_TILING_MIN_DRIVER_COLUMNS = 6  # narrower sheets are read in one pass
+OCR_TILING_COLUMNS_PER_TILE = 3
+OCR_TILING_CONCURRENCY = int(os.getenv('OCR_TILING_CONCURRENCY', '4'))
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -126,7 +213,7 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
 ]
-CORS_EXPOSE_HEADERS = ['Content-Type', 'X-CSRFToken']
+CORS_EXPOSE_HEADERS = ['Content-Type', 'X-CSRFToken', 'ETag', 'Last-Modified']
 CORS_PREFLIGHT_MAX_AGE = 86400  # Cache preflight for 24h
 
 # Logging configuration
@@ -52,6 +52,15 @@ DATABASES = {
     }
 }
 
+# Cache - shared by the gunicorn workers, so a write in one worker retires the
+# responses cached by the other (a per-process LocMemCache would not)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', '/tmp/speed_champion_cache'),
+    }
+}
+
 # CORS - Only allow specific trusted frontend origins
 # NEVER use CORS_ALLOW_ALL_ORIGINS in production
 CORS_ALLOWED_ORIGINS = [